@@ -0,0 +1,24 @@
+"""crawl state ingestion day
+
+Revision ID: 1b6e3d9a5c8
+Revises: 8d5b1f4a2e7
+Create Date: 2015-03-11 10:04:12.318554
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '1b6e3d9a5c8'
+down_revision = '8d5b1f4a2e7'
+
+from alembic import op
+import sqlalchemy as sa
+
+
+def upgrade():
+    op.add_column(
+        'crawl_state', sa.Column('ingested', sa.Date(), nullable=True)
+    )
+
+
+def downgrade():
+    op.drop_column('crawl_state', 'ingested')
@@ -0,0 +1,52 @@
+"""unique finance record per user and month
+
+Revision ID: 1f6a2c8e93d
+Revises: 3993b50e8bc
+Create Date: 2015-02-16 11:20:31.512043
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '1f6a2c8e93d'
+down_revision = '3993b50e8bc'
+
+from alembic import op
+import sqlalchemy as sa
+
+
+finance = sa.table(
+    'finance',
+    sa.column('id', sa.Integer),
+    sa.column('user_name', sa.String),
+    sa.column('month', sa.Integer),
+    sa.column('year', sa.Integer),
+    sa.column('did_user_pay', sa.Boolean),
+)
+
+
+def upgrade():
+    # keep newest record of every duplicate, paid if any duplicate was paid
+    newest = sa.select([sa.func.max(finance.c.id)]).group_by(
+        finance.c.user_name,
+        finance.c.year,
+        finance.c.month,
+    )
+    paid = newest.having(
+        sa.func.max(sa.case([(finance.c.did_user_pay, 1)], else_=0)) == 1
+    )
+    op.execute(
+        finance.update().where(
+            finance.c.id.in_(paid)
+        ).values(did_user_pay=True)
+    )
+    op.execute(finance.delete().where(~finance.c.id.in_(newest)))
+    op.create_index(
+        'ix_finance_user_year_month',
+        'finance',
+        ['user_name', 'year', 'month'],
+        unique=True,
+    )
+
+
+def downgrade():
+    op.drop_index('ix_finance_user_year_month', 'finance')
@@ -0,0 +1,62 @@
+"""menu materialized per day
+
+Revision ID: 2c94f1d7b6e
+Revises: 4b7d0e5a2c1
+Create Date: 2015-02-18 14:41:06.118264
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '2c94f1d7b6e'
+down_revision = '4b7d0e5a2c1'
+
+from datetime import datetime, timedelta
+
+from alembic import op
+import sqlalchemy as sa
+
+
+food = sa.table(
+    'food',
+    sa.column('id', sa.Integer),
+    sa.column('date_available_from', sa.DateTime),
+    sa.column('date_available_to', sa.DateTime),
+)
+
+
+def upgrade():
+    menu_day = op.create_table(
+        'menu_day',
+        sa.Column('day', sa.Date(), nullable=False),
+        sa.Column('food_id', sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(['food_id'], ['food.id']),
+        sa.PrimaryKeyConstraint('day', 'food_id'),
+    )
+    connection = op.get_bind()
+    foods = connection.execute(
+        sa.select([
+            food.c.id,
+            food.c.date_available_from,
+            food.c.date_available_to,
+        ]).where(
+            sa.and_(
+                food.c.date_available_from.isnot(None),
+                food.c.date_available_to.isnot(None),
+            )
+        )
+    )
+    for food_id, date_from, date_to in foods.fetchall():
+        if isinstance(date_from, datetime):
+            date_from = date_from.date()
+        if isinstance(date_to, datetime):
+            date_to = date_to.date()
+        rows = []
+        while date_from <= date_to:
+            rows.append({'day': date_from, 'food_id': food_id})
+            date_from += timedelta(days=1)
+        if rows:
+            op.bulk_insert(menu_day, rows)
+
+
+def downgrade():
+    op.drop_table('menu_day')
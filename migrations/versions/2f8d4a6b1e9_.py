@@ -0,0 +1,43 @@
+"""costs in grosze
+
+Revision ID: 2f8d4a6b1e9
+Revises: 9e4b7c1a5f3
+Create Date: 2015-02-27 09:48:13.502117
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '2f8d4a6b1e9'
+down_revision = '9e4b7c1a5f3'
+
+from alembic import op
+import sqlalchemy as sa
+
+TABLES = ('order', 'food')
+
+
+def upgrade():
+    for table in TABLES:
+        cost = sa.table(table, sa.column('cost', sa.Float)).c.cost
+        op.execute(
+            sa.update(cost.table).values(cost=sa.func.round(cost * 100))
+        )
+        with op.batch_alter_table(table) as batch_op:
+            batch_op.alter_column(
+                'cost',
+                existing_type=sa.Float(),
+                type_=sa.Integer(),
+                postgresql_using='cost::integer',
+            )
+
+
+def downgrade():
+    for table in TABLES:
+        with op.batch_alter_table(table) as batch_op:
+            batch_op.alter_column(
+                'cost',
+                existing_type=sa.Integer(),
+                type_=sa.Float(),
+            )
+        cost = sa.table(table, sa.column('cost', sa.Float)).c.cost
+        op.execute(sa.update(cost.table).values(cost=cost / 100.0))
@@ -0,0 +1,128 @@
+"""order items
+
+Revision ID: 3a9c1f5e7d2
+Revises: 649ccc6dc58
+Create Date: 2015-02-25 10:04:37.281946
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '3a9c1f5e7d2'
+down_revision = '649ccc6dc58'
+
+from alembic import op
+import sqlalchemy as sa
+
+# frozen copies of orders.RANDOM_ORDER_MARKER, normalize_dish and
+# order_lines, so later changes of runtime code do not change this
+# migration
+RANDOM_ORDER_MARKER = '!RANDOM ORDER!'
+BATCH_SIZE = 1000
+
+order = sa.table(
+    'order',
+    sa.column('id', sa.Integer),
+    sa.column('description', sa.String),
+    sa.column('company', sa.String),
+    sa.column('order_day', sa.Date),
+)
+food = sa.table(
+    'food',
+    sa.column('id', sa.Integer),
+    sa.column('description', sa.String),
+    sa.column('company', sa.String),
+)
+menu_day = sa.table(
+    'menu_day',
+    sa.column('day', sa.Date),
+    sa.column('food_id', sa.Integer),
+)
+
+
+def normalize_dish(text):
+    return (text or '').strip()
+
+
+def order_lines(description):
+    lines = [
+        normalize_dish(line)
+        for line in (description or '').replace('\r', '').split('\n')
+    ]
+    dishes = [line for line in lines if line and line != RANDOM_ORDER_MARKER]
+    return dishes, RANDOM_ORDER_MARKER in lines
+
+
+def menu_foods(connection, days):
+    if not days:
+        return {}
+    query = sa.select([
+        menu_day.c.day,
+        food.c.company,
+        food.c.description,
+        food.c.id,
+    ]).select_from(
+        menu_day.join(food, food.c.id == menu_day.c.food_id)
+    ).where(menu_day.c.day.in_(days)).order_by(food.c.id)
+    return {
+        (day, company, normalize_dish(description)): food_id
+        for day, company, description, food_id in connection.execute(query)
+    }
+
+
+def upgrade():
+    order_item = op.create_table(
+        'order_item',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('order_id', sa.Integer(), nullable=False),
+        sa.Column('position', sa.Integer(), nullable=True),
+        sa.Column('food_id', sa.Integer(), nullable=True),
+        sa.Column('description', sa.String(length=800), nullable=True),
+        sa.Column('random', sa.Boolean(), nullable=True),
+        sa.ForeignKeyConstraint(['food_id'], ['food.id']),
+        sa.ForeignKeyConstraint(['order_id'], ['order.id']),
+        sa.PrimaryKeyConstraint('id'),
+    )
+    op.create_index(
+        'ix_order_item_order_id', 'order_item', ['order_id'], unique=False,
+    )
+    op.create_index(
+        'ix_order_item_food_id', 'order_item', ['food_id'], unique=False,
+    )
+    connection = op.get_bind()
+    last_id = 0
+    while True:
+        orders = connection.execute(
+            sa.select([
+                order.c.id,
+                order.c.description,
+                order.c.company,
+                order.c.order_day,
+            ]).where(order.c.id > last_id).order_by(order.c.id)
+            .limit(BATCH_SIZE)
+        ).fetchall()
+        if not orders:
+            break
+        last_id = orders[-1].id
+        foods = menu_foods(
+            connection,
+            {row.order_day for row in orders if row.order_day is not None},
+        )
+        rows = []
+        for order_id, description, company, order_day in orders:
+            dishes, random = order_lines(description)
+            for position, dish in enumerate(dishes):
+                rows.append({
+                    'order_id': order_id,
+                    'position': position,
+                    'food_id': foods.get((order_day, company, dish)),
+                    'description': dish,
+                    'random': random,
+                })
+        if rows:
+            op.bulk_insert(order_item, rows)
+
+
+def downgrade():
+    op.drop_index('ix_order_item_food_id', table_name='order_item')
+    op.drop_index('ix_order_item_order_id', table_name='order_item')
+    op.drop_table('order_item')
@@ -0,0 +1,37 @@
+"""crawl state and food availability index
+
+Revision ID: 4773fd17a53
+Revises: ff02a7f99f9
+Create Date: 2015-02-20 09:37:12.604133
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '4773fd17a53'
+down_revision = 'ff02a7f99f9'
+
+from alembic import op
+import sqlalchemy as sa
+
+
+def upgrade():
+    op.create_table(
+        'crawl_state',
+        sa.Column('source', sa.String(length=50), nullable=False),
+        sa.Column('etag', sa.String(length=200), nullable=True),
+        sa.Column('last_modified', sa.String(length=100), nullable=True),
+        sa.Column('content_hash', sa.String(length=64), nullable=True),
+        sa.Column('checked', sa.DateTime(), nullable=True),
+        sa.Column('changed', sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint('source'),
+    )
+    op.create_index(
+        'ix_food_company_available', 'food',
+        ['company', 'date_available_from', 'date_available_to'],
+        unique=False,
+    )
+
+
+def downgrade():
+    op.drop_index('ix_food_company_available', table_name='food')
+    op.drop_table('crawl_state')
@@ -0,0 +1,44 @@
+"""order day column with range indexes
+
+Revision ID: 4b7d0e5a2c1
+Revises: 1f6a2c8e93d
+Create Date: 2015-02-17 09:05:12.331870
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '4b7d0e5a2c1'
+down_revision = '1f6a2c8e93d'
+
+from alembic import op
+import sqlalchemy as sa
+
+
+order = sa.table(
+    'order',
+    sa.column('date', sa.DateTime),
+    sa.column('order_day', sa.Date),
+)
+
+
+def upgrade():
+    op.add_column('order', sa.Column('order_day', sa.Date(), nullable=True))
+    op.execute(order.update().values(order_day=sa.func.date(order.c.date)))
+    op.create_index('ix_order_order_day', 'order', ['order_day'])
+    op.create_index(
+        'ix_order_user_name_order_day',
+        'order',
+        ['user_name', 'order_day'],
+    )
+    op.create_index(
+        'ix_order_order_day_company',
+        'order',
+        ['order_day', 'company'],
+    )
+
+
+def downgrade():
+    op.drop_index('ix_order_order_day_company', 'order')
+    op.drop_index('ix_order_user_name_order_day', 'order')
+    op.drop_index('ix_order_order_day', 'order')
+    op.drop_column('order', 'order_day')
@@ -0,0 +1,30 @@
+"""finance user month index
+
+Revision ID: 4e1a7c9d3b5
+Revises: 9b3f6d2c8e4
+Create Date: 2015-03-06 11:37:24.915062
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '4e1a7c9d3b5'
+down_revision = '9b3f6d2c8e4'
+
+from alembic import op
+
+
+def upgrade():
+    # joins of payments with monthly ledger go by user id and month,
+    # the single column index is a prefix of the new one
+    op.create_index(
+        'ix_finance_user_id_year_month', 'finance',
+        ['user_id', 'year', 'month'], unique=False,
+    )
+    op.drop_index('ix_finance_user_id', table_name='finance')
+
+
+def downgrade():
+    op.create_index(
+        'ix_finance_user_id', 'finance', ['user_id'], unique=False,
+    )
+    op.drop_index('ix_finance_user_id_year_month', table_name='finance')
@@ -0,0 +1,35 @@
+"""company and user id columns
+
+Revision ID: 5d0b7e2a9c3
+Revises: 3a9c1f5e7d2
+Create Date: 2015-02-26 13:22:05.746310
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '5d0b7e2a9c3'
+down_revision = '3a9c1f5e7d2'
+
+from alembic import op
+import sqlalchemy as sa
+
+# ids are filled, constrained and indexed by following revisions,
+# so that each step holds its locks only shortly
+ID_COLUMNS = (
+    ('order', 'company_id'),
+    ('order', 'user_id'),
+    ('food', 'company_id'),
+    ('finance', 'user_id'),
+)
+
+
+def upgrade():
+    # new columns are nullable without default, so adding them
+    # does not rewrite tables
+    for table, column in ID_COLUMNS:
+        op.add_column(table, sa.Column(column, sa.Integer(), nullable=True))
+
+
+def downgrade():
+    for table, column in reversed(ID_COLUMNS):
+        op.drop_column(table, column)
@@ -0,0 +1,31 @@
+"""scheduled jobs
+
+Revision ID: 649ccc6dc58
+Revises: 4773fd17a53
+Create Date: 2015-02-23 08:12:51.334016
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '649ccc6dc58'
+down_revision = '4773fd17a53'
+
+from alembic import op
+import sqlalchemy as sa
+
+
+def upgrade():
+    op.create_table(
+        'scheduled_job',
+        sa.Column('name', sa.String(length=50), nullable=False),
+        sa.Column('next_run', sa.DateTime(), nullable=True),
+        sa.Column('last_run', sa.DateTime(), nullable=True),
+        sa.Column('last_success', sa.DateTime(), nullable=True),
+        sa.Column('failures', sa.Integer(), nullable=True),
+        sa.Column('last_error', sa.Unicode(length=400), nullable=True),
+        sa.PrimaryKeyConstraint('name'),
+    )
+
+
+def downgrade():
+    op.drop_table('scheduled_job')
@@ -0,0 +1,75 @@
+"""menu window and food availability index
+
+Revision ID: 6a0d3e8b7f2
+Revises: 4e1a7c9d3b5
+Create Date: 2015-03-09 08:52:40.331275
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '6a0d3e8b7f2'
+down_revision = '4e1a7c9d3b5'
+
+from datetime import date, datetime, timedelta
+
+from alembic import op
+import sqlalchemy as sa
+
+# same as menu.MENU_HORIZON_DAYS when this migration was written
+MENU_HORIZON_DAYS = 62
+
+menu_day = sa.table(
+    'menu_day',
+    sa.column('day', sa.Date),
+    sa.column('food_id', sa.Integer),
+)
+food = sa.table(
+    'food',
+    sa.column('id', sa.Integer),
+    sa.column('date_available_from', sa.DateTime),
+    sa.column('date_available_to', sa.DateTime),
+)
+
+
+def upgrade():
+    op.create_index(
+        'ix_food_available', 'food',
+        ['date_available_from', 'date_available_to'], unique=False,
+    )
+    # days outside of menu window are read from food availability
+    horizon = timedelta(days=MENU_HORIZON_DAYS)
+    today = date.today()
+    op.execute(menu_day.delete().where(sa.or_(
+        menu_day.c.day < today - horizon,
+        menu_day.c.day > today + horizon,
+    )))
+
+
+def downgrade():
+    # previous version reads whole availability from menu_day
+    op.execute(menu_day.delete())
+    connection = op.get_bind()
+    foods = connection.execute(
+        sa.select([
+            food.c.id,
+            food.c.date_available_from,
+            food.c.date_available_to,
+        ]).where(
+            sa.and_(
+                food.c.date_available_from.isnot(None),
+                food.c.date_available_to.isnot(None),
+            )
+        )
+    )
+    for food_id, date_from, date_to in foods.fetchall():
+        if isinstance(date_from, datetime):
+            date_from = date_from.date()
+        if isinstance(date_to, datetime):
+            date_to = date_to.date()
+        rows = []
+        while date_from <= date_to:
+            rows.append({'day': date_from, 'food_id': food_id})
+            date_from += timedelta(days=1)
+        if rows:
+            op.bulk_insert(menu_day, rows)
+    op.drop_index('ix_food_available', table_name='food')
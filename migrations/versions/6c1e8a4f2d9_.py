@@ -0,0 +1,91 @@
+"""backfill company and user ids
+
+Revision ID: 6c1e8a4f2d9
+Revises: 5d0b7e2a9c3
+Create Date: 2015-02-26 13:24:41.208533
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '6c1e8a4f2d9'
+down_revision = '5d0b7e2a9c3'
+
+from alembic import op
+import sqlalchemy as sa
+
+BATCH_SIZE = 5000
+
+companies = sa.table(
+    'companies',
+    sa.column('id', sa.Integer),
+    sa.column('name', sa.String),
+)
+user = sa.table(
+    'user',
+    sa.column('id', sa.Integer),
+    sa.column('username', sa.String),
+)
+order = sa.table(
+    'order',
+    sa.column('id', sa.Integer),
+    sa.column('company', sa.String),
+    sa.column('company_id', sa.Integer),
+    sa.column('user_name', sa.String),
+    sa.column('user_id', sa.Integer),
+)
+food = sa.table(
+    'food',
+    sa.column('id', sa.Integer),
+    sa.column('company', sa.String),
+    sa.column('company_id', sa.Integer),
+)
+finance = sa.table(
+    'finance',
+    sa.column('id', sa.Integer),
+    sa.column('user_name', sa.String),
+    sa.column('user_id', sa.Integer),
+)
+
+
+def backfill(connection, table, column, value):
+    """
+    Sets empty ids from names by ranges of BATCH_SIZE rows.
+    Connection autocommits, so every range is its own transaction
+    and row locks are held only while it is updated.
+    """
+    last_id = connection.execute(sa.select([sa.func.max(table.c.id)])) \
+        .scalar() or 0
+    for first_id in range(0, last_id + 1, BATCH_SIZE):
+        connection.execute(
+            table.update().where(sa.and_(
+                table.c.id >= first_id,
+                table.c.id < first_id + BATCH_SIZE,
+                table.c[column].is_(None),
+            )).values({column: value})
+        )
+
+
+def company_id(table):
+    return sa.select([companies.c.id]).where(
+        companies.c.name == table.c.company
+    ).limit(1).as_scalar()
+
+
+def user_id(table):
+    return sa.select([user.c.id]).where(
+        user.c.username == table.c.user_name
+    ).as_scalar()
+
+
+def upgrade():
+    with op.get_context().autocommit_block():
+        connection = op.get_bind()
+        backfill(connection, order, 'company_id', company_id(order))
+        backfill(connection, order, 'user_id', user_id(order))
+        backfill(connection, food, 'company_id', company_id(food))
+        backfill(connection, finance, 'user_id', user_id(finance))
+
+
+def downgrade():
+    # ids are dropped with their columns
+    pass
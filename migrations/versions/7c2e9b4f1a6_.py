@@ -0,0 +1,24 @@
+"""order list keyset index
+
+Revision ID: 7c2e9b4f1a6
+Revises: 2f8d4a6b1e9
+Create Date: 2015-03-02 10:14:37.218904
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '7c2e9b4f1a6'
+down_revision = '2f8d4a6b1e9'
+
+from alembic import op
+
+
+def upgrade():
+    op.create_index(
+        'ix_order_user_id_date_id', 'order', ['user_id', 'date', 'id'],
+        unique=False,
+    )
+
+
+def downgrade():
+    op.drop_index('ix_order_user_id_date_id', table_name='order')
@@ -0,0 +1,30 @@
+"""menu window
+
+Revision ID: 7e4c2a8f6d1
+Revises: 1b6e3d9a5c8
+Create Date: 2015-03-12 08:37:19.604213
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '7e4c2a8f6d1'
+down_revision = '1b6e3d9a5c8'
+
+from alembic import op
+import sqlalchemy as sa
+
+
+def upgrade():
+    # no window is stored until extend_menu fills menu_day,
+    # till then menu is read from food availability
+    op.create_table(
+        'menu_window',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('first_day', sa.Date(), nullable=True),
+        sa.Column('last_day', sa.Date(), nullable=True),
+        sa.PrimaryKeyConstraint('id'),
+    )
+
+
+def downgrade():
+    op.drop_table('menu_window')
@@ -0,0 +1,47 @@
+"""company and user foreign keys
+
+Revision ID: 8a2d5f7c3b1
+Revises: 6c1e8a4f2d9
+Create Date: 2015-02-26 13:26:17.930264
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '8a2d5f7c3b1'
+down_revision = '6c1e8a4f2d9'
+
+from alembic import op
+
+FOREIGN_KEYS = (
+    ('fk_order_company_id', 'order', 'company_id', 'companies'),
+    ('fk_order_user_id', 'order', 'user_id', 'user'),
+    ('fk_food_company_id', 'food', 'company_id', 'companies'),
+    ('fk_finance_user_id', 'finance', 'user_id', 'user'),
+)
+
+
+def upgrade():
+    if op.get_bind().dialect.name != 'postgresql':
+        # SQLite can not add constraints to existing tables
+        return
+    # constraints are added without checking rows, which locks tables
+    # only shortly, and validated after that without blocking writes
+    with op.get_context().autocommit_block():
+        for name, table, column, referent in FOREIGN_KEYS:
+            op.execute(
+                'ALTER TABLE "{}" ADD CONSTRAINT {} FOREIGN KEY ({}) '
+                'REFERENCES "{}" (id) NOT VALID'.format(
+                    table, name, column, referent,
+                )
+            )
+        for name, table, _column, _referent in FOREIGN_KEYS:
+            op.execute('ALTER TABLE "{}" VALIDATE CONSTRAINT {}'.format(
+                table, name,
+            ))
+
+
+def downgrade():
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+    for name, table, _column, _referent in FOREIGN_KEYS:
+        op.drop_constraint(name, table, type_='foreignkey')
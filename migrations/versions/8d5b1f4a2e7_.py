@@ -0,0 +1,22 @@
+"""outbox claim
+
+Revision ID: 8d5b1f4a2e7
+Revises: 6a0d3e8b7f2
+Create Date: 2015-03-10 09:21:55.472906
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '8d5b1f4a2e7'
+down_revision = '6a0d3e8b7f2'
+
+from alembic import op
+import sqlalchemy as sa
+
+
+def upgrade():
+    op.add_column('outbox', sa.Column('claim', sa.String(32), nullable=True))
+
+
+def downgrade():
+    op.drop_column('outbox', 'claim')
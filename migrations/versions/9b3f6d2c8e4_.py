@@ -0,0 +1,62 @@
+"""monthly ledger
+
+Revision ID: 9b3f6d2c8e4
+Revises: 7c2e9b4f1a6
+Create Date: 2015-03-04 16:02:51.603418
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '9b3f6d2c8e4'
+down_revision = '7c2e9b4f1a6'
+
+from alembic import op
+import sqlalchemy as sa
+
+order = sa.table(
+    'order',
+    sa.column('id', sa.Integer),
+    sa.column('user_id', sa.Integer),
+    sa.column('order_day', sa.Date),
+    sa.column('cost', sa.Integer),
+)
+
+
+def upgrade():
+    ledger = op.create_table(
+        'monthly_ledger',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('year', sa.Integer(), nullable=False),
+        sa.Column('month', sa.Integer(), nullable=False),
+        sa.Column('number_of_orders', sa.Integer(), nullable=False),
+        sa.Column('month_cost', sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(['user_id'], ['user.id'], ),
+        sa.PrimaryKeyConstraint('id'),
+    )
+    op.create_index(
+        'ix_monthly_ledger_year_month_user_id', 'monthly_ledger',
+        ['year', 'month', 'user_id'], unique=True,
+    )
+    year = sa.cast(sa.extract('year', order.c.order_day), sa.Integer)
+    month = sa.cast(sa.extract('month', order.c.order_day), sa.Integer)
+    op.execute(ledger.insert().from_select(
+        ['user_id', 'year', 'month', 'number_of_orders', 'month_cost'],
+        sa.select([
+            order.c.user_id,
+            year,
+            month,
+            sa.func.count(order.c.id),
+            sa.func.coalesce(sa.func.sum(order.c.cost), 0),
+        ]).where(sa.and_(
+            order.c.user_id.isnot(None),
+            order.c.order_day.isnot(None),
+        )).group_by(order.c.user_id, year, month)
+    ))
+
+
+def downgrade():
+    op.drop_index(
+        'ix_monthly_ledger_year_month_user_id', table_name='monthly_ledger',
+    )
+    op.drop_table('monthly_ledger')
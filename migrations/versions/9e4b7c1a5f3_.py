@@ -0,0 +1,39 @@
+"""company and user id indexes
+
+Revision ID: 9e4b7c1a5f3
+Revises: 8a2d5f7c3b1
+Create Date: 2015-02-26 13:28:52.417690
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '9e4b7c1a5f3'
+down_revision = '8a2d5f7c3b1'
+
+from alembic import op
+
+INDEXES = (
+    ('ix_order_user_id_order_day', 'order', ['user_id', 'order_day']),
+    ('ix_order_order_day_company_id', 'order', ['order_day', 'company_id']),
+    ('ix_food_company_id', 'food', ['company_id']),
+    ('ix_finance_user_id', 'finance', ['user_id']),
+)
+
+
+def upgrade():
+    # PostgreSQL builds indexes concurrently, which can not run
+    # in a transaction, and does not block writes meanwhile
+    with op.get_context().autocommit_block():
+        for name, table, columns in INDEXES:
+            op.create_index(
+                name, table, columns, unique=False,
+                postgresql_concurrently=True,
+            )
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        for name, table, _columns in reversed(INDEXES):
+            op.drop_index(
+                name, table_name=table, postgresql_concurrently=True,
+            )
@@ -0,0 +1,39 @@
+"""mail outbox
+
+Revision ID: ff02a7f99f9
+Revises: 2c94f1d7b6e
+Create Date: 2015-02-19 10:12:44.530917
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = 'ff02a7f99f9'
+down_revision = '2c94f1d7b6e'
+
+from alembic import op
+import sqlalchemy as sa
+
+
+def upgrade():
+    op.create_table(
+        'outbox',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('subject', sa.Unicode(length=200), nullable=True),
+        sa.Column('recipients', sa.UnicodeText(), nullable=True),
+        sa.Column('body', sa.UnicodeText(), nullable=True),
+        sa.Column('created', sa.DateTime(), nullable=True),
+        sa.Column('sent', sa.DateTime(), nullable=True),
+        sa.Column('attempts', sa.Integer(), nullable=True),
+        sa.Column('next_attempt', sa.DateTime(), nullable=True),
+        sa.Column('last_error', sa.Unicode(length=400), nullable=True),
+        sa.PrimaryKeyConstraint('id'),
+    )
+    op.create_index(
+        op.f('ix_outbox_next_attempt'), 'outbox', ['next_attempt'],
+        unique=False,
+    )
+
+
+def downgrade():
+    op.drop_index(op.f('ix_outbox_next_attempt'), table_name='outbox')
+    op.drop_table('outbox')
@@ -38,6 +38,9 @@ setup(
         'Flask-Migrate',
         'beautifulsoup4',
     ],
+    extras_require={
+        'lxml': ['lxml'],
+    },
     entry_points="""
     [console_scripts]
     flask-ctl = lunch_app.script:run
@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+# pylint: disable=invalid-name, no-member
+"""
+Timing of restaurant page parsers on mock pages.
+Run with: bin/python -m lunch_app.benchmark
+"""
+from os import path
+import timeit
+
+from bs4 import BeautifulSoup
+
+from . import crawler, webcrawler
+
+MOCKS = path.abspath(path.join(path.dirname(__file__), '..', '..', 'etc'))
+REPEAT = 20
+
+
+def read_mock(name):
+    """
+    Returns content of mock page.
+    """
+    with open(path.join(MOCKS, 'mock_{}.html'.format(name)), 'rb') as page:
+        return page.read()
+
+
+def best_time(function, number):
+    """
+    Returns best time of single call in milliseconds.
+    """
+    timer = timeit.Timer(function)
+    return min(timer.repeat(repeat=5, number=number)) / number * 1000
+
+
+def tomas_tokens():
+    """
+    Returns menu lines of Tomas mock page.
+    """
+    soup = BeautifulSoup(read_mock('tomas'), 'html.parser')
+    return list(webcrawler.tomas_tokens(
+        soup.find_all("td", {"class": "biala"})
+    ))
+
+
+def inflate_diet(tokens, factor):
+    """
+    Returns menu lines with diet meals repeated factor times.
+    """
+    first_day = tokens.index('ZUPA DNIA:')
+    return tokens[:first_day] * factor + tokens[first_day:]
+
+
+def full_tree(content):
+    """
+    Builds tree of whole page, the way parsers worked before strainers.
+    """
+    return BeautifulSoup(content, webcrawler.HTML_PARSER)
+
+
+def main():
+    """
+    Prints parse time and peak memory of mock pages
+    and parse times of growing Tomas menus.
+    """
+    print('parser: {}'.format(webcrawler.HTML_PARSER))
+    for name, source in crawler.SOURCES.items():
+        content = read_mock(name)
+        for label, parse in (('menu', source.parse), ('full tree', full_tree)):
+            parse_time = best_time(lambda: parse(content), REPEAT)
+            peak_memory = crawler.measure(parse, content, True)[2]
+            print('{} {}: {:.2f} ms, peak memory {} kB'.format(
+                name, label, parse_time, peak_memory // 1024,
+            ))
+    tokens = tomas_tokens()
+    for factor in (1, 10, 100, 1000):
+        inflated = inflate_diet(tokens, factor)
+        print('tomas_menu, {} lines: {:.3f} ms'.format(
+            len(inflated),
+            best_time(lambda: webcrawler.tomas_menu(inflated), REPEAT),
+        ))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,262 @@
+# -*- coding: utf-8 -*-
+# pylint: disable=invalid-name, no-member, unused-argument
+"""
+Read-through cache for rarely changing reference data.
+"""
+import fcntl
+from itertools import chain
+import os
+import threading
+from types import SimpleNamespace
+
+from sqlalchemy.orm import Session
+
+from .models import Company, MailText, OrderingInfo
+
+ORDERING_INFO = 'ordering_info'
+MAIL_TEXT = 'mail_text'
+COMPANIES = 'companies'
+
+CACHED_MODELS = {
+    OrderingInfo: ORDERING_INFO,
+    MailText: MAIL_TEXT,
+    Company: COMPANIES,
+}
+
+_STALE_KEYS = 'stale_cache_keys'
+
+# model: functions returning cache keys made stale by written record
+STALE_KEY_FUNCTIONS = {}
+
+
+def register_stale_keys(model, function):
+    """
+    Invalidates keys returned by function(record) when record of model
+    is written, for cached data computed from many records.
+    """
+    STALE_KEY_FUNCTIONS.setdefault(model, []).append(function)
+
+
+class LocalGeneration(object):
+    """
+    Generation counter visible only in current process.
+    """
+
+    def __init__(self):
+        self._value = 0
+        self._lock = threading.Lock()
+
+    def current(self):
+        """
+        Returns current generation.
+        """
+        return self._value
+
+    def bump(self):
+        """
+        Starts new generation.
+        """
+        with self._lock:
+            self._value += 1
+
+
+class FileGeneration(object):
+    """
+    Generation counter stored in local file, shared by all processes
+    on one host, e.g. uWSGI workers.
+    """
+
+    def __init__(self, path):
+        self.path = path
+
+    def current(self):
+        """
+        Returns current generation, 0 when nothing was bumped yet.
+        """
+        try:
+            with open(self.path) as stamp_file:
+                fcntl.flock(stamp_file, fcntl.LOCK_SH)
+                return int(stamp_file.read() or 0)
+        except (IOError, OSError):
+            return 0
+
+    def bump(self):
+        """
+        Starts new generation.
+        """
+        descriptor = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        with os.fdopen(descriptor, 'r+') as stamp_file:
+            fcntl.flock(stamp_file, fcntl.LOCK_EX)
+            generation = int(stamp_file.read() or 0) + 1
+            stamp_file.seek(0)
+            stamp_file.truncate()
+            stamp_file.write(str(generation))
+
+
+class LocalCache(object):
+    """
+    Thread safe in-process cache with explicit invalidation.
+    Values are dropped whenever generation changes, so invalidation
+    done by other process reaches this one with a single stamp check.
+    """
+
+    def __init__(self, generation=None):
+        self.generation = generation or LocalGeneration()
+        self._seen_generation = None
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def get(self, key, loader):
+        """
+        Returns cached value, calls loader when key is missing.
+        """
+        generation = self.generation.current()
+        with self._lock:
+            if generation != self._seen_generation:
+                self._values.clear()
+                self._seen_generation = generation
+            if key in self._values:
+                return self._values[key]
+        value = loader()
+        with self._lock:
+            # skip values loaded while invalidation was in progress
+            if generation == self._seen_generation:
+                self._values[key] = value
+        return value
+
+    def get_many(self, keys, loader):
+        """
+        Returns cached values of keys by key, calls loader once with
+        list of missing keys, it returns their values by key.
+        """
+        generation = self.generation.current()
+        with self._lock:
+            if generation != self._seen_generation:
+                self._values.clear()
+                self._seen_generation = generation
+            values = {
+                key: self._values[key] for key in keys if key in self._values
+            }
+        missing = [key for key in keys if key not in values]
+        if missing:
+            loaded = loader(missing)
+            with self._lock:
+                if generation == self._seen_generation:
+                    self._values.update(loaded)
+            values.update(loaded)
+        return values
+
+    def invalidate(self, *keys):
+        """
+        Drops given keys here and starts new generation for others.
+        """
+        if not keys:
+            return
+        with self._lock:
+            for key in keys:
+                self._values.pop(key, None)
+        self.generation.bump()
+
+    def clear(self):
+        """
+        Drops all cached values.
+        """
+        with self._lock:
+            self._values.clear()
+
+
+cache = LocalCache()
+
+
+def init_generation(path):
+    """
+    Shares invalidation through given file between processes.
+    """
+    cache.generation = FileGeneration(path)
+
+
+def snapshot(record):
+    """
+    Returns detached copy of model columns, safe to share between requests.
+    """
+    if record is None:
+        return None
+    return SimpleNamespace(**{
+        column: getattr(record, column)
+        for column in record.__table__.columns.keys()
+    })
+
+
+def get_ordering_info():
+    """
+    Returns ordering availability.
+    """
+    return cache.get(
+        ORDERING_INFO,
+        lambda: snapshot(OrderingInfo.query.order_by(OrderingInfo.id).first()),
+    )
+
+
+def get_mail_text():
+    """
+    Returns mail and page texts.
+    """
+    return cache.get(
+        MAIL_TEXT,
+        lambda: snapshot(MailText.query.order_by(MailText.id).first()),
+    )
+
+
+def get_companies():
+    """
+    Returns all companies.
+    """
+    return cache.get(
+        COMPANIES,
+        lambda: tuple(
+            snapshot(company)
+            for company in Company.query.order_by(Company.id)
+        ),
+    )
+
+
+def invalidate(*keys):
+    """
+    Drops given reference data from cache.
+    """
+    cache.invalidate(*keys)
+
+
+def collect_stale_keys(session, flush_context):
+    """
+    Remembers which cached data was written in current transaction.
+    """
+    stale_keys = session.info.setdefault(_STALE_KEYS, set())
+    for record in chain(session.new, session.dirty, session.deleted):
+        key = CACHED_MODELS.get(type(record))
+        if key is not None:
+            stale_keys.add(key)
+        for function in STALE_KEY_FUNCTIONS.get(type(record), ()):
+            stale_keys.update(function(record))
+
+
+def invalidate_stale_keys(session):
+    """
+    Drops data written in committed transaction from cache.
+    """
+    invalidate(*session.info.pop(_STALE_KEYS, ()))
+
+
+def forget_stale_keys(session, previous_transaction):
+    """
+    Nothing was written when transaction is rolled back.
+    """
+    session.info.pop(_STALE_KEYS, None)
+
+
+# session listeners registered by main.init_listeners
+LISTENERS = (
+    (Session, 'after_flush', collect_stale_keys),
+    (Session, 'after_commit', invalidate_stale_keys),
+    (Session, 'after_soft_rollback', forget_stale_keys),
+)
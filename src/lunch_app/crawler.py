@@ -0,0 +1,363 @@
+# -*- coding: utf-8 -*-
+# pylint: disable=invalid-name, no-member, broad-except
+"""
+Concurrent crawler of restaurant menus with pluggable page parsers.
+"""
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import datetime
+import hashlib
+import http.client
+import logging
+import threading
+import time
+import tracemalloc
+from urllib.parse import urljoin, urlsplit
+
+from .main import app, db
+from .ingest import upsert_foods
+from .models import CrawlState
+
+log = logging.getLogger(__name__)
+
+TIMEOUT = 10
+MAX_REDIRECTS = 3
+REDIRECT_STATUSES = (301, 302, 303, 307, 308)
+
+
+class MenuSource(object):
+    """
+    Restaurant page with parser of its menu.
+    parse(content) returns menu data,
+    make_foods(data, today) returns food rows of parsed menu.
+    """
+
+    def __init__(self, name, url_setting, parse, make_foods):
+        self.name = name
+        self.url_setting = url_setting
+        self.parse = parse
+        self.make_foods = make_foods
+
+    @property
+    def url(self):
+        """
+        Returns configured page address.
+        """
+        return app.config[self.url_setting]
+
+
+SOURCES = OrderedDict()
+
+
+def register_source(name, url_setting, parse, make_foods):
+    """
+    Adds restaurant to crawled sources.
+    """
+    SOURCES[name] = MenuSource(name, url_setting, parse, make_foods)
+    return SOURCES[name]
+
+
+class ConnectionPool(object):
+    """
+    Keeps HTTP connections open between requests to the same host.
+    """
+
+    def __init__(self, timeout=None):
+        self.timeout = timeout
+        self._idle = {}
+        self._lock = threading.Lock()
+
+    def acquire(self, scheme, host):
+        """
+        Returns idle connection to host, None when there is none.
+        """
+        with self._lock:
+            idle = self._idle.get((scheme, host))
+            if idle:
+                return idle.pop()
+        return None
+
+    def connect(self, scheme, host):
+        """
+        Returns new connection to host.
+        """
+        timeout = self.timeout or app.config.get('CRAWLER_TIMEOUT', TIMEOUT)
+        if scheme == 'https':
+            return http.client.HTTPSConnection(host, timeout=timeout)
+        return http.client.HTTPConnection(host, timeout=timeout)
+
+    def release(self, scheme, host, connection):
+        """
+        Returns connection to pool for next request.
+        """
+        with self._lock:
+            self._idle.setdefault((scheme, host), []).append(connection)
+
+    def idle_count(self):
+        """
+        Returns number of connections waiting for reuse.
+        """
+        with self._lock:
+            return sum(len(idle) for idle in self._idle.values())
+
+    def close(self):
+        """
+        Closes all idle connections.
+        """
+        with self._lock:
+            idle, self._idle = self._idle, {}
+        for connections in idle.values():
+            for connection in connections:
+                connection.close()
+
+
+pool = ConnectionPool()
+
+
+class Page(object):
+    """
+    Fetched page with its cache validators, content is None
+    when page was not modified.
+    """
+
+    def __init__(self, status, content=None, etag=None, last_modified=None):
+        self.status = status
+        self.content = content
+        self.etag = etag
+        self.last_modified = last_modified
+
+    @property
+    def not_modified(self):
+        """
+        Tells if server confirmed that cached version is current.
+        """
+        return self.status == 304
+
+
+def fetch_page(url, etag=None, last_modified=None, connection_pool=None):
+    """
+    Returns Page, follows redirects. Given validators make request
+    conditional. Raises IOError on connection problems and
+    unsuccessful responses.
+    """
+    connection_pool = connection_pool or pool
+    headers = {}
+    if etag:
+        headers['If-None-Match'] = etag
+    if last_modified:
+        headers['If-Modified-Since'] = last_modified
+    for _redirect in range(MAX_REDIRECTS + 1):
+        parts = urlsplit(url)
+        path = parts.path or '/'
+        if parts.query:
+            path += '?' + parts.query
+        connection = connection_pool.acquire(parts.scheme, parts.netloc)
+        reused = connection is not None
+        while True:
+            if connection is None:
+                connection = connection_pool.connect(parts.scheme,
+                                                     parts.netloc)
+            try:
+                connection.request('GET', path, headers=headers)
+                response = connection.getresponse()
+                content = response.read()
+            except (http.client.HTTPException, IOError):
+                connection.close()
+                if not reused:
+                    raise
+                # server closed idle connection, retry with new one
+                connection, reused = None, False
+            else:
+                break
+        if response.will_close:
+            connection.close()
+        else:
+            connection_pool.release(parts.scheme, parts.netloc, connection)
+        if response.status in REDIRECT_STATUSES:
+            url = urljoin(url, response.getheader('Location'))
+            continue
+        if response.status == 304:
+            return Page(
+                304,
+                etag=response.getheader('ETag', etag),
+                last_modified=response.getheader(
+                    'Last-Modified', last_modified,
+                ),
+            )
+        if response.status != 200:
+            raise IOError('{} returned {}'.format(url, response.status))
+        return Page(
+            200,
+            content,
+            response.getheader('ETag'),
+            response.getheader('Last-Modified'),
+        )
+    raise IOError('Too many redirects for {}'.format(url))
+
+
+def fetch(url, connection_pool=None):
+    """
+    Returns body of page.
+    """
+    return fetch_page(url, connection_pool=connection_pool).content
+
+
+class CrawlResult(object):
+    """
+    Parsed menu or error of one source with fetch and parse statistics.
+    Unchanged source is not parsed, its data is None.
+    """
+
+    def __init__(self, source, data=None, error=None, elapsed=0.0,
+                 parse_time=None, peak_memory=None):
+        self.source = source
+        self.data = data
+        self.error = error
+        self.elapsed = elapsed
+        self.parse_time = parse_time
+        self.peak_memory = peak_memory
+        self.unchanged = False
+        self.etag = None
+        self.last_modified = None
+        self.content_hash = None
+
+    @property
+    def ok(self):
+        """
+        Tells if source was fetched and parsed.
+        """
+        return self.error is None
+
+
+_parse_lock = threading.Lock()
+
+
+def measure(function, content, trace_memory=False):
+    """
+    Returns result of function(content), its time and peak memory.
+    Parsing is CPU bound, so sources are parsed one at a time, which
+    keeps memory of each parse apart and costs no concurrency.
+    """
+    with _parse_lock:
+        tracing = trace_memory and not tracemalloc.is_tracing()
+        if tracing:
+            tracemalloc.start()
+        started = time.time()
+        try:
+            result = function(content)
+        finally:
+            parse_time = time.time() - started
+            peak_memory = None
+            if tracing:
+                peak_memory = tracemalloc.get_traced_memory()[1]
+                tracemalloc.stop()
+    return result, parse_time, peak_memory
+
+
+def crawl_source(source, trace_memory=False, state=None):
+    """
+    Fetches and parses menu of one source.
+    State holds validators and hash of previously crawled page,
+    page which did not change since then is not parsed.
+    """
+    state = state or {}
+    started = time.time()
+    result = CrawlResult(source)
+    try:
+        page = fetch_page(
+            source.url, state.get('etag'), state.get('last_modified'),
+        )
+        result.etag = page.etag
+        result.last_modified = page.last_modified
+        if page.not_modified:
+            result.content_hash = state.get('content_hash')
+        else:
+            result.content_hash = hashlib.sha256(page.content).hexdigest()
+        result.unchanged = result.content_hash is not None \
+            and result.content_hash == state.get('content_hash')
+        if not result.unchanged:
+            result.data, result.parse_time, result.peak_memory = measure(
+                source.parse, page.content, trace_memory,
+            )
+    except Exception as error:
+        log.exception('Crawling %s failed', source.name)
+        result.error = error
+    result.elapsed = time.time() - started
+    return result
+
+
+def load_states(names, today):
+    """
+    Returns stored validators and hashes of given sources whose foods
+    were stored for today. Foods are stamped with day they were
+    crawled on, so on next day page is fetched and parsed again
+    even when it did not change.
+    """
+    return {
+        state.source: {
+            'etag': state.etag,
+            'last_modified': state.last_modified,
+            'content_hash': state.content_hash,
+        }
+        for state in CrawlState.query.filter(
+            CrawlState.source.in_(names),
+            CrawlState.ingested == today,
+        )
+    }
+
+
+def crawl(names=None, workers=None, trace_memory=False, force=False,
+          today=None):
+    """
+    Fetches all or given sources concurrently.
+    Sources unchanged since their foods were stored today are not
+    parsed unless force is set. Returns results in order of sources.
+    """
+    today = today or datetime.date.today()
+    names = names or list(SOURCES)
+    unknown = [name for name in names if name not in SOURCES]
+    if unknown:
+        raise ValueError('Unknown sources: {}'.format(', '.join(unknown)))
+    sources = [SOURCES[name] for name in names]
+    if not sources:
+        return []
+    states = {} if force else load_states(names, today)
+    workers = workers or app.config.get('CRAWLER_WORKERS') or len(sources)
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = [
+            executor.submit(
+                crawl_source, source, trace_memory, states.get(source.name),
+            )
+            for source in sources
+        ]
+        return [future.result() for future in futures]
+
+
+def store(results, today=None):
+    """
+    Upserts foods of today from changed sources and remembers their
+    state. Returns number of inserted and updated foods.
+    """
+    today = today or datetime.date.today()
+    now = datetime.datetime.utcnow()
+    inserted = updated = 0
+    for result in results:
+        if not result.ok:
+            continue
+        if not result.unchanged:
+            counts = upsert_foods(result.source.make_foods(result.data, today))
+            inserted += counts[0]
+            updated += counts[1]
+        state = CrawlState.query.get(result.source.name)
+        if state is None:
+            state = CrawlState(source=result.source.name)
+            db.session.add(state)
+        state.etag = result.etag
+        state.last_modified = result.last_modified
+        state.content_hash = result.content_hash
+        state.checked = now
+        if not result.unchanged:
+            state.changed = now
+            state.ingested = today
+    db.session.commit()
+    return inserted, updated
@@ -12,7 +12,7 @@ from wtforms import (
     BooleanField,
     SelectField,
     DateField,
-    FloatField,
+    DecimalField,
     StringField,
 )
 
@@ -28,7 +28,7 @@ class OrderForm(Form):
         "description",
         validators=[validators.DataRequired('Please enter your order.')],
     )
-    cost = FloatField(
+    cost = DecimalField(
         'cost',
         validators=[
             validators.DataRequired('Please enter cost.'),
@@ -88,6 +88,36 @@ class CompanyOrders(Form):
     )
 
 
+class CompanySpendForm(Form):
+    """
+    Company spend report range form.
+    """
+    begin = DateField(
+        'begin',
+        validators=[validators.DataRequired('Please enter first day.')],
+        format='%Y-%m-%d',
+    )
+    end = DateField(
+        'end',
+        validators=[validators.DataRequired('Please enter last day.')],
+        format='%Y-%m-%d',
+    )
+    granularity = SelectField('granularity', choices=[
+        ('month', 'Months'),
+        ('week', 'Weeks'),
+        ('day', 'Days'),
+    ])
+
+    def validate_end(self, field):
+        """
+        Checks that range is not empty.
+        """
+        if self.begin.data and field.data and field.data < self.begin.data:
+            raise validators.ValidationError(
+                'Last day has to be after first day.'
+            )
+
+
 class AddFood(Form):
     """
     New Order Creation Form
@@ -100,7 +130,7 @@ class AddFood(Form):
         "description",
         validators=[validators.DataRequired("Please enter order description.")]
     )
-    cost = FloatField(
+    cost = DecimalField(
         'cost',
         validators=[
             validators.DataRequired('Please enter cost.'),
@@ -0,0 +1,352 @@
+# -*- coding: utf-8 -*-
+# pylint: disable=invalid-name, no-member
+"""
+Bulk food ingestion with multi-row statements instead of ORM objects.
+"""
+from collections import OrderedDict
+import csv
+import datetime
+import decimal
+import json
+
+from sqlalchemy import and_, bindparam, select
+
+from .cache import get_companies
+from .main import db
+from .menu import as_date, filled_window, food_days
+from .models import Food, MenuDay
+from .utils import make_datetime, make_money
+
+IMPORT_BATCH_SIZE = 1000
+MAX_IMPORT_ERRORS = 20
+# longest availability of catalogue food, in days
+MAX_AVAILABILITY_DAYS = 366
+FOOD_TYPES = ('daniednia', 'tygodniowe', 'menu')
+IMPORT_FORMATS = OrderedDict((
+    ('.csv', 'csv'),
+    ('.jsonl', 'jsonl'),
+    ('.ndjson', 'jsonl'),
+    ('.json', 'jsonl'),
+))
+
+
+def food_row(description, cost, o_type, date_from, date_to, company):
+    """
+    Returns food row ready for bulk insert.
+    """
+    return {
+        'company': company,
+        'description': description,
+        'cost': cost,
+        'o_type': o_type,
+        'date_available_from': date_from,
+        'date_available_to': date_to,
+    }
+
+
+def food_key(row):
+    """
+    Returns identity of food: company, description and availability.
+    """
+    return (
+        row['company'],
+        row['description'],
+        as_date(row['date_available_from']),
+        as_date(row['date_available_to']),
+    )
+
+
+def prepare(rows):
+    """
+    Returns rows by key without blank and repeated ones,
+    and number of skipped rows. Rows get id of their company.
+    """
+    company_ids = {company.name: company.id for company in get_companies()}
+    prepared = OrderedDict()
+    skipped = 0
+    for row in rows:
+        description = (row['description'] or '').strip()
+        if not description:
+            skipped += 1
+            continue
+        row = dict(
+            row,
+            description=description,
+            cost=make_money(row['cost']),
+            company_id=company_ids.get(row['company']),
+        )
+        for column in ('date_available_from', 'date_available_to'):
+            if row[column] is not None:
+                row[column] = make_datetime(as_date(row[column]))
+        key = food_key(row)
+        if key in prepared:
+            skipped += 1
+        prepared[key] = row
+    return prepared, skipped
+
+
+def existing_foods(keys):
+    """
+    Returns id, cost and type of stored foods by key.
+    """
+    dates = [key[2] for key in keys if key[2] is not None]
+    if not dates:
+        return {}
+    food = Food.__table__
+    query = select([
+        food.c.id,
+        food.c.company,
+        food.c.description,
+        food.c.date_available_from,
+        food.c.date_available_to,
+        food.c.cost,
+        food.c.o_type,
+    ]).where(and_(
+        food.c.company.in_({key[0] for key in keys}),
+        food.c.description.in_({key[1] for key in keys}),
+        food.c.date_available_from >= make_datetime(min(dates)),
+        food.c.date_available_from <= make_datetime(max(dates)),
+    ))
+    existing = {}
+    for row in db.session.execute(query):
+        existing[food_key(row)] = row
+    return existing
+
+
+def insert_food_ids(rows):
+    """
+    Inserts foods and returns their ids in order of rows, as reported
+    by inserts themselves, so that foods of concurrent writers are
+    never taken for ours. PostgreSQL returns them from one multi-row
+    insert, other databases from one insert per food. Rows must have
+    unique keys.
+    """
+    food = Food.__table__
+    connection = db.session.connection()
+    if connection.dialect.name == 'postgresql':
+        returned = connection.execute(
+            food.insert().values(rows).returning(
+                food.c.id,
+                food.c.company,
+                food.c.description,
+                food.c.date_available_from,
+                food.c.date_available_to,
+            )
+        )
+        ids = {food_key(row): row.id for row in returned}
+        return [ids[food_key(row)] for row in rows]
+    return [
+        connection.execute(food.insert(), row).inserted_primary_key[0]
+        for row in rows
+    ]
+
+
+def insert_rows(rows):
+    """
+    Inserts foods and their menu days with one executemany.
+    """
+    if not rows:
+        return
+    ids = insert_food_ids(rows)
+    window = filled_window()
+    menu_days = [
+        {'day': day, 'food_id': food_id}
+        for food_id, row in zip(ids, rows)
+        for day in food_days(
+            row['date_available_from'], row['date_available_to'], window,
+        )
+    ]
+    if menu_days:
+        db.session.execute(MenuDay.__table__.insert(), menu_days)
+
+
+def insert_foods(rows):
+    """
+    Inserts new foods, blank, repeated and already stored ones
+    are skipped. Caller commits.
+    Returns number of inserted and skipped foods.
+    """
+    prepared, skipped = prepare(rows)
+    existing = existing_foods(list(prepared))
+    new_rows = [
+        row for key, row in prepared.items() if key not in existing
+    ]
+    insert_rows(new_rows)
+    return len(new_rows), skipped + len(prepared) - len(new_rows)
+
+
+def upsert_foods(rows):
+    """
+    Inserts new foods and updates cost and type of stored ones.
+    Caller commits.
+    Returns number of inserted and updated foods.
+    """
+    prepared, _skipped = prepare(rows)
+    existing = existing_foods(list(prepared))
+    new_rows = []
+    changes = []
+    for key, row in prepared.items():
+        current = existing.get(key)
+        if current is None:
+            new_rows.append(row)
+        elif (current.cost, current.o_type) != (row['cost'], row['o_type']):
+            changes.append({
+                'food_id': current.id,
+                'new_cost': row['cost'],
+                'new_type': row['o_type'],
+            })
+    insert_rows(new_rows)
+    if changes:
+        food = Food.__table__
+        db.session.execute(
+            food.update().where(food.c.id == bindparam('food_id')).values(
+                cost=bindparam('new_cost'),
+                o_type=bindparam('new_type'),
+            ),
+            changes,
+        )
+    return len(new_rows), len(changes)
+
+
+class InvalidRecord(ValueError):
+    """
+    Catalogue record which can not be imported.
+    """
+
+
+class ImportReport(object):
+    """
+    Counts of imported, skipped and invalid records with first errors.
+    """
+
+    def __init__(self):
+        self.inserted = 0
+        self.skipped = 0
+        self.invalid = 0
+        self.errors = []
+
+    def add_error(self, line, error):
+        """
+        Counts invalid record, keeps message of first ones.
+        """
+        self.invalid += 1
+        if len(self.errors) < MAX_IMPORT_ERRORS:
+            self.errors.append('line {}: {}'.format(line, error))
+
+    def add_batch(self, counts):
+        """
+        Adds counts of inserted and skipped foods.
+        """
+        self.inserted += counts[0]
+        self.skipped += counts[1]
+
+
+def import_format(filename):
+    """
+    Returns catalogue format by file extension, None when unknown.
+    """
+    for extension, file_format in IMPORT_FORMATS.items():
+        if filename.lower().endswith(extension):
+            return file_format
+    return None
+
+
+def read_records(lines, file_format):
+    """
+    Yields line number and record of each catalogue line, record is
+    InvalidRecord for lines which can not be decoded.
+    Lines are read one at a time, so memory does not grow with file.
+    """
+    if file_format == 'csv':
+        reader = csv.DictReader(lines)
+        for record in reader:
+            yield reader.line_num, record
+    elif file_format == 'jsonl':
+        for line, text in enumerate(lines, 1):
+            if not text.strip():
+                continue
+            try:
+                record = json.loads(text)
+            except ValueError as error:
+                record = InvalidRecord('invalid JSON: {}'.format(error))
+            else:
+                if not isinstance(record, dict):
+                    record = InvalidRecord('record is not an object')
+            yield line, record
+    else:
+        raise ValueError('Unknown format: {}'.format(file_format))
+
+
+def parse_date(value, field):
+    """
+    Returns date from YYYY-MM-DD string.
+    """
+    try:
+        return datetime.datetime.strptime(
+            str(value or '').strip(), '%Y-%m-%d',
+        ).date()
+    except ValueError:
+        raise InvalidRecord('invalid {}: {!r}'.format(field, value))
+
+
+def catalogue_row(record, companies):
+    """
+    Returns food row of catalogue record, raises InvalidRecord.
+    Type may be given as 'type' or 'o_type'.
+    """
+    company = str(record.get('company') or '').strip()
+    if company not in companies:
+        raise InvalidRecord('unknown company: {!r}'.format(company))
+    description = str(record.get('description') or '').strip()
+    if not description:
+        raise InvalidRecord('missing description')
+    if len(description) > Food.description.type.length:
+        raise InvalidRecord('description too long')
+    try:
+        cost = make_money(str(record.get('cost')).replace(',', '.'))
+    except decimal.InvalidOperation:
+        cost = None
+    if cost is None or not cost.is_finite():
+        raise InvalidRecord('invalid cost: {!r}'.format(record.get('cost')))
+    if not 0.01 <= cost <= 999.99:
+        raise InvalidRecord('cost out of range: {}'.format(cost))
+    o_type = str(record.get('type') or record.get('o_type') or '').strip()
+    if o_type not in FOOD_TYPES:
+        raise InvalidRecord('unknown type: {!r}'.format(o_type))
+    date_from = parse_date(record.get('available_from'), 'available_from')
+    date_to = parse_date(record.get('available_to'), 'available_to')
+    if date_from > date_to:
+        raise InvalidRecord('available_from after available_to')
+    if (date_to - date_from).days > MAX_AVAILABILITY_DAYS:
+        raise InvalidRecord(
+            'available longer than {} days'.format(MAX_AVAILABILITY_DAYS)
+        )
+    return food_row(description, cost, o_type, date_from, date_to, company)
+
+
+def import_foods(lines, file_format, batch_size=IMPORT_BATCH_SIZE):
+    """
+    Validates and bulk-inserts foods of CSV or JSON Lines catalogue.
+    Columns: company, description, cost, type, available_from,
+    available_to (YYYY-MM-DD). Each batch is committed, so memory
+    and transaction size do not grow with catalogue.
+    Returns ImportReport.
+    """
+    companies = {company.name for company in get_companies()}
+    report = ImportReport()
+    batch = []
+    for line, record in read_records(lines, file_format):
+        try:
+            if isinstance(record, InvalidRecord):
+                raise record
+            batch.append(catalogue_row(record, companies))
+        except InvalidRecord as error:
+            report.add_error(line, error)
+        if len(batch) >= batch_size:
+            report.add_batch(insert_foods(batch))
+            db.session.commit()
+            batch = []
+    if batch:
+        report.add_batch(insert_foods(batch))
+        db.session.commit()
+    return report
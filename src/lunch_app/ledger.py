@@ -0,0 +1,178 @@
+# -*- coding: utf-8 -*-
+# pylint: disable=invalid-name, no-member, unused-argument
+"""
+Monthly ledger of user orders kept in sync with orders.
+"""
+from sqlalchemy import (
+    Integer, and_, cast, extract, func, inspect, select,
+)
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.orm import Session
+
+from .main import db
+from .models import MonthlyLedger, Order
+from .utils import month_range
+
+# changes of these order attributes move it between ledger rows
+LEDGER_SOURCES = ('user_id', 'order_day', 'cost')
+LEDGER_COLUMNS = (
+    'user_id', 'year', 'month', 'number_of_orders', 'month_cost',
+)
+
+orders = Order.__table__
+ledger = MonthlyLedger.__table__
+
+
+def ledger_rows(*criteria):
+    """
+    Returns select of ledger rows counted from orders matching criteria.
+    """
+    year = cast(extract('year', orders.c.order_day), Integer)
+    month = cast(extract('month', orders.c.order_day), Integer)
+    return select([
+        orders.c.user_id,
+        year,
+        month,
+        func.count(orders.c.id),
+        func.coalesce(func.sum(orders.c.cost), 0),
+    ]).where(and_(
+        orders.c.user_id.isnot(None),
+        orders.c.order_day.isnot(None),
+        *criteria
+    )).group_by(orders.c.user_id, year, month)
+
+
+def order_months(order):
+    """
+    Returns (user_id, year, month) of ledger rows which counted order
+    before its change and which count it after.
+    """
+    state = inspect(order)
+    user_ids = set(state.attrs.user_id.history.sum()) | {order.user_id}
+    days = set(state.attrs.order_day.history.sum()) | {order.order_day}
+    return {
+        (user_id, day.year, day.month)
+        for user_id in user_ids if user_id is not None
+        for day in days if day is not None
+    }
+
+
+def ledger_outdated(session, order):
+    """
+    Tells if order is new, deleted or moved or changed cost.
+    """
+    if order in session.new or order in session.deleted:
+        return True
+    attributes = inspect(order).attrs
+    return any(
+        attributes[name].history.has_changes() for name in LEDGER_SOURCES
+    )
+
+
+def upsert_ledger_rows(connection, rows):
+    """
+    Inserts ledger rows counted by select or updates stored ones,
+    so that concurrent refreshes of one row do not collide on its
+    unique key. Needs PostgreSQL.
+    """
+    statement = postgresql.insert(ledger).from_select(LEDGER_COLUMNS, rows)
+    connection.execute(statement.on_conflict_do_update(
+        index_elements=[ledger.c.year, ledger.c.month, ledger.c.user_id],
+        set_={
+            'number_of_orders': statement.excluded.number_of_orders,
+            'month_cost': statement.excluded.month_cost,
+        },
+    ))
+
+
+def refresh_ledger(connection, keys):
+    """
+    Counts again ledger rows of given (user_id, year, month) keys.
+    PostgreSQL upserts counted rows and deletes rows left without
+    orders. Other databases (SQLite) serialize writers, there rows
+    of month are deleted and inserted again.
+    """
+    users_by_month = {}
+    for user_id, year, month in keys:
+        users_by_month.setdefault((year, month), set()).add(user_id)
+    upsert = connection.dialect.name == 'postgresql'
+    for (year, month), user_ids in sorted(users_by_month.items()):
+        month_begin, month_end = month_range(year, month)
+        criteria = (
+            orders.c.order_day >= month_begin,
+            orders.c.order_day < month_end,
+            orders.c.user_id.in_(user_ids),
+        )
+        stored = and_(
+            ledger.c.year == year,
+            ledger.c.month == month,
+            ledger.c.user_id.in_(user_ids),
+        )
+        if upsert:
+            upsert_ledger_rows(connection, ledger_rows(*criteria))
+            ordering_users = select([orders.c.user_id]).where(and_(
+                orders.c.user_id.isnot(None), *criteria
+            ))
+            connection.execute(ledger.delete().where(and_(
+                stored, ledger.c.user_id.notin_(ordering_users),
+            )))
+        else:
+            connection.execute(ledger.delete().where(stored))
+            connection.execute(ledger.insert().from_select(
+                LEDGER_COLUMNS, ledger_rows(*criteria),
+            ))
+
+
+def rebuild_ledger():
+    """
+    Counts whole ledger again from orders and commits.
+    Returns number of ledger rows.
+    """
+    db.session.execute(ledger.delete())
+    db.session.execute(
+        ledger.insert().from_select(LEDGER_COLUMNS, ledger_rows())
+    )
+    db.session.commit()
+    return MonthlyLedger.query.count()
+
+
+def collect_ledger_months(session, flush_context, instances):
+    """
+    Remembers ledger rows touched by written orders, so that every way
+    of writing orders (views, API, admin) keeps ledger up to date.
+    """
+    with session.no_autoflush:
+        keys = set()
+        for record in (
+                list(session.new) + list(session.dirty)
+                + list(session.deleted)
+        ):
+            if isinstance(record, Order) and \
+                    ledger_outdated(session, record):
+                keys |= order_months(record)
+    if keys:
+        session.info.setdefault('ledger_months', set()).update(keys)
+
+
+def update_ledger(session, flush_context):
+    """
+    Counts touched ledger rows again within flushed transaction.
+    """
+    keys = session.info.pop('ledger_months', None)
+    if keys:
+        refresh_ledger(session.connection(), keys)
+
+
+def forget_ledger_months(session, previous_transaction):
+    """
+    Nothing was written when transaction is rolled back.
+    """
+    session.info.pop('ledger_months', None)
+
+
+# session listeners registered by main.init_listeners
+LISTENERS = (
+    (Session, 'before_flush', collect_ledger_months),
+    (Session, 'after_flush', update_ledger),
+    (Session, 'after_soft_rollback', forget_ledger_months),
+)
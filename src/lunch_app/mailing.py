@@ -0,0 +1,371 @@
+# -*- coding: utf-8 -*-
+# pylint: disable=invalid-name, no-member, broad-except
+"""
+Mail outbox written with application data and sent in background.
+"""
+from collections import OrderedDict
+import datetime
+import logging
+import smtplib
+import socket
+import threading
+import time
+import uuid
+
+from flask.ext.mail import Message
+
+from .main import app, db, mail
+from .models import OutboxMail
+
+log = logging.getLogger(__name__)
+
+BATCH_SIZE = 50
+MAX_ATTEMPTS = 6
+MAX_RETRY_DELAY = datetime.timedelta(hours=1)
+# claimed mails are not sent by other workers for this long,
+# mails of worker which died while sending are sent again after it
+CLAIM_TIMEOUT = datetime.timedelta(minutes=10)
+MAX_PER_CONNECTION = 100
+MAX_RECIPIENTS = 50
+CONNECTIONS = 1
+SENT = 'sent'
+
+# errors of single message, connection is still usable after them
+MESSAGE_ERRORS = (
+    smtplib.SMTPRecipientsRefused,
+    smtplib.SMTPSenderRefused,
+    smtplib.SMTPDataError,
+)
+CONNECTION_ERRORS = (smtplib.SMTPException, socket.error)
+
+
+def chunks(items, size):
+    """
+    Splits list into lists of at most size items.
+    """
+    return [items[i:i + size] for i in range(0, len(items), size)]
+
+
+def queue_mail(subject, recipients, body):
+    """
+    Adds mail to outbox in current transaction, caller commits.
+    Recipients are split into MAIL_MAX_RECIPIENTS sized chunks,
+    each chunk is sent and retried as separate mail.
+    Returns list of queued mails.
+    """
+    recipients = [recipient for recipient in recipients if recipient]
+    max_recipients = app.config.get('MAIL_MAX_RECIPIENTS', MAX_RECIPIENTS)
+    outbox_mails = []
+    for chunk in chunks(recipients, max_recipients):
+        outbox_mail = OutboxMail(
+            subject=subject,
+            recipients='\n'.join(chunk),
+            body=body,
+        )
+        db.session.add(outbox_mail)
+        outbox_mails.append(outbox_mail)
+    return outbox_mails
+
+
+def retry_delay(attempts):
+    """
+    Returns exponential delay before next attempt.
+    """
+    delay = datetime.timedelta(minutes=2 ** (attempts - 1))
+    return min(delay, MAX_RETRY_DELAY)
+
+
+def make_message(outbox_mail):
+    """
+    Returns Message for outbox mail.
+    """
+    message = Message(
+        outbox_mail.subject,
+        recipients=outbox_mail.recipients.split('\n'),
+    )
+    message.body = outbox_mail.body
+    return message
+
+
+def mark_sent(outbox_mail):
+    """
+    Removes mail from queue as sent.
+    """
+    outbox_mail.attempts = (outbox_mail.attempts or 0) + 1
+    outbox_mail.sent = datetime.datetime.utcnow()
+    outbox_mail.next_attempt = None
+
+
+def mark_failed(outbox_mail, error, now):
+    """
+    Schedules next attempt, after MAX_ATTEMPTS mail is left unsent.
+    """
+    outbox_mail.attempts = (outbox_mail.attempts or 0) + 1
+    outbox_mail.last_error = str(error)[:400]
+    if outbox_mail.attempts < MAX_ATTEMPTS:
+        outbox_mail.next_attempt = now + retry_delay(outbox_mail.attempts)
+    else:
+        outbox_mail.next_attempt = None
+
+
+class BulkReport(object):
+    """
+    Result of bulk sending with per-recipient status and throughput.
+    """
+
+    def __init__(self):
+        self.results = []
+        self.statuses = OrderedDict()
+        self.sent = 0
+        self.failed = 0
+        self.recipients = 0
+        self.connections = 0
+        self.started = time.time()
+        self.elapsed = 0.0
+
+    def record(self, message, error=None):
+        """
+        Stores status of sent message, error is None on success.
+        """
+        self.results.append((message, error))
+        self.recipients += len(message.send_to)
+        if error is None:
+            self.sent += 1
+        else:
+            self.failed += 1
+        refused = getattr(error, 'recipients', None) or {}
+        for recipient in message.send_to:
+            if error is None:
+                self.statuses[recipient] = SENT
+            else:
+                self.statuses[recipient] = str(refused.get(recipient, error))
+
+    @classmethod
+    def merge(cls, reports, started):
+        """
+        Joins reports of messages dealt round-robin between connections.
+        """
+        report = cls()
+        report.started = started
+        count = sum(len(part.results) for part in reports)
+        for position in range(count):
+            part = reports[position % len(reports)]
+            report.record(*part.results[position // len(reports)])
+        report.connections = sum(part.connections for part in reports)
+        return report
+
+    def finish(self):
+        """
+        Stops time measurement.
+        """
+        self.elapsed = time.time() - self.started
+        return self
+
+    @property
+    def per_second(self):
+        """
+        Returns number of messages handled per second.
+        """
+        if not self.elapsed:
+            return 0.0
+        return (self.sent + self.failed) / self.elapsed
+
+
+class BulkSender(object):
+    """
+    Sends many messages reusing one SMTP connection.
+    Connection is renewed after max_per_connection messages and
+    reopened once when server drops it in the middle of sending.
+    """
+
+    def __init__(self, max_per_connection=MAX_PER_CONNECTION, report=None):
+        self.max_per_connection = max_per_connection
+        self.report = report or BulkReport()
+        self.connection = None
+        self.count = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def open(self):
+        """
+        Opens new connection.
+        """
+        connection = mail.connect()
+        connection.__enter__()
+        self.connection = connection
+        self.count = 0
+        self.report.connections += 1
+
+    def close(self):
+        """
+        Closes current connection, errors of broken one are ignored.
+        """
+        connection, self.connection = self.connection, None
+        if connection is None:
+            return
+        try:
+            connection.__exit__(None, None, None)
+        except CONNECTION_ERRORS:
+            log.warning('Closing mail server connection failed')
+
+    def send(self, message):
+        """
+        Sends message, raises when message was rejected or server
+        is unreachable.
+        """
+        for attempt in range(2):
+            if self.connection is None:
+                self.open()
+            try:
+                self.connection.send(message)
+            except MESSAGE_ERRORS:
+                raise
+            except CONNECTION_ERRORS:
+                self.close()
+                if attempt:
+                    raise
+                log.warning('Mail server connection lost, reconnecting')
+            else:
+                break
+        self.count += 1
+        if self.count >= self.max_per_connection:
+            self.close()
+
+
+def send_messages(messages, max_per_connection, report):
+    """
+    Sends messages one by one over one connection.
+    When mail server can not be reached remaining messages are
+    reported as failed without further attempts.
+    """
+    with BulkSender(max_per_connection, report) as sender:
+        for position, message in enumerate(messages):
+            try:
+                sender.send(message)
+            except MESSAGE_ERRORS as error:
+                log.warning('Mail to %s rejected: %s', message.send_to, error)
+                report.record(message, error)
+            except CONNECTION_ERRORS as error:
+                log.exception('Mail server connection failed')
+                for unsent in messages[position:]:
+                    report.record(unsent, error)
+                break
+            except Exception as error:
+                log.exception('Mail to %s failed', message.send_to)
+                report.record(message, error)
+            else:
+                report.record(message)
+
+
+def send_messages_in_context(application, messages, max_per_connection,
+                             report):
+    """
+    Sends messages from separate thread.
+    """
+    with application.app_context():
+        send_messages(messages, max_per_connection, report)
+
+
+def send_bulk(messages, max_per_connection=MAX_PER_CONNECTION,
+              connections=CONNECTIONS):
+    """
+    Sends messages over given number of parallel connections
+    and returns BulkReport with results in order of messages.
+    """
+    started = time.time()
+    messages = list(messages)
+    connections = max(1, min(connections, len(messages)))
+    reports = [BulkReport() for _ in range(connections)]
+    if connections == 1:
+        send_messages(messages, max_per_connection, reports[0])
+    else:
+        threads = [
+            threading.Thread(
+                target=send_messages_in_context,
+                args=(
+                    app,
+                    messages[number::connections],
+                    max_per_connection,
+                    reports[number],
+                ),
+            )
+            for number in range(connections)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    report = BulkReport.merge(reports, started).finish()
+    log.info(
+        'Sent %s, failed %s mails to %s recipients in %.2fs (%.1f/s) '
+        'over %s connections',
+        report.sent, report.failed, report.recipients, report.elapsed,
+        report.per_second, report.connections,
+    )
+    return report
+
+
+def claim_outbox(batch_size, now):
+    """
+    Takes batch of due mails for this worker and commits, so that
+    concurrent workers never get the same mail.
+    Returns claimed mails.
+    """
+    claim = uuid.uuid4().hex
+    due = db.session.query(OutboxMail.id).filter(
+        OutboxMail.next_attempt <= now,
+    ).order_by(OutboxMail.id).limit(batch_size)
+    # condition is checked again on update, when other worker claimed
+    # the mail first it is skipped here
+    OutboxMail.query.filter(
+        OutboxMail.id.in_(due.subquery()),
+        OutboxMail.next_attempt <= now,
+    ).update({
+        OutboxMail.claim: claim,
+        OutboxMail.next_attempt: now + CLAIM_TIMEOUT,
+    }, synchronize_session=False)
+    db.session.commit()
+    return OutboxMail.query.filter(
+        OutboxMail.claim == claim,
+    ).order_by(OutboxMail.id).all()
+
+
+def dispatch_outbox(batch_size=BATCH_SIZE, now=None):
+    """
+    Sends batch of due mails in bulk and commits their status.
+    Returns number of sent and failed mails.
+    """
+    now = now or datetime.datetime.utcnow()
+    outbox_mails = claim_outbox(batch_size, now)
+    if not outbox_mails:
+        return 0, 0
+    report = send_bulk(
+        [make_message(outbox_mail) for outbox_mail in outbox_mails],
+        connections=app.config.get('MAIL_CONNECTIONS', CONNECTIONS),
+    )
+    for outbox_mail, (_message, error) in zip(outbox_mails, report.results):
+        if error is None:
+            mark_sent(outbox_mail)
+        else:
+            mark_failed(outbox_mail, error, now)
+    db.session.commit()
+    return report.sent, report.failed
+
+
+def dispatch_cycle(batch_size=BATCH_SIZE):
+    """
+    Runs one mail worker cycle. Errors are logged and rolled back,
+    so that worker keeps running, claimed mails are retried after
+    CLAIM_TIMEOUT.
+    Returns number of sent and failed mails, None when cycle failed.
+    """
+    try:
+        return dispatch_outbox(batch_size)
+    except Exception:
+        log.exception('Mail worker cycle failed')
+        db.session.rollback()
+        return None
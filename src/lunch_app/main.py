@@ -82,6 +82,32 @@ def init_admin():
     admin.add_view(AdminModelViewWithAuth(models.Company, db.session))
 
 
+def init_cache():
+    """
+    Share reference data cache invalidation between uWSGI workers.
+    """
+    from . import cache
+    path = app.config.get('CACHE_GENERATION_FILE')
+    if path:
+        cache.init_generation(path)
+
+
+def init_listeners():
+    """
+    Register session and mapper listeners keeping derived tables and
+    cache in sync, in order they run: ids of companies and users are
+    resolved before menu days of foods are written, order items are
+    matched with menu and monthly ledger is counted. Cache is
+    invalidated last.
+    """
+    from sqlalchemy import event
+    from . import cache, ledger, menu, orders, references
+    for module in (references, menu, orders, ledger, cache):
+        for target, identifier, function in module.LISTENERS:
+            if not event.contains(target, identifier, function):
+                event.listen(target, identifier, function)
+
+
 def init():
     """
     Configure some elements of application.
@@ -92,6 +118,8 @@ def init():
     init_social_login()
     init_api()
     init_admin()
+    init_cache()
+    init_listeners()
     mail.init_app(app)
 
 
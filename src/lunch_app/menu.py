@@ -0,0 +1,186 @@
+# -*- coding: utf-8 -*-
+# pylint: disable=invalid-name, no-member, unused-argument
+"""
+Menu of available food materialized per day.
+"""
+import datetime
+
+from sqlalchemy import and_, inspect, literal, select
+
+from .main import db
+from .models import Food, MenuDay, MenuWindow
+from .utils import make_datetime
+
+# extend_menu, run daily by scheduler, fills menu_day from this many
+# days ago up to this many days ahead and stores filled days in
+# menu_window, other days are read from food availability ranges
+MENU_HORIZON_DAYS = 62
+
+
+def as_date(value):
+    """
+    Returns date part of date or datetime.
+    """
+    if isinstance(value, datetime.datetime):
+        return value.date()
+    return value
+
+
+def menu_window(today=None):
+    """
+    Returns first and last day extend_menu fills for given day.
+    """
+    today = today or datetime.date.today()
+    horizon = datetime.timedelta(days=MENU_HORIZON_DAYS)
+    return today - horizon, today + horizon
+
+
+def filled_window(connection=None):
+    """
+    Returns first and last day menu_day is filled for,
+    None until extend_menu ran.
+    """
+    window = MenuWindow.__table__
+    row = (connection or db.session).execute(
+        select([window.c.first_day, window.c.last_day])
+    ).first()
+    return (row.first_day, row.last_day) if row else None
+
+
+def food_days(date_from, date_to, window):
+    """
+    Returns days between given dates, both ends included,
+    which are in given filled window.
+    """
+    if date_from is None or date_to is None or window is None:
+        return []
+    first_day, last_day = window
+    day = max(as_date(date_from), first_day)
+    last_day = min(as_date(date_to), last_day)
+    days = []
+    while day <= last_day:
+        days.append(day)
+        day += datetime.timedelta(days=1)
+    return days
+
+
+def available_on(day):
+    """
+    Returns criteria of foods available on given day, read from their
+    availability range.
+    """
+    return and_(
+        Food.date_available_from
+        < make_datetime(day + datetime.timedelta(days=1)),
+        Food.date_available_to >= make_datetime(day),
+    )
+
+
+def available_foods(query, day):
+    """
+    Filters query of foods to the ones available on given day,
+    with menu_day table inside its filled window.
+    """
+    window = filled_window()
+    if window is not None and window[0] <= day <= window[1]:
+        return query.join(
+            MenuDay,
+            MenuDay.food_id == Food.id,
+        ).filter(MenuDay.day == day)
+    return query.filter(available_on(day))
+
+
+def extend_menu(today=None):
+    """
+    Moves menu window to given day and commits: drops days before it
+    and adds missing foods of its new days. Run daily by scheduler.
+    """
+    first_day, last_day = menu_window(today)
+    one_day = datetime.timedelta(days=1)
+    menu_day = MenuDay.__table__
+    window = MenuWindow.__table__
+    filled = filled_window()
+    db.session.execute(menu_day.delete().where(menu_day.c.day < first_day))
+    db.session.execute(window.delete())
+    day = first_day
+    if filled is not None and filled[0] <= first_day <= filled[1] + one_day:
+        # days of previous window are complete already
+        day = filled[1] + one_day
+        last_day = max(last_day, filled[1])
+    db.session.execute(
+        window.insert(), {'first_day': first_day, 'last_day': last_day},
+    )
+    while day <= last_day:
+        stored = select([menu_day.c.food_id]).where(menu_day.c.day == day)
+        db.session.execute(menu_day.insert().from_select(
+            ['day', 'food_id'],
+            select([literal(day, MenuDay.day.type), Food.id]).where(and_(
+                available_on(day),
+                Food.id.notin_(stored),
+            )),
+        ))
+        day += one_day
+    db.session.commit()
+
+
+def rebuild_food_menu(connection, food_id, date_from, date_to):
+    """
+    Replaces menu days of one food.
+    """
+    menu_day = MenuDay.__table__
+    connection.execute(menu_day.delete().where(menu_day.c.food_id == food_id))
+    rows = [
+        {'day': day, 'food_id': food_id}
+        for day in food_days(date_from, date_to, filled_window(connection))
+    ]
+    if rows:
+        connection.execute(menu_day.insert(), rows)
+
+
+def food_inserted(mapper, connection, food):
+    """
+    Adds new food to the menu of its days.
+    """
+    rebuild_food_menu(
+        connection,
+        food.id,
+        food.date_available_from,
+        food.date_available_to,
+    )
+
+
+def food_updated(mapper, connection, food):
+    """
+    Moves food between days when its availability changed.
+    """
+    attrs = inspect(food).attrs
+    if attrs.date_available_from.history.has_changes() \
+            or attrs.date_available_to.history.has_changes():
+        rebuild_food_menu(
+            connection,
+            food.id,
+            food.date_available_from,
+            food.date_available_to,
+        )
+
+
+def food_deleted(mapper, connection, food):
+    """
+    Removes food from the menu.
+    """
+    rebuild_food_menu(connection, food.id, None, None)
+
+
+# mapper listeners registered by main.init_listeners
+LISTENERS = (
+    (Food, 'after_insert', food_inserted),
+    (Food, 'after_update', food_updated),
+    (Food, 'before_delete', food_deleted),
+)
+
+
+def day_menu(day):
+    """
+    Returns query for food available on given day.
+    """
+    return available_foods(Food.query, day).order_by(Food.id)
@@ -3,21 +3,49 @@
 Models for lunch app db.
 """
 # pylint: disable=invalid-name, too-few-public-methods, no-init
+# pylint: disable=unused-argument
 
 from datetime import datetime
+from decimal import Decimal
 
 from flask.ext.login import UserMixin
 
 from sqlalchemy import Column
+from sqlalchemy.orm import column_property, validates
 from sqlalchemy.types import (
     Integer, String, Boolean,
     Unicode, DateTime, Float,
-    Date, PickleType,
+    Date, PickleType, UnicodeText,
+    TypeDecorator,
 )
 
 from sqlalchemy.ext.mutable import MutableDict
 
 from .main import db
+from .utils import make_money
+
+
+class Money(TypeDecorator):
+    """
+    Amount of PLN stored as integer number of grosze, read as Decimal.
+    """
+    impl = Integer
+
+    def process_bind_param(self, value, dialect):
+        """
+        Converts amount to grosze.
+        """
+        if value is None:
+            return None
+        return int(make_money(value) * 100)
+
+    def process_result_value(self, value, dialect):
+        """
+        Converts grosze to amount.
+        """
+        if value is None:
+            return None
+        return make_money(Decimal(int(value)).scaleb(-2))
 
 
 class User(db.Model, UserMixin):
@@ -59,13 +87,29 @@ class Order(db.Model):
     Order model for lunch app db.
     """
     __tablename__ = 'order'
+    __table_args__ = (
+        db.Index('ix_order_user_name_order_day', 'user_name', 'order_day'),
+        db.Index('ix_order_order_day_company', 'order_day', 'company'),
+        db.Index('ix_order_user_id_order_day', 'user_id', 'order_day'),
+        db.Index('ix_order_order_day_company_id', 'order_day', 'company_id'),
+        db.Index('ix_order_user_id_date_id', 'user_id', 'date', 'id'),
+    )
     id = Column(Integer, primary_key=True)
     description = Column(String(800), unique=False)
-    cost = Column(Float)
+    cost = Column(Money)
     arrival_time = Column(String(5))
     company = Column(String(80))
+    company_id = Column(Integer, db.ForeignKey('companies.id'))
     date = Column(DateTime, default=datetime.utcnow)
+    # previous values are loaded when they change, so that ledger row
+    # which counted order before is known at flush
+    order_day = column_property(
+        Column(Date, index=True), active_history=True,
+    )
     user_name = Column(String(80), db.ForeignKey('user.username'))
+    user_id = column_property(
+        Column(Integer, db.ForeignKey('user.id')), active_history=True,
+    )
 
     def __init__(
             self,
@@ -83,6 +127,24 @@ class Order(db.Model):
         if self.date is None:
             self.date = datetime.today()
 
+    @validates('cost')
+    def validate_cost(self, key, value):
+        """
+        Keeps cost as Decimal amount.
+        """
+        return make_money(value)
+
+    @validates('date')
+    def validate_date(self, key, value):
+        """
+        Keeps day of the order in sync with its date.
+        """
+        if isinstance(value, datetime):
+            self.order_day = value.date()
+        else:
+            self.order_day = value
+        return value
+
     def __repr__(self):
         """
         Returns orders id.
@@ -90,33 +152,125 @@ class Order(db.Model):
         return '<Order %r>' % self.id
 
 
+class OrderItem(db.Model):
+    """
+    Dish of an order, food is set when dish was chosen from menu.
+    Items are kept in sync with order description, see orders module.
+    """
+    __tablename__ = 'order_item'
+    id = Column(Integer, primary_key=True)
+    order_id = Column(
+        Integer, db.ForeignKey('order.id'), nullable=False, index=True,
+    )
+    position = Column(Integer, default=0)
+    food_id = Column(Integer, db.ForeignKey('food.id'), index=True)
+    description = Column(String(800))
+    random = Column(Boolean, default=False)
+    order = db.relationship(
+        Order,
+        backref=db.backref(
+            'items',
+            order_by=position,
+            cascade='all, delete-orphan',
+        ),
+    )
+    food = db.relationship('Food')
+
+
 class Food(db.Model):
     """
     Food model for lunch app db.
     """
     __tablename__ = 'food'
+    __table_args__ = (
+        db.Index(
+            'ix_food_company_available',
+            'company', 'date_available_from', 'date_available_to',
+        ),
+        db.Index(
+            'ix_food_available',
+            'date_available_from', 'date_available_to',
+        ),
+    )
     id = Column(Integer, primary_key=True)
     company = Column(String(80), unique=False)
+    company_id = Column(Integer, db.ForeignKey('companies.id'), index=True)
     description = Column(String(800), unique=False)
-    cost = Column(Float)
+    cost = Column(Money)
     date_available_from = Column(DateTime)
     date_available_to = Column(DateTime)
     o_type = Column(String(100))
     rating = Column(Float)
 
+    @validates('cost')
+    def validate_cost(self, key, value):
+        """
+        Keeps cost as Decimal amount.
+        """
+        return make_money(value)
+
+
+class MenuDay(db.Model):
+    """
+    Food available on given day, rebuilt on every food change.
+    Only days of MenuWindow are stored.
+    """
+    __tablename__ = 'menu_day'
+    day = Column(Date, primary_key=True)
+    food_id = Column(Integer, db.ForeignKey('food.id'), primary_key=True)
+
+
+class MenuWindow(db.Model):
+    """
+    Days menu_day is filled for, moved daily by menu.extend_menu.
+    """
+    __tablename__ = 'menu_window'
+    id = Column(Integer, primary_key=True)
+    first_day = Column(Date)
+    last_day = Column(Date)
+
 
 class Finance(db.Model):
     """
     Finance model - did user paid that month.
     """
     __tablename__ = 'finance'
+    __table_args__ = (
+        db.Index(
+            'ix_finance_user_year_month',
+            'user_name', 'year', 'month',
+            unique=True,
+        ),
+        db.Index('ix_finance_user_id_year_month', 'user_id', 'year', 'month'),
+    )
     id = Column(Integer, primary_key=True)
     user_name = Column(String(80), db.ForeignKey('user.username'))
+    user_id = Column(Integer, db.ForeignKey('user.id'))
     month = Column(Integer)
     year = Column(Integer)
     did_user_pay = Column(Boolean, default=False)
 
 
+class MonthlyLedger(db.Model):
+    """
+    Number and cost of user orders in month, kept up to date from orders.
+    """
+    __tablename__ = 'monthly_ledger'
+    __table_args__ = (
+        db.Index(
+            'ix_monthly_ledger_year_month_user_id',
+            'year', 'month', 'user_id',
+            unique=True,
+        ),
+    )
+    id = Column(Integer, primary_key=True)
+    user_id = Column(Integer, db.ForeignKey('user.id'), nullable=False)
+    year = Column(Integer, nullable=False)
+    month = Column(Integer, nullable=False)
+    number_of_orders = Column(Integer, nullable=False, default=0)
+    month_cost = Column(Money, nullable=False, default=0)
+
+
 class MailText(db.Model):
     """
     Mail text messages data base.
@@ -166,3 +320,48 @@ class Company(db.Model):
     address = Column(String(400))
     telephone = Column(String(20))
     date_added = Column(DateTime, default=datetime.utcnow)
+
+
+class OutboxMail(db.Model):
+    """
+    Mail waiting to be sent by mail worker.
+    """
+    __tablename__ = 'outbox'
+    id = Column(Integer, primary_key=True)
+    subject = Column(Unicode(200))
+    recipients = Column(UnicodeText)
+    body = Column(UnicodeText)
+    created = Column(DateTime, default=datetime.utcnow)
+    sent = Column(DateTime)
+    attempts = Column(Integer, default=0)
+    next_attempt = Column(DateTime, default=datetime.utcnow, index=True)
+    last_error = Column(Unicode(400))
+    claim = Column(String(32))
+
+
+class CrawlState(db.Model):
+    """
+    Validators and hash of last crawled version of restaurant page.
+    """
+    __tablename__ = 'crawl_state'
+    source = Column(String(50), primary_key=True)
+    etag = Column(String(200))
+    last_modified = Column(String(100))
+    content_hash = Column(String(64))
+    checked = Column(DateTime)
+    changed = Column(DateTime)
+    # day foods of the page were stored for
+    ingested = Column(Date)
+
+
+class ScheduledJob(db.Model):
+    """
+    Run history of scheduled background job.
+    """
+    __tablename__ = 'scheduled_job'
+    name = Column(String(50), primary_key=True)
+    next_run = Column(DateTime)
+    last_run = Column(DateTime)
+    last_success = Column(DateTime)
+    failures = Column(Integer, default=0)
+    last_error = Column(Unicode(400))
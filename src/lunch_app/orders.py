@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+# pylint: disable=invalid-name, no-member, unused-argument
+"""
+Order items kept in sync with order descriptions.
+"""
+from sqlalchemy import inspect
+from sqlalchemy.orm import Session
+
+from .menu import available_foods
+from .models import Food, Order, OrderItem
+
+RANDOM_ORDER_MARKER = '!RANDOM ORDER!'
+
+# changes of these order attributes rebuild its items
+ITEM_SOURCES = ('description', 'company_id', 'order_day')
+
+
+def normalize_dish(text):
+    """
+    Returns dish text as it is compared between orders and menu.
+    """
+    return (text or '').strip()
+
+
+def order_lines(description):
+    """
+    Returns dishes of order description and whether it is random order.
+    """
+    lines = [
+        normalize_dish(line)
+        for line in (description or '').replace('\r', '').split('\n')
+    ]
+    dishes = [line for line in lines if line and line != RANDOM_ORDER_MARKER]
+    return dishes, RANDOM_ORDER_MARKER in lines
+
+
+def menu_foods(session, order, dishes):
+    """
+    Returns ids of foods from menu of order day and company
+    by their normalized description.
+    """
+    if not dishes or order.order_day is None or order.company_id is None:
+        return {}
+    query = available_foods(
+        session.query(Food.id, Food.description), order.order_day,
+    ).filter(
+        Food.company_id == order.company_id,
+    ).order_by(Food.id)
+    dishes = set(dishes)
+    foods = {}
+    for food_id, description in query:
+        dish = normalize_dish(description)
+        if dish in dishes:
+            foods[dish] = food_id
+    return foods
+
+
+def order_items(session, order):
+    """
+    Returns items of order built from its description.
+    """
+    dishes, random = order_lines(order.description)
+    foods = menu_foods(session, order, dishes)
+    return [
+        OrderItem(
+            position=position,
+            description=dish,
+            food_id=foods.get(dish),
+            random=random,
+        )
+        for position, dish in enumerate(dishes)
+    ]
+
+
+def items_outdated(session, order):
+    """
+    Tells if order is new or its description, company or day changed.
+    """
+    if order in session.new:
+        return True
+    attributes = inspect(order).attrs
+    return any(
+        attributes[name].history.has_changes() for name in ITEM_SOURCES
+    )
+
+
+def sync_order_items(session, flush_context, instances):
+    """
+    Rebuilds items of new and changed orders, so that every way of
+    writing orders (views, API, admin) keeps them up to date.
+    """
+    orders = [
+        record for record in list(session.new) + list(session.dirty)
+        if isinstance(record, Order) and items_outdated(session, record)
+    ]
+    with session.no_autoflush:
+        for order in orders:
+            order.items = order_items(session, order)
+
+
+# session listeners registered by main.init_listeners
+LISTENERS = (
+    (Session, 'before_flush', sync_order_items),
+)
@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+# pylint: disable=invalid-name, no-member
+"""
+Keyset pagination of order lists.
+"""
+from collections import namedtuple
+from datetime import datetime
+
+from sqlalchemy import and_, or_
+
+from .models import Order
+
+PAGE_SIZE = 50
+CURSOR_FORMAT = '%Y-%m-%dT%H:%M:%S.%f'
+
+Page = namedtuple('Page', ('orders', 'next_cursor'))
+
+
+def make_cursor(order):
+    """
+    Returns cursor pointing after given order.
+    """
+    return '{}_{}'.format(order.date.strftime(CURSOR_FORMAT), order.id)
+
+
+def parse_cursor(cursor):
+    """
+    Returns (date, id) key from cursor, None for missing or broken one.
+    """
+    try:
+        date, order_id = cursor.rsplit('_', 1)
+        return datetime.strptime(date, CURSOR_FORMAT), int(order_id)
+    except (AttributeError, ValueError):
+        return None
+
+
+def orders_page(criteria, cursor=None, size=PAGE_SIZE):
+    """
+    Returns page of orders matching criteria, newest first, starting
+    after cursor. Rows are sought by (date, id) instead of skipped
+    with offset, so every page costs the same however long history is.
+    """
+    query = Order.query.filter(criteria)
+    key = parse_cursor(cursor)
+    if key is not None:
+        date, order_id = key
+        query = query.filter(
+            Order.date <= date,
+            or_(
+                Order.date < date,
+                and_(Order.date == date, Order.id < order_id),
+            ),
+        )
+    # one extra row tells if there is next page
+    orders = query.order_by(
+        Order.date.desc(), Order.id.desc(),
+    ).limit(size + 1).all()
+    if len(orders) > size:
+        return Page(orders[:size], make_cursor(orders[size - 1]))
+    return Page(orders, None)
@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+# pylint: disable=invalid-name, no-member
+"""
+Bulk updates of users monthly payments.
+"""
+from sqlalchemy import and_
+from sqlalchemy.exc import IntegrityError
+
+from .main import db
+from .models import Finance, User
+
+
+def _apply_payments(year, month, payments):
+    """
+    Updates existing records and inserts missing ones.
+    Issues at most five statements regardless of number of users.
+    """
+    month_filter = and_(Finance.year == year, Finance.month == month)
+    existing = {
+        user_name for (user_name,) in db.session.query(
+            Finance.user_name,
+        ).filter(
+            month_filter,
+            Finance.user_name.in_(list(payments)),
+        )
+    }
+    for did_user_pay in (True, False):
+        user_names = [
+            user_name for user_name in existing
+            if payments[user_name] == did_user_pay
+        ]
+        if user_names:
+            Finance.query.filter(
+                month_filter,
+                Finance.user_name.in_(user_names),
+            ).update(
+                {Finance.did_user_pay: did_user_pay},
+                synchronize_session=False,
+            )
+    new_names = [name for name in payments if name not in existing]
+    if new_names:
+        user_ids = dict(db.session.query(User.username, User.id).filter(
+            User.username.in_(new_names),
+        ))
+        missing = [
+            {
+                'user_name': user_name,
+                'user_id': user_ids.get(user_name),
+                'year': year,
+                'month': month,
+                'did_user_pay': payments[user_name],
+            }
+            for user_name in new_names
+        ]
+        db.session.execute(Finance.__table__.insert(), missing)
+
+
+def update_payments(year, month, payments):
+    """
+    Stores paid status of many users for given month and commits.
+    payments maps username to did_user_pay value.
+    Records are unique per (user_name, year, month), when concurrent
+    submit inserted some of them first the whole batch is applied again.
+    """
+    if not payments:
+        return
+    try:
+        _apply_payments(year, month, payments)
+        db.session.commit()
+    except IntegrityError:
+        db.session.rollback()
+        _apply_payments(year, month, payments)
+        db.session.commit()
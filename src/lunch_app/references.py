@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+# pylint: disable=invalid-name, no-member, unused-argument
+"""
+Integer company and user references kept in sync with their names.
+"""
+from sqlalchemy import inspect
+from sqlalchemy.orm import Session
+
+from .cache import get_companies
+from .models import Finance, Food, Order, User
+
+# model: (name attribute, id attribute) pairs
+REFERENCES = {
+    Order: (('company', 'company_id'), ('user_name', 'user_id')),
+    Food: (('company', 'company_id'),),
+    Finance: (('user_name', 'user_id'),),
+}
+
+
+def company_ids():
+    """
+    Returns ids of companies by their names.
+    """
+    return {company.name: company.id for company in get_companies()}
+
+
+def user_ids(session, usernames):
+    """
+    Returns ids of given users by their usernames.
+    """
+    if not usernames:
+        return {}
+    return dict(
+        session.query(User.username, User.id)
+        .filter(User.username.in_(usernames))
+    )
+
+
+def outdated_references(session, record):
+    """
+    Returns (name, id) attribute pairs of record whose name was set
+    or changed without setting its id.
+    """
+    if record in session.new:
+        return [
+            (name, id_name) for name, id_name in REFERENCES[type(record)]
+            if getattr(record, id_name) is None
+        ]
+    attributes = inspect(record).attrs
+    return [
+        (name, id_name) for name, id_name in REFERENCES[type(record)]
+        if attributes[name].history.has_changes()
+        and not attributes[id_name].history.has_changes()
+    ]
+
+
+def resolve_references(session, flush_context, instances):
+    """
+    Sets company and user ids of records written by name, e.g. from
+    forms or admin. Names of companies and users which do not exist
+    yet leave ids empty.
+    """
+    outdated = [
+        (record, outdated_references(session, record))
+        for record in list(session.new) + list(session.dirty)
+        if type(record) in REFERENCES
+    ]
+    outdated = [(record, pairs) for record, pairs in outdated if pairs]
+    if not outdated:
+        return
+    with session.no_autoflush:
+        ids = {
+            'company': company_ids(),
+            'user_name': user_ids(session, {
+                record.user_name for record, pairs in outdated
+                if ('user_name', 'user_id') in pairs
+            }),
+        }
+        for record, pairs in outdated:
+            for name, id_name in pairs:
+                setattr(record, id_name, ids[name].get(getattr(record, name)))
+
+
+# session listeners registered by main.init_listeners
+LISTENERS = (
+    (Session, 'before_flush', resolve_references),
+)
@@ -0,0 +1,389 @@
+# -*- coding: utf-8 -*-
+# pylint: disable=invalid-name, no-member
+"""
+Aggregated reports built with grouped database queries.
+"""
+from collections import Counter, OrderedDict, namedtuple
+import datetime
+
+from sqlalchemy import and_, case, extract, func, inspect
+
+from .cache import cache, register_stale_keys
+from .main import db
+from .models import (
+    Company, Order, OrderItem, User, Finance, MonthlyLedger,
+)
+from .utils import make_money, next_month
+
+ARRIVAL_TIMES = ('12:00', '13:00')
+
+MonthTotal = namedtuple('MonthTotal', 'year month orders cost')
+Balance = namedtuple('Balance', 'username months orders debt since')
+
+GRANULARITIES = ('day', 'week', 'month')
+COMPANY_SPEND = 'company_spend'
+BALANCE_SORTS = ('debt', 'username', 'months', 'since')
+
+
+def day_summary(day, companies):
+    """
+    Returns order details and dish counts for given day by company name.
+    Cost totals and dishes are counted by the database grouped
+    by company and arrival time.
+    """
+    day_filter = Order.order_day == day
+    names = {company.id: company.name for company in companies}
+    order_details = {}
+    orders_summary = {arrival_time: {} for arrival_time in ARRIVAL_TIMES}
+    for name in names.values():
+        order_details[name] = {
+            '12:00': [],
+            'cost12': 0,
+            '13:00': [],
+            'cost13': 0,
+        }
+        for arrival_time in ARRIVAL_TIMES:
+            orders_summary[arrival_time][name] = Counter()
+
+    costs = db.session.query(
+        Order.company_id,
+        Order.arrival_time,
+        func.sum(Order.cost),
+    ).filter(day_filter).group_by(Order.company_id, Order.arrival_time)
+    for company_id, arrival_time, cost in costs:
+        if company_id in names and arrival_time in ARRIVAL_TIMES:
+            order_details[names[company_id]]['cost' + arrival_time[:2]] = cost
+
+    dishes = db.session.query(
+        Order.company_id,
+        Order.arrival_time,
+        OrderItem.description,
+        func.count(OrderItem.id),
+    ).join(
+        OrderItem, OrderItem.order_id == Order.id,
+    ).filter(day_filter).group_by(
+        Order.company_id, Order.arrival_time, OrderItem.description,
+    ).order_by(func.min(OrderItem.id))
+    for company_id, arrival_time, description, count in dishes:
+        if company_id in names and arrival_time in ARRIVAL_TIMES:
+            summary = orders_summary[arrival_time][names[company_id]]
+            summary[description] = count
+
+    orders = Order.query.filter(day_filter).order_by(Order.id)
+    for order in orders:
+        if order.company_id in names \
+                and order.arrival_time in ARRIVAL_TIMES:
+            details = order_details[names[order.company_id]]
+            details[order.arrival_time].append(order)
+
+    return order_details, orders_summary
+
+
+def popular_dishes(day, limit):
+    """
+    Returns most often ordered dishes of given day with their company,
+    number of orders, food, first order containing them and first order
+    of that dish alone, which tells its cost.
+    """
+    dishes_per_order = db.session.query(
+        OrderItem.order_id.label('order_id'),
+        func.count(OrderItem.id).label('dishes'),
+    ).join(
+        Order, Order.id == OrderItem.order_id,
+    ).filter(
+        Order.order_day == day,
+    ).group_by(OrderItem.order_id).subquery()
+    return db.session.query(
+        OrderItem.description.label('description'),
+        Company.name.label('company'),
+        func.count(OrderItem.id).label('orders'),
+        func.max(OrderItem.food_id).label('food_id'),
+        func.min(Order.id).label('first_order_id'),
+        func.min(case(
+            [(dishes_per_order.c.dishes == 1, Order.id)],
+        )).label('single_order_id'),
+    ).join(
+        Order, Order.id == OrderItem.order_id,
+    ).join(
+        dishes_per_order, dishes_per_order.c.order_id == Order.id,
+    ).join(
+        Company, Company.id == Order.company_id,
+    ).filter(
+        Order.order_day == day,
+    ).group_by(
+        OrderItem.description, Company.id, Company.name,
+    ).order_by(
+        func.count(OrderItem.id).desc(), func.min(Order.id),
+    ).limit(limit).all()
+
+
+def orders_cost(*criteria):
+    """
+    Returns total cost of orders matching given criteria.
+    """
+    return db.session.query(
+        func.coalesce(func.sum(Order.cost), 0),
+    ).filter(*criteria).scalar()
+
+
+def months(begin, end):
+    """
+    Returns (year, month) of every month between begin and end,
+    end is exclusive.
+    """
+    result = []
+    year, month = begin.year, begin.month
+    while (year, month) < (end.year, end.month) \
+            or (year, month) == (end.year, end.month) and end.day > 1:
+        result.append((year, month))
+        year, month = next_month(year, month)
+    return result
+
+
+def monthly_orders(begin, end, *criteria):
+    """
+    Returns MonthTotal of orders matching criteria for every month
+    between begin and end (exclusive), months without orders too.
+    Whole range is counted by one grouped query, e.g. a year, quarter
+    or several years.
+    """
+    year = extract('year', Order.order_day)
+    month = extract('month', Order.order_day)
+    rows = db.session.query(
+        year,
+        month,
+        func.count(Order.id),
+        func.sum(Order.cost),
+    ).filter(
+        Order.order_day >= begin,
+        Order.order_day < end,
+        *criteria
+    ).group_by(year, month)
+    totals = {
+        (int(row_year), int(row_month)): (orders, cost)
+        for row_year, row_month, orders, cost in rows
+    }
+    return [
+        MonthTotal(year, month, *totals.get((year, month), (0, make_money(0))))
+        for year, month in months(begin, end)
+    ]
+
+
+def finance_report(year, month, did_pay=0):
+    """
+    Returns users monthly order count, cost and payment status,
+    read from monthly ledger. Users without costs in given month
+    are skipped.
+    did_pay = 0 - no filter
+    did_pay = 1 - filter only paid
+    did_pay = 2 - filter only unpaid
+    """
+    payments = db.session.query(
+        Finance.user_id.label('user_id'),
+        func.max(case([(Finance.did_user_pay, 1)], else_=0)).label('paid'),
+    ).filter(
+        and_(
+            Finance.month == month,
+            Finance.year == year,
+        )
+    ).group_by(Finance.user_id).subquery()
+    did_user_pay = func.coalesce(payments.c.paid, 0)
+
+    query = db.session.query(
+        User.username,
+        MonthlyLedger.number_of_orders,
+        MonthlyLedger.month_cost,
+        did_user_pay,
+    ).join(
+        MonthlyLedger, MonthlyLedger.user_id == User.id,
+    ).outerjoin(
+        payments, payments.c.user_id == User.id,
+    ).filter(
+        MonthlyLedger.year == year,
+        MonthlyLedger.month == month,
+        MonthlyLedger.month_cost != 0,
+    )
+    if did_pay == 1:
+        query = query.filter(did_user_pay == 1)
+    elif did_pay == 2:
+        query = query.filter(did_user_pay == 0)
+
+    finance_data = OrderedDict()
+    for username, number_of_orders, month_cost, paid in \
+            query.order_by(User.id):
+        finance_data[username] = {
+            'username': username,
+            'number_of_orders': number_of_orders,
+            'month_cost': month_cost,
+            'did_user_pay': bool(paid),
+        }
+    return finance_data
+
+
+def outstanding_balances(sort='debt'):
+    """
+    Returns unpaid orders cost of users summed over all months, read
+    from monthly ledger in one grouped query, biggest debt first
+    or sorted by username, number of unpaid months or oldest of them.
+    """
+    first_month = func.min(MonthlyLedger.year * 100 + MonthlyLedger.month)
+    debt = func.sum(MonthlyLedger.month_cost)
+    unpaid_months = func.count(MonthlyLedger.id)
+    orderings = {
+        'debt': (debt.desc(), User.username),
+        'username': (User.username,),
+        'months': (unpaid_months.desc(), User.username),
+        'since': (first_month, User.username),
+    }
+    if sort not in orderings:
+        raise ValueError('Unknown sort: {}'.format(sort))
+    query = db.session.query(
+        User.username,
+        unpaid_months,
+        func.sum(MonthlyLedger.number_of_orders),
+        debt,
+        first_month,
+    ).join(
+        MonthlyLedger, MonthlyLedger.user_id == User.id,
+    ).outerjoin(
+        Finance, and_(
+            Finance.user_id == MonthlyLedger.user_id,
+            Finance.year == MonthlyLedger.year,
+            Finance.month == MonthlyLedger.month,
+            Finance.did_user_pay.is_(True),
+        ),
+    ).filter(
+        Finance.id.is_(None),
+        MonthlyLedger.month_cost != 0,
+    ).group_by(User.id, User.username).order_by(*orderings[sort])
+    return [
+        Balance(username, months, number_of_orders, month_cost,
+                divmod(since, 100))
+        for username, months, number_of_orders, month_cost, since in query
+    ]
+
+
+def period_start(day, granularity):
+    """
+    Returns first day of day, week (Monday) or month containing day.
+    """
+    if granularity == 'week':
+        return day - datetime.timedelta(days=day.weekday())
+    if granularity == 'month':
+        return day.replace(day=1)
+    return day
+
+
+def next_period(start, granularity):
+    """
+    Returns first day of period following the one starting at start.
+    """
+    if granularity == 'week':
+        return start + datetime.timedelta(days=7)
+    if granularity == 'month':
+        return datetime.date(*next_month(start.year, start.month) + (1,))
+    return start + datetime.timedelta(days=1)
+
+
+def periods(begin, end, granularity):
+    """
+    Returns start days of periods overlapping days from begin to end,
+    end is exclusive.
+    """
+    if granularity not in GRANULARITIES:
+        raise ValueError('Unknown granularity: {}'.format(granularity))
+    starts = []
+    start = period_start(begin, granularity)
+    while start < end:
+        starts.append(start)
+        start = next_period(start, granularity)
+    return starts
+
+
+def spend_by_period(begin, end, granularity):
+    """
+    Returns costs of orders by period start and company id,
+    counted by one query grouped by company and day.
+    """
+    spend = {}
+    rows = db.session.query(
+        Order.company_id,
+        Order.order_day,
+        func.sum(Order.cost),
+    ).filter(
+        Order.order_day >= begin,
+        Order.order_day < end,
+    ).group_by(Order.company_id, Order.order_day)
+    for company_id, day, cost in rows:
+        costs = spend.setdefault(period_start(day, granularity), {})
+        costs[company_id] = costs.get(company_id, 0) + cost
+    return spend
+
+
+def company_spend(begin, end, granularity='month', today=None):
+    """
+    Returns start days of periods between begin and end (exclusive)
+    and costs of orders by company id for each period.
+    Periods which ended before today are cached, so only the current
+    one is counted again on next request.
+    """
+    today = today or datetime.date.today()
+    starts = periods(begin, end, granularity)
+    closed = [
+        start for start in starts
+        if begin <= start
+        and next_period(start, granularity) <= min(end, today)
+    ]
+
+    def load(keys):
+        """
+        Counts missing closed periods.
+        """
+        first = min(key[2] for key in keys)
+        last = next_period(max(key[2] for key in keys), granularity)
+        spend = spend_by_period(first, last, granularity)
+        return {key: spend.get(key[2], {}) for key in keys}
+
+    cached = cache.get_many(
+        [(COMPANY_SPEND, granularity, start) for start in closed], load,
+    )
+    spend = {key[2]: costs for key, costs in cached.items()}
+    # head, current and future periods are counted by day ranges
+    # between cached ones
+    runs = []
+    for start in starts:
+        if start in spend:
+            continue
+        if runs and runs[-1][1] == start:
+            runs[-1][1] = next_period(start, granularity)
+        else:
+            runs.append([start, next_period(start, granularity)])
+    for first, last in runs:
+        spend.update(spend_by_period(
+            max(begin, first), min(end, last), granularity,
+        ))
+    matrix = OrderedDict()
+    for index, start in enumerate(starts):
+        for company_id, cost in spend.get(start, {}).items():
+            row = matrix.setdefault(company_id, [make_money(0)] * len(starts))
+            row[index] = cost
+    return starts, matrix
+
+
+def stale_company_spend(order):
+    """
+    Returns cached periods changed by written order.
+    Orders of today only touch open periods, which are not cached.
+    """
+    today = datetime.date.today()
+    days = set(inspect(order).attrs.order_day.history.sum()) \
+        | {order.order_day}
+    return [
+        (COMPANY_SPEND, granularity, period_start(day, granularity))
+        for day in days if day is not None
+        for granularity in GRANULARITIES
+        if next_period(period_start(day, granularity), granularity) <= today
+    ]
+
+
+register_stale_keys(Order, stale_company_spend)
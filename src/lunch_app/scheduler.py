@@ -0,0 +1,221 @@
+# -*- coding: utf-8 -*-
+# pylint: disable=invalid-name, no-member, broad-except
+"""
+In-app scheduler of background jobs with cron-like schedules.
+"""
+from collections import OrderedDict
+import datetime
+from functools import partial
+import logging
+
+from .crawler import crawl, store
+from .main import app, db
+from .menu import extend_menu
+from .models import ScheduledJob
+
+log = logging.getLogger(__name__)
+
+RETRY_DELAY = datetime.timedelta(minutes=1)
+MAX_RETRY_DELAY = datetime.timedelta(minutes=30)
+# local time, before ordering starts
+CRAWLER_SCHEDULE = {
+    'koziolek': '30 7 * * 1-5',
+    'tomas': '0 7 * * 1',
+}
+MENU_SCHEDULE = '0 6 * * *'
+
+# field ranges of cron expression: minute, hour, day, month, weekday
+FIELDS = ((0, 59), (0, 23), (1, 31), (1, 12), (0, 7))
+
+
+def parse_field(field, low, high):
+    """
+    Returns set of values matching one cron field, e.g. '*/15', '1-5', '0,30'.
+    """
+    values = set()
+    for part in field.split(','):
+        step = 1
+        if '/' in part:
+            part, step = part.split('/')
+            step = int(step)
+        if part == '*':
+            start, end = low, high
+        elif '-' in part:
+            start, end = [int(value) for value in part.split('-')]
+        else:
+            start = end = int(part)
+        if start < low or end > high or start > end or step < 1:
+            raise ValueError('Invalid cron field: {}'.format(field))
+        values.update(range(start, end + 1, step))
+    return values
+
+
+class CronSchedule(object):
+    """
+    Schedule described by 'minute hour day month weekday' expression.
+    Weekdays are numbered from 0 (Sunday) to 6, 7 is Sunday too.
+    """
+
+    def __init__(self, expression):
+        fields = expression.split()
+        if len(fields) != 5:
+            raise ValueError('Invalid cron expression: {}'.format(expression))
+        self.expression = expression
+        self.minutes, self.hours, self.days, self.months, weekdays = [
+            parse_field(field, low, high)
+            for field, (low, high) in zip(fields, FIELDS)
+        ]
+        self.weekdays = {weekday % 7 for weekday in weekdays}
+        self.any_day = fields[2] == '*'
+        self.any_weekday = fields[4] == '*'
+
+    def day_matches(self, moment):
+        """
+        Tells if job runs on day of given moment.
+        Like cron, restricted day and weekday match either of them.
+        """
+        day = moment.day in self.days
+        weekday = moment.isoweekday() % 7 in self.weekdays
+        if self.any_day or self.any_weekday:
+            return day and weekday
+        return day or weekday
+
+    def next_after(self, moment):
+        """
+        Returns first run time later than given moment.
+        """
+        moment = moment.replace(second=0, microsecond=0)
+        moment += datetime.timedelta(minutes=1)
+        limit = moment + datetime.timedelta(days=366 * 5)
+        while moment < limit:
+            if moment.month not in self.months:
+                month = moment.month % 12 + 1
+                year = moment.year + (month == 1)
+                moment = moment.replace(
+                    year=year, month=month, day=1, hour=0, minute=0,
+                )
+            elif not self.day_matches(moment):
+                moment = moment.replace(hour=0, minute=0)
+                moment += datetime.timedelta(days=1)
+            elif moment.hour not in self.hours:
+                moment = moment.replace(minute=0)
+                moment += datetime.timedelta(hours=1)
+            elif moment.minute not in self.minutes:
+                moment += datetime.timedelta(minutes=1)
+            else:
+                return moment
+        raise ValueError('Schedule never runs: {}'.format(self.expression))
+
+
+class Job(object):
+    """
+    Named function run on schedule.
+    """
+
+    def __init__(self, name, schedule, function):
+        self.name = name
+        self.schedule = CronSchedule(schedule)
+        self.function = function
+
+
+JOBS = OrderedDict()
+
+
+def register_job(name, schedule, function):
+    """
+    Adds job to scheduler.
+    """
+    JOBS[name] = Job(name, schedule, function)
+    return JOBS[name]
+
+
+def crawl_job(name, today=None):
+    """
+    Crawls and stores menu of one source for today, raises when
+    it failed.
+    """
+    today = today or datetime.date.today()
+    results = crawl([name], today=today)
+    store(results, today)
+    for result in results:
+        if not result.ok:
+            raise result.error
+
+
+def init_jobs():
+    """
+    Registers menu prefetch jobs from CRAWLER_SCHEDULE setting
+    and daily move of materialized menu window.
+    """
+    schedule = app.config.get('CRAWLER_SCHEDULE', CRAWLER_SCHEDULE)
+    for name, expression in schedule.items():
+        register_job('crawl_' + name, expression, partial(crawl_job, name))
+    register_job('extend_menu', MENU_SCHEDULE, extend_menu)
+
+
+def retry_delay(failures):
+    """
+    Returns exponential delay before next attempt.
+    """
+    return min(RETRY_DELAY * 2 ** (failures - 1), MAX_RETRY_DELAY)
+
+
+def job_state(job, now):
+    """
+    Returns stored state of job, new job runs at once so that
+    menus are fetched right after scheduler starts.
+    """
+    state = ScheduledJob.query.get(job.name)
+    if state is None:
+        state = ScheduledJob(name=job.name, next_run=now, failures=0)
+        db.session.add(state)
+    return state
+
+
+def run_job(job, state, now):
+    """
+    Runs job and schedules next run, failed job is retried with
+    growing delay but not later than its next regular run.
+    """
+    state.last_run = now
+    try:
+        job.function()
+    except Exception as error:
+        db.session.rollback()
+        log.exception('Job %s failed', job.name)
+        state = job_state(job, now)
+        state.last_run = now
+        state.failures = (state.failures or 0) + 1
+        state.last_error = str(error)[:400]
+        state.next_run = min(
+            now + retry_delay(state.failures),
+            job.schedule.next_after(now),
+        )
+        result = False
+    else:
+        state.last_success = now
+        state.failures = 0
+        state.last_error = None
+        state.next_run = job.schedule.next_after(now)
+        result = True
+    db.session.commit()
+    return result
+
+
+def run_pending(now=None):
+    """
+    Runs jobs which are due, returns names of succeeded and failed ones.
+    """
+    now = now or datetime.datetime.now()
+    succeeded = []
+    failed = []
+    for job in JOBS.values():
+        state = job_state(job, now)
+        if state.next_run > now:
+            continue
+        if run_job(job, state, now):
+            succeeded.append(job.name)
+        else:
+            failed.append(job.name)
+    db.session.commit()
+    return succeeded, failed
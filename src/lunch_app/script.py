@@ -4,6 +4,7 @@ Startup utilities.
 """
 # pylint: disable=invalid-name, unused-variable
 
+import datetime
 import os
 import subprocess
 from functools import partial
@@ -166,6 +167,163 @@ def run():
             else:
                 print('Unknown action')
 
+    def action_mail_worker(interval=5, once=False, debug=False):
+        """Send queued mails.
+        This command sends mails stored in outbox by the application
+        and retries failed ones with growing delay.
+        For local testing point MAIL_SERVER and MAIL_PORT to a debugging
+        SMTP server, e.g. python -m smtpd -n -c DebuggingServer :1025
+        Options:
+        - '--interval' seconds to wait when outbox is empty
+        - '--once' send one batch and exit
+        - '--debug' use debug configuration
+        """
+        import time
+        from .mailing import dispatch_cycle
+        if debug:
+            app = make_debug(with_debug_layer=False)
+        else:
+            app = make_app()
+
+        with app.app_context():
+            while True:
+                result = dispatch_cycle()
+                if once:
+                    if result is None:
+                        print('Sending failed, see log')
+                    else:
+                        print('Sent: {}, failed: {}'.format(*result))
+                    break
+                if result in (None, (0, 0)):
+                    time.sleep(interval)
+
+    def action_crawl(source='', memory=False, force=False, debug=False):
+        """Crawl restaurant menus.
+        This command fetches menus of all registered restaurants
+        concurrently and adds their meals.
+        Options:
+        - '--source' comma separated restaurant names, all by default
+        - '--memory' measure peak memory of parsing
+        - '--force' parse pages even when they did not change
+        - '--debug' use debug configuration
+        """
+        from .crawler import crawl, store
+        if debug:
+            app = make_debug(with_debug_layer=False)
+        else:
+            app = make_app()
+
+        with app.app_context():
+            today = datetime.date.today()
+            results = crawl(
+                [name for name in source.split(',') if name],
+                trace_memory=memory,
+                force=force,
+                today=today,
+            )
+            for result in results:
+                if not result.ok:
+                    status = result.error
+                elif result.unchanged:
+                    status = 'unchanged'
+                else:
+                    status = 'ok'
+                print('{}: {} ({:.2f}s, parse {}, peak memory {})'.format(
+                    result.source.name,
+                    status,
+                    result.elapsed,
+                    '-' if result.parse_time is None
+                    else '{:.3f}s'.format(result.parse_time),
+                    '-' if result.peak_memory is None
+                    else '{} kB'.format(result.peak_memory // 1024),
+                ))
+            print('Added meals: {}, updated: {}'.format(
+                *store(results, today)
+            ))
+
+    def action_scheduler(interval=30, once=False, debug=False):
+        """Run scheduled jobs.
+        This command prefetches restaurant menus on schedules from
+        CRAWLER_SCHEDULE setting, failed jobs are retried with growing
+        delay.
+        Options:
+        - '--interval' seconds between checks for due jobs
+        - '--once' run due jobs and exit
+        - '--debug' use debug configuration
+        """
+        import time
+        from .scheduler import init_jobs, run_pending
+        if debug:
+            app = make_debug(with_debug_layer=False)
+        else:
+            app = make_app()
+
+        with app.app_context():
+            init_jobs()
+            while True:
+                succeeded, failed = run_pending()
+                if succeeded or failed:
+                    print('Succeeded: {}, failed: {}'.format(
+                        ', '.join(succeeded) or '-',
+                        ', '.join(failed) or '-',
+                    ))
+                if once:
+                    break
+                time.sleep(interval)
+
+    def action_import_food(path='', format='', batch=1000, debug=False):
+        """Import restaurant catalogue.
+        This command adds foods from CSV or JSON Lines file with
+        columns: company, description, cost, type, available_from and
+        available_to (YYYY-MM-DD). File is read line by line and
+        inserted in batches, so it may be of any size.
+        Options:
+        - '--path' catalogue file, '-' reads standard input
+        - '--format' csv or jsonl, by file extension by default
+        - '--batch' number of foods inserted at once
+        - '--debug' use debug configuration
+        """
+        # pylint: disable=redefined-builtin
+        import sys
+        from .ingest import import_foods, import_format
+        file_format = format or import_format(path)
+        if not path or file_format is None:
+            print('Give --path of .csv or .jsonl file or --format')
+            return
+        if debug:
+            app = make_debug(with_debug_layer=False)
+        else:
+            app = make_app()
+
+        with app.app_context():
+            if path == '-':
+                report = import_foods(sys.stdin, file_format, batch)
+            else:
+                with open(path, encoding='utf-8-sig', newline='') as lines:
+                    report = import_foods(lines, file_format, batch)
+            for error in report.errors:
+                print(error)
+            print('Added foods: {}, skipped: {}, invalid: {}'.format(
+                report.inserted, report.skipped, report.invalid,
+            ))
+
+    def action_rebuild_ledger(debug=False):
+        """Rebuild monthly ledger.
+        This command counts orders and costs of every user in every
+        month again from orders. Ledger is kept up to date on each
+        order change, rebuild it after writing orders with SQL.
+        Options:
+        - '--debug' use debug configuration
+        """
+        from .ledger import rebuild_ledger
+        if debug:
+            app = make_debug(with_debug_layer=False)
+        else:
+            app = make_app()
+
+        with app.app_context():
+            print('Ledger rows: {}'.format(rebuild_ledger()))
+
     werkzeug.script.run()
 
 
@@ -5,12 +5,27 @@ Presence analyzer unit tests.
 # pylint: disable=maybe-no-member, too-many-public-methods, invalid-name
 
 from datetime import datetime, date, timedelta
+from decimal import Decimal
+from functools import partial
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+import io
+import json
 import os.path
+import smtplib
+import tempfile
+import threading
 import unittest
-from unittest.mock import patch
+from unittest.mock import Mock, patch
+
+from flask.ext.mail import Message
+from sqlalchemy import event
+from sqlalchemy.dialects import postgresql
 
 from .main import app, db, mail
-from . import main, utils
+from . import (
+    main, utils, reports, payments, menu, cache, mailing, crawler, scheduler,
+    ingest, orders, pagination, ledger,
+)
 from .fixtures import fill_db, allow_ordering, fill_company
 from .mocks import (
     MOCK_ADMIN,
@@ -19,8 +34,18 @@ from .mocks import (
     MOCK_WWW_TOMAS,
     MOCK_WWW_KOZIOLEK,
 )
-from .models import Order, Food, MailText, User
-from .webcrawler import get_dania_dnia_from_pod_koziolek, get_week_from_tomas
+from .models import (
+    Order, Food, MailText, User, Finance, Company, OutboxMail, CrawlState,
+    ScheduledJob, OrderItem, MonthlyLedger, MenuDay,
+)
+from .webcrawler import (
+    get_dania_dnia_from_pod_koziolek,
+    get_week_from_tomas,
+    koziolek_menu,
+    parse_pod_koziolek,
+    parse_week_tomas,
+    tomas_menu,
+)
 from .utils import make_datetime
 
 
@@ -36,6 +61,30 @@ def setUp():
     main.init()
 
 
+def send_queued_mails(**kwargs):
+    """
+    Sends mails from outbox like mail worker does.
+    """
+    with app.app_context():
+        return mailing.dispatch_outbox(**kwargs)
+
+
+# finance fixtures are stored for this month
+FINANCE_FIXTURES_DATE = datetime(2015, 2, 5, 12, 0)
+
+
+def fill_db_in_finance_month():
+    """
+    Fills the database and moves orders placed today to month of
+    finance fixtures, so that finance results do not depend on today.
+    """
+    fill_db()
+    placed_today = datetime.utcnow() - timedelta(days=1)
+    for order in Order.query.filter(Order.date >= placed_today):
+        order.date = FINANCE_FIXTURES_DATE
+    db.session.commit()
+
+
 class LunchBackendViewsTestCase(unittest.TestCase):
     """
     Views tests.
@@ -47,6 +96,7 @@ class LunchBackendViewsTestCase(unittest.TestCase):
         """
         self.client = main.app.test_client()
         db.create_all()
+        cache.cache.clear()
 
     def tearDown(self):
         """
@@ -162,12 +212,14 @@ class LunchBackendViewsTestCase(unittest.TestCase):
             }
             resp = self.client.post('/order', data=data)
             self.assertEqual(resp.status_code, 302)
+            self.assertEqual(len(outbox), 0)
+            send_queued_mails()
             self.assertEqual(len(outbox), 1)
             msg = outbox[0]
             self.assertTrue(msg.subject.startswith('Lunch order'))
             self.assertIn('To jest TESTow zamowienie dla emaila', msg.body)
             self.assertIn('Pod Koziołkiem', msg.body)
-            self.assertIn('13.0 PLN', msg.body)
+            self.assertIn('13.00 PLN', msg.body)
             self.assertIn('at 13:00', msg.body)
             self.assertEqual(msg.recipients, ['mock@mock.com'])
 
@@ -201,6 +253,30 @@ class LunchBackendViewsTestCase(unittest.TestCase):
             datetime(2015, 1, 1, 0, 0)
         )
 
+    @patch('lunch_app.permissions.current_user', new=MOCK_ADMIN)
+    def test_import_food_view(self):
+        """
+        Test catalogue upload on add food page.
+        """
+        fill_company()
+        catalogue = (
+            'company,description,cost,type,available_from,available_to\n'
+            'Tomas,Pierogi,12.5,menu,2015-01-01,2015-12-31\n'
+            'Tomas,Placki,-1,menu,2015-01-01,2015-12-31\n'
+        )
+        resp = self.client.post(
+            '/import_food',
+            data={'catalogue': (io.BytesIO(catalogue.encode()), 'menu.csv')},
+        )
+        self.assertEqual(resp.status_code, 302)
+        resp = self.client.get('/add_food')
+        self.assertIn('1 foods added, 0 skipped, 1 invalid', str(resp.data))
+        self.assertIn('line 3: cost out of range', str(resp.data))
+        food = Food.query.one()
+        self.assertEqual(food.description, 'Pierogi')
+        self.assertEqual(food.cost, 12.5)
+        self.assertEqual(food.date_available_to, datetime(2015, 12, 31))
+
     @patch('lunch_app.permissions.current_user', new=MOCK_ADMIN)
     def test_add_food__bulk_view(self):
         """
@@ -299,6 +375,17 @@ class LunchBackendViewsTestCase(unittest.TestCase):
             'http://localhost/order_list/1/2015/1'
         )
 
+    def test_order_list_view_year_totals(self):
+        """
+        Test order list year page counts orders of every month.
+        """
+        fill_db()
+        resp = self.client.get('/order_list/1/2015')
+        self.assertEqual(resp.status_code, 200)
+        self.assertIn('January', str(resp.data))
+        self.assertIn('123.00', str(resp.data))
+        self.assertIn('December', str(resp.data))
+
     def test_order_list_view_month(self):
         """
         Test order list month page.
@@ -348,6 +435,7 @@ class LunchBackendViewsTestCase(unittest.TestCase):
         self.assertEqual(order_db.date, datetime(2015, 1, 1, 0, 0))
         self.assertEqual(order_db.arrival_time, '12:00')
         self.assertEqual(order_db.date, datetime(2015, 1, 1))
+        self.assertEqual(order_db.order_day, date(2015, 1, 1))
 
     @patch('lunch_app.permissions.current_user', new=MOCK_ADMIN)
     def test_delete_order(self):
@@ -390,6 +478,28 @@ class LunchBackendViewsTestCase(unittest.TestCase):
         self.assertIn('489', str(resp.data))
         db.session.close()
 
+    @patch('lunch_app.permissions.current_user', new=MOCK_ADMIN)
+    def test_company_spend_view(self):
+        """
+        Test company spend page and its JSON.
+        """
+        fill_db()
+        resp = self.client.get('/company_spend')
+        self.assertEqual(resp.status_code, 200)
+        query = '?begin=2015-01-01&end=2015-02-28&granularity=month'
+        resp = self.client.get('/company_spend' + query)
+        self.assertEqual(resp.status_code, 200)
+        self.assertIn('2015-02-01', str(resp.data))
+        resp = self.client.get('/company_spend.json' + query)
+        self.assertEqual(resp.status_code, 200)
+        data = json.loads(resp.data.decode())
+        self.assertEqual(data['periods'], ['2015-01-01', '2015-02-01'])
+        self.assertEqual(data['companies'][0]['name'], 'Tomas')
+        resp = self.client.get(
+            '/company_spend.json?begin=2015-02-01&end=2015-01-01',
+        )
+        self.assertEqual(resp.status_code, 400)
+
     @patch('lunch_app.permissions.current_user', new=MOCK_ADMIN)
     def test_finance_view(self):
         """
@@ -493,11 +603,32 @@ class LunchBackendViewsTestCase(unittest.TestCase):
             data = {'send_mail': 'remind_all'}
             resp = self.client.post('/finance_mail_all', data=data)
             self.assertEquals(resp.status_code, 302)
+            self.assertEqual(len(outbox), 0)
+            send_queued_mails()
             self.assertEqual(len(outbox), 2)
             msg = outbox[0]
             self.assertTrue(msg.subject.startswith('Lunch'))
             self.assertIn('February', msg.body)
 
+    @patch('lunch_app.permissions.current_user', new=MOCK_ADMIN)
+    def test_finance_debts_view(self):
+        """
+        Test debts page and reminder to all slackers.
+        """
+        fill_db_in_finance_month()
+        resp = self.client.get('/finance_debts?sort=months')
+        self.assertEqual(resp.status_code, 200)
+        self.assertIn('244.00 PLN', str(resp.data))
+        with mail.record_messages() as outbox:
+            data = {'send_mail': 'slackers'}
+            resp = self.client.post('/finance_debts', data=data)
+            self.assertEqual(resp.status_code, 302)
+            send_queued_mails()
+            self.assertEqual(len(outbox), 3)
+            self.assertEqual(outbox[0].recipients, ['test@user.pl'])
+            self.assertIn('244.00 PLN', outbox[0].body)
+            self.assertIn('February 2015', outbox[0].body)
+
     @patch('lunch_app.permissions.current_user', new=MOCK_ADMIN)
     def test_payment_remind_view(self):
         """
@@ -507,6 +638,8 @@ class LunchBackendViewsTestCase(unittest.TestCase):
         with mail.record_messages() as outbox:
             resp = self.client.post('/payment_remind/x@x.pl/0')
             self.assertTrue(resp.status_code == 302)
+            self.assertEqual(len(outbox), 0)
+            send_queued_mails()
             self.assertEqual(len(outbox), 1)
             msg = outbox[0]
             self.assertTrue(msg.subject.startswith('Lunch'))
@@ -529,6 +662,33 @@ class LunchBackendViewsTestCase(unittest.TestCase):
             'http://localhost/finance/2015/1/0',
         )
 
+    @patch('lunch_app.views.current_user', new=MOCK_ADMIN)
+    def test_random_food_cost(self):
+        """
+        Test random popular dish costs as much as order of it alone.
+        """
+        fill_db()
+        for description, cost in (
+                ('Kebab\nFrytki', 30), ('Kebab\nFrytki', 30),
+                ('Kebab\nFrytki', 30), ('Kebab', 10), ('Zupa', 5),
+                ('Zupa', 5), ('Zupa', 5),
+        ):
+            order = Order(description, cost, '12:00', 'Pod Koziołkiem')
+            order.user_name = 'test@user.pl'
+            db.session.add(order)
+        db.session.commit()
+        with patch('lunch_app.views.choice') as choice:
+            choice.side_effect = lambda dishes: dishes[0]
+            resp = self.client.get('/random_meal/1')
+        self.assertEqual(resp.status_code, 302)
+        self.assertEqual(
+            [dish.description for dish in choice.call_args[0][0]],
+            ['Kebab', 'Zupa'],
+        )
+        order = Order.query.order_by(Order.id.desc()).first()
+        self.assertEqual(order.description, '!RANDOM ORDER!\nKebab')
+        self.assertEqual(order.cost, 10)
+
     @patch('lunch_app.views.current_user', new=MOCK_ADMIN)
     def test_random_food(self):
         """
@@ -607,6 +767,8 @@ class LunchBackendViewsTestCase(unittest.TestCase):
         with mail.record_messages() as outbox:
             resp = self.client.get('/send_daily_reminder')
             self.assertEqual(resp.status_code, 302)
+            self.assertEqual(len(outbox), 0)
+            send_queued_mails()
             self.assertEqual(len(outbox), 1)
             msg = outbox[0]
             self.assertTrue(msg.subject.startswith('STX Lunch'))
@@ -831,6 +993,22 @@ class LunchBackendViewsTestCase(unittest.TestCase):
         self.assertEqual(food.date_available_from, make_datetime(date.today()))
         self.assertEqual(food.date_available_to, make_datetime(date.today()))
 
+    @patch('lunch_app.views.current_user', new=MOCK_ADMIN)
+    @patch(
+        'lunch_app.views.get_dania_dnia_from_pod_koziolek',
+        new=MOCK_DATA_KOZIOLEK,
+    )
+    def test_add_daily_koziolek_twice(self):
+        """
+        Test adding meal of a day twice does not duplicate it.
+        """
+        self.client.get('/add_daily_koziolek')
+        count = Food.query.count()
+        self.assertEqual(count, 3)
+        resp = self.client.get('/add_daily_koziolek')
+        self.assertEqual(resp.status_code, 302)
+        self.assertEqual(Food.query.count(), count)
+
     @patch('lunch_app.views.current_user', new=MOCK_ADMIN)
     @patch(
         'lunch_app.views.get_week_from_tomas',
@@ -848,9 +1026,9 @@ class LunchBackendViewsTestCase(unittest.TestCase):
         self.assertEqual(resp.status_code, 302)
         resp = self.client.get('/order')
         self.assertEqual(resp.status_code, 200)
-        self.assertIn("10.0 PLN", str(resp.data))
-        self.assertIn("12.0 PLN", str(resp.data))
-        self.assertIn("4.0 PLN", str(resp.data))
+        self.assertIn("10.00 PLN", str(resp.data))
+        self.assertIn("12.00 PLN", str(resp.data))
+        self.assertIn("4.00 PLN", str(resp.data))
 
         # meal of a day from Monday
         food = Food.query.filter(
@@ -906,6 +1084,8 @@ class LunchBackendViewsTestCase(unittest.TestCase):
         with mail.record_messages() as outbox:
             resp = self.client.get('/order_pizza_for_everybody')
             self.assertEqual(resp.status_code, 302)
+            self.assertEqual(len(outbox), 0)
+            send_queued_mails()
             self.assertEqual(len(outbox), 2)
             msg = outbox[0]
             self.assertTrue(msg.subject.startswith('Lunch app PIZZA'))
@@ -980,6 +1160,36 @@ class LunchBackendUtilsTestCase(unittest.TestCase):
         """
         pass
 
+    def test_init_listeners(self):
+        """
+        Test session and mapper listeners are registered once,
+        references first and cache last.
+        """
+        main.init_listeners()
+
+        def listeners(functions):
+            """
+            Returns names of listeners defined by application.
+            """
+            return [
+                function.__name__ for function in functions
+                if function.__module__.startswith('lunch_app')
+            ]
+
+        session = db.session()
+        self.assertEqual(
+            listeners(session.dispatch.before_flush),
+            ['resolve_references', 'sync_order_items',
+             'collect_ledger_months'],
+        )
+        self.assertEqual(
+            listeners(session.dispatch.after_flush),
+            ['update_ledger', 'collect_stale_keys'],
+        )
+        self.assertTrue(
+            event.contains(Food, 'after_insert', menu.food_inserted),
+        )
+
     def test_get_current_date(self):
         """
         Test current date.
@@ -1058,64 +1268,1392 @@ class LunchBackendPermissionsTestCase(unittest.TestCase):
         self.assertEqual(resp_2.status_code, 401)
 
 
-class LunchWebCrawlersTestCases(unittest.TestCase):
+class LunchBackendReportsTestCase(unittest.TestCase):
     """
-    Webcrawlers tests.
+    Reports tests.
     """
+
     def setUp(self):
         """
         Before each test, set up a environment.
         """
-        self.client = main.app.test_client()
+        db.create_all()
 
     def tearDown(self):
         """
         Get rid of unused objects after each test.
         """
-        pass
+        db.session.remove()
+        db.drop_all()
 
-    @patch(
-        'lunch_app.webcrawler.read_webpage',
-        new=MOCK_WWW_KOZIOLEK,
-    )
-    def test_get_dania_dnia_from_pod_koziolek(self):
+    def test_day_summary(self):
         """
-        Tests web crawling functions works properly Koziolek add meal of a day
+        Test day summary counts dishes and sums costs per company.
         """
-        data = get_dania_dnia_from_pod_koziolek()
-        self.assertGreaterEqual(len(data), 2)
-        self.assertGreaterEqual(len(data["zupa_dnia"]), 1)
-        self.assertGreaterEqual(len(data['danie_dania_1']), 1)
+        fill_db()
+        order = Order()
+        order.description = '!RANDOM ORDER!\nKebab\r\nFrytki'
+        order.company = 'Pod Koziołkiem'
+        order.cost = 5
+        order.user_name = 'test@user.pl'
+        order.arrival_time = '13:00'
+        db.session.add(order)
+        db.session.commit()
+        order_details, orders_summary = reports.day_summary(
+            date.today(),
+            cache.get_companies(),
+        )
+        details = order_details['Pod Koziołkiem']
+        self.assertEqual(len(details['12:00']), 3)
+        self.assertEqual(details['cost12'], 489)
+        self.assertEqual(details['13:00'], [order])
+        self.assertEqual(details['cost13'], 5)
+        self.assertEqual(order_details['Tomas']['12:00'], [])
+        self.assertEqual(
+            orders_summary['12:00']['Pod Koziołkiem'],
+            {'Duzy Gruby Nalesnik': 2, 'Maly Gruby Nalesnik': 1},
+        )
+        self.assertEqual(
+            orders_summary['13:00']['Pod Koziołkiem'],
+            {'Kebab': 1, 'Frytki': 1},
+        )
 
-    @patch(
-        'lunch_app.webcrawler.read_webpage',
-        new=MOCK_WWW_TOMAS,
-    )
-    def test_get_week_from_tomas(self):
+    def test_order_items(self):
         """
-        Tests web crawling functions works properly for Tomas add week
+        Test order items follow description and are matched with menu.
         """
-        data = get_week_from_tomas()
-        self.assertEqual(len(data), 6)
-        self.assertGreaterEqual(len(data['diet']), 1)
-        for i in range(1, 6):
-            food = data['dzien_{}'.format(i)]
-            self.assertEqual(len(food), 3, msg="ERROR IN {}".format(i))
-            self.assertGreaterEqual(
-                len(food['zupy']),
-                1,
-                msg="ERROR IN {}".format(i),
+        fill_company()
+        day = date.today()
+        ingest.insert_foods([
+            ingest.food_row('Kebab', 10, 'daniednia', day, day, 'Tomas'),
+        ])
+        order = Order('!RANDOM ORDER!\r\nKebab\r\n Frytki ', 12, '12:00',
+                      'Tomas')
+        order.user_name = 'test_user'
+        db.session.add(order)
+        db.session.commit()
+        food = Food.query.one()
+        self.assertEqual(
+            [(item.description, item.food_id, item.random)
+             for item in order.items],
+            [('Kebab', food.id, True), ('Frytki', None, True)],
+        )
+        # stored menu text is normalized like order lines
+        company = Company.query.filter_by(name='Tomas').one()
+        ingest.insert_rows([dict(
+            ingest.food_row(' Frytki ', 5, 'daniednia', day, day, 'Tomas'),
+            company_id=company.id,
+        )])
+        fries = Food.query.filter_by(description=' Frytki ').one()
+        order.description = 'Frytki'
+        db.session.commit()
+        self.assertEqual(
+            [(item.description, item.food_id, item.random)
+             for item in order.items],
+            [('Frytki', fries.id, False)],
+        )
+        self.assertEqual(OrderItem.query.count(), 1)
+        db.session.delete(order)
+        db.session.commit()
+        self.assertEqual(OrderItem.query.count(), 0)
+        self.assertEqual(orders.order_lines(''), ([], False))
+
+    def test_company_and_user_ids(self):
+        """
+        Test records written by name get ids, so that renamed company
+        keeps its orders.
+        """
+        fill_db()
+        user = User.query.filter_by(username='test@user.pl').one()
+        company = Company.query.filter_by(name='Pod Koziołkiem').one()
+        order = Order.query.get(3)
+        self.assertEqual((order.user_id, order.company_id),
+                         (user.id, company.id))
+        self.assertEqual(
+            Food.query.filter_by(company='Pod Koziołkiem').one().company_id,
+            company.id,
+        )
+        self.assertEqual(
+            Finance.query.filter_by(user_name='test@user.pl').one().user_id,
+            user.id,
+        )
+        ingest.insert_foods([ingest.food_row(
+            'Zupa', 5, 'menu', date.today(), date.today(), 'Pod Koziołkiem',
+        )])
+        self.assertEqual(
+            Food.query.filter_by(description='Zupa').one().company_id,
+            company.id,
+        )
+        company.name = 'Koziołek'
+        db.session.commit()
+        order_details, _summary = reports.day_summary(
+            date.today(), cache.get_companies(),
+        )
+        self.assertEqual(len(order_details['Koziołek']['12:00']), 3)
+        self.assertEqual(order.company, 'Pod Koziołkiem')
+
+    def test_money(self):
+        """
+        Test costs are stored as grosze and summed exactly by database.
+        """
+        fill_company()
+        for cost in (0.1, '0.2', Decimal('12.345')):
+            order = Order('Kebab', cost, '12:00', 'Tomas')
+            order.user_name = 'test_user'
+            db.session.add(order)
+        db.session.commit()
+        self.assertEqual(
+            [cost for (cost,) in db.session.execute(
+                'SELECT cost FROM "order" ORDER BY id'
+            )],
+            [10, 20, 1235],
+        )
+        self.assertEqual(Order.query.get(3).cost, Decimal('12.35'))
+        self.assertEqual(
+            reports.orders_cost(Order.company == 'Tomas'), Decimal('12.65'),
+        )
+        self.assertEqual(reports.orders_cost(Order.company == 'Nowa'), 0)
+
+    def test_monthly_orders(self):
+        """
+        Test orders are counted per month of any range.
+        """
+        for day, cost in ((date(2014, 12, 31), 10), (date(2015, 1, 1), 5),
+                          (date(2015, 1, 31), '2.5'), (date(2015, 3, 2), 1)):
+            order = Order('Kebab', cost, '12:00', 'Tomas')
+            order.date = make_datetime(day)
+            order.user_name = 'test_user'
+            db.session.add(order)
+        db.session.commit()
+        totals = reports.monthly_orders(date(2014, 12, 1), date(2015, 4, 1))
+        self.assertEqual(totals, [
+            (2014, 12, 1, Decimal('10.00')),
+            (2015, 1, 2, Decimal('7.50')),
+            (2015, 2, 0, Decimal('0.00')),
+            (2015, 3, 1, Decimal('1.00')),
+        ])
+        self.assertEqual(
+            reports.monthly_orders(
+                date(2015, 1, 1), date(2015, 2, 1), Order.cost > 3,
+            ),
+            [(2015, 1, 1, Decimal('5.00'))],
+        )
+        self.assertEqual(
+            reports.months(date(2015, 1, 15), date(2015, 3, 2)),
+            [(2015, 1), (2015, 2), (2015, 3)],
+        )
+
+    def test_company_spend(self):
+        """
+        Test spend is reported by company and period and closed
+        periods are cached until their orders change.
+        """
+        fill_company()
+        cache.cache.clear()
+        for day, cost, company in (
+                (date(2015, 1, 30), 10, 'Tomas'),
+                (date(2015, 2, 2), 5, 'Tomas'),
+                (date(2015, 2, 3), '2.5', 'Pod Koziołkiem'),
+                (date(2015, 2, 10), 1, 'Tomas'),
+        ):
+            order = Order('Kebab', cost, '12:00', company)
+            order.date = make_datetime(day)
+            order.user_name = 'test_user'
+            db.session.add(order)
+        db.session.commit()
+        self.assertEqual(
+            reports.periods(date(2015, 1, 31), date(2015, 2, 10), 'week'),
+            [date(2015, 1, 26), date(2015, 2, 2), date(2015, 2, 9)],
+        )
+        starts, spend = reports.company_spend(
+            date(2015, 1, 1), date(2015, 3, 1), 'month',
+            today=date(2015, 2, 15),
+        )
+        self.assertEqual(starts, [date(2015, 1, 1), date(2015, 2, 1)])
+        self.assertEqual(spend, {
+            1: [Decimal('10.00'), Decimal('6.00')],
+            2: [Decimal('0.00'), Decimal('2.50')],
+        })
+        starts, spend = reports.company_spend(
+            date(2015, 1, 28), date(2015, 2, 9), 'week',
+            today=date(2015, 3, 1),
+        )
+        self.assertEqual(starts, [date(2015, 1, 26), date(2015, 2, 2)])
+        self.assertEqual(spend, {
+            1: [Decimal('10.00'), Decimal('5.00')],
+            2: [Decimal('0.00'), Decimal('2.50')],
+        })
+        db.session.execute(Order.__table__.insert(), [
+            {'order_day': day, 'cost': 1, 'company_id': 1,
+             'description': 'Hidden'}
+            for day in (date(2015, 1, 5), date(2015, 2, 5))
+        ])
+        _starts, spend = reports.company_spend(
+            date(2015, 1, 1), date(2015, 3, 1), 'month',
+            today=date(2015, 2, 15),
+        )
+        self.assertEqual(spend[1], [Decimal('10.00'), Decimal('7.00')])
+        order = Order.query.get(1)
+        order.cost = 20
+        db.session.commit()
+        _starts, spend = reports.company_spend(
+            date(2015, 1, 1), date(2015, 2, 1), 'month',
+            today=date(2015, 2, 15),
+        )
+        self.assertEqual(spend, {1: [Decimal('21.00')]})
+
+    def test_orders_page(self):
+        """
+        Test orders are paged newest first by date and id.
+        """
+        same_time = datetime(2015, 1, 2, 12, 0)
+        for description, day in (
+                ('first', datetime(2015, 1, 1, 12, 0)),
+                ('second', same_time),
+                ('third', same_time),
+                ('fourth', datetime(2015, 1, 3, 12, 0)),
+                ('other', datetime(2015, 1, 4, 12, 0)),
+        ):
+            order = Order(description, 5, '12:00', 'Tomas')
+            order.date = day
+            order.user_id = 2 if description == 'other' else 1
+            db.session.add(order)
+        db.session.commit()
+        criteria = Order.user_id == 1
+        descriptions = []
+        cursor = None
+        while True:
+            page = pagination.orders_page(criteria, cursor, size=2)
+            descriptions.append(
+                [order.description for order in page.orders]
             )
-            self.assertGreaterEqual(
-                len(food['dania']),
-                1,
-                msg="ERROR IN {}".format(i),
+            cursor = page.next_cursor
+            if cursor is None:
+                break
+        self.assertEqual(
+            descriptions,
+            [['fourth', 'third'], ['second', 'first']],
+        )
+        self.assertEqual(
+            pagination.parse_cursor('2015-01-02T12:00:00.000000_3'),
+            (same_time, 3),
+        )
+        self.assertIsNone(pagination.parse_cursor('broken'))
+        self.assertEqual(
+            len(pagination.orders_page(criteria, 'broken').orders), 4,
+        )
+
+    def test_monthly_ledger(self):
+        """
+        Test ledger follows order changes and can be rebuilt.
+        """
+        fill_db()
+
+        def ledger_rows():
+            return sorted(
+                (row.user_id, row.year, row.month, row.number_of_orders,
+                 row.month_cost)
+                for row in MonthlyLedger.query
             )
-            self.assertGreaterEqual(
-                len(food['zupa_i_dania']),
-                1,
-                msg="ERROR IN {}".format(i),
+
+        self.assertIn((1, 2015, 1, 1, Decimal('123.00')), ledger_rows())
+        order = Order.query.get(1)
+        order.cost = 100
+        order.date = datetime(2015, 3, 3)
+        db.session.commit()
+        self.assertNotIn(1, [row[0] for row in ledger_rows()
+                             if row[1:3] == (2015, 1)])
+        self.assertIn((1, 2015, 3, 1, Decimal('100.00')), ledger_rows())
+        order.user_name = 'x@x.pl'
+        db.session.commit()
+        self.assertIn((3, 2015, 3, 1, Decimal('100.00')), ledger_rows())
+        self.assertNotIn(1, [row[0] for row in ledger_rows()
+                             if row[1:3] == (2015, 3)])
+        db.session.delete(order)
+        db.session.commit()
+        self.assertNotIn(3, [row[0] for row in ledger_rows()
+                             if row[1:3] == (2015, 3)])
+        expected = ledger_rows()
+        db.session.execute(Order.__table__.insert(), {
+            'order_day': date(2015, 4, 1), 'cost': 5, 'user_id': 1,
+            'description': 'Hidden',
+        })
+        self.assertEqual(ledger.rebuild_ledger(), len(expected) + 1)
+        self.assertEqual(
+            [row for row in ledger_rows() if row not in expected],
+            [(1, 2015, 4, 1, Decimal('5.00'))],
+        )
+
+    def test_refresh_ledger_upsert(self):
+        """
+        Test PostgreSQL ledger rows are upserted on their unique key,
+        rows left without orders are deleted.
+        """
+        connection = Mock()
+        connection.dialect = postgresql.dialect()
+        ledger.refresh_ledger(connection, {(1, 2015, 2), (2, 2015, 2)})
+        upsert, delete = [
+            str(call[0][0].compile(dialect=connection.dialect))
+            for call in connection.execute.call_args_list
+        ]
+        self.assertIn(
+            'ON CONFLICT (year, month, user_id) DO UPDATE', upsert,
+        )
+        self.assertTrue(delete.startswith('DELETE FROM monthly_ledger'))
+
+    def test_outstanding_balances(self):
+        """
+        Test unpaid months are summed per user across all history.
+        """
+        fill_db_in_finance_month()
+        self.assertEqual(reports.outstanding_balances(), [
+            ('test@user.pl', 1, 1, Decimal('244.00'), (2015, 2)),
+            ('test_user', 1, 1, Decimal('123.00'), (2015, 1)),
+            ('x@x.pl', 1, 1, Decimal('1.00'), (2015, 2)),
+        ])
+        self.assertEqual(
+            [balance.username
+             for balance in reports.outstanding_balances('since')],
+            ['test_user', 'test@user.pl', 'x@x.pl'],
+        )
+        payments.update_payments(2015, 1, {'test_user': True})
+        self.assertEqual(
+            [balance.username
+             for balance in reports.outstanding_balances('username')],
+            ['test@user.pl', 'x@x.pl'],
+        )
+        with self.assertRaises(ValueError):
+            reports.outstanding_balances('cost')
+
+    def test_popular_dishes(self):
+        """
+        Test dishes are ranked by number of orders containing them.
+        """
+        fill_company()
+        for description in ('Kebab', 'Frytki\nKebab', 'Frytki', 'Kebab'):
+            order = Order(description, 5, '12:00', 'Tomas')
+            order.user_name = 'test_user'
+            db.session.add(order)
+        db.session.commit()
+        dishes = reports.popular_dishes(date.today(), 3)
+        self.assertEqual(
+            [(dish.description, dish.orders, dish.first_order_id,
+              dish.single_order_id)
+             for dish in dishes],
+            [('Kebab', 3, 1, 1), ('Frytki', 2, 2, 3)],
+        )
+        order = Order.query.get(3)
+        order.description = 'Frytki\nKebab'
+        db.session.commit()
+        self.assertIsNone(
+            reports.popular_dishes(date.today(), 3)[1].single_order_id,
+        )
+
+    def test_finance_report(self):
+        """
+        Test finance report joins orders with payments.
+        """
+        fill_db_in_finance_month()
+        finance_data = reports.finance_report(2015, 2)
+        self.assertEqual(
+            list(finance_data),
+            ['test_user', 'test@user.pl', 'x@x.pl'],
+        )
+        self.assertEqual(finance_data['test_user'], {
+            'username': 'test_user',
+            'number_of_orders': 1,
+            'month_cost': 244,
+            'did_user_pay': True,
+        })
+        self.assertFalse(finance_data['x@x.pl']['did_user_pay'])
+        self.assertEqual(
+            list(reports.finance_report(2015, 2, 1)),
+            ['test_user'],
+        )
+        self.assertEqual(
+            list(reports.finance_report(2015, 2, 2)),
+            ['test@user.pl', 'x@x.pl'],
+        )
+        self.assertEqual(list(reports.finance_report(2015, 1)), ['test_user'])
+        self.assertEqual(len(reports.finance_report(2014, 12)), 0)
+
+
+class LunchBackendPaymentsTestCase(unittest.TestCase):
+    """
+    Payments tests.
+    """
+
+    def setUp(self):
+        """
+        Before each test, set up a environment.
+        """
+        db.create_all()
+
+    def tearDown(self):
+        """
+        Get rid of unused objects after each test.
+        """
+        db.session.remove()
+        db.drop_all()
+
+    def test_update_payments(self):
+        """
+        Test payments are updated or inserted once per user and month.
+        """
+        fill_db()
+        payments.update_payments(2015, 2, {
+            'test_user': False,
+            'test@user.pl': True,
+            'x@x.pl': True,
+        })
+        payments.update_payments(2015, 2, {'x@x.pl': False})
+        records = {
+            record.user_name: record.did_user_pay
+            for record in Finance.query.filter(
+                Finance.year == 2015,
+                Finance.month == 2,
+            )
+        }
+        self.assertEqual(records, {
+            'test_user': False,
+            'test@user.pl': True,
+            'x@x.pl': False,
+            'reminder@user.pl': False,
+        })
+        self.assertEqual(Finance.query.count(), 4)
+
+
+class LunchBackendMenuTestCase(unittest.TestCase):
+    """
+    Day menu tests.
+    """
+
+    def setUp(self):
+        """
+        Before each test, set up a environment.
+        """
+        db.create_all()
+
+    def tearDown(self):
+        """
+        Get rid of unused objects after each test.
+        """
+        db.session.remove()
+        db.drop_all()
+
+    def test_day_menu(self):
+        """
+        Test day menu follows added, edited and deleted food.
+        """
+        fill_db()
+        today = date.today()
+        self.assertEqual(
+            [food.description for food in menu.day_menu(today)],
+            ['Malza', 'Tiramisu'],
+        )
+        self.assertEqual(
+            [food.description for food in menu.day_menu(today + timedelta(4))],
+            ['Tiramisu'],
+        )
+        food = Food.query.filter(Food.description == 'Malza').first()
+        food.date_available_to = datetime.now() + timedelta(4)
+        db.session.commit()
+        self.assertEqual(menu.day_menu(today + timedelta(4)).count(), 2)
+        food.rating = 5
+        db.session.commit()
+        self.assertEqual(menu.day_menu(today + timedelta(4)).count(), 2)
+        db.session.delete(food)
+        db.session.commit()
+        self.assertEqual(
+            [food.description for food in menu.day_menu(today)],
+            ['Tiramisu'],
+        )
+        self.assertEqual(menu.day_menu(today + timedelta(6)).count(), 0)
+
+    def test_food_days(self):
+        """
+        Test days of food availability include both ends.
+        """
+        window = menu.menu_window(date(2015, 1, 31))
+        self.assertEqual(
+            menu.food_days(
+                datetime(2015, 1, 30, 12), date(2015, 2, 1), window,
+            ),
+            [date(2015, 1, 30), date(2015, 1, 31), date(2015, 2, 1)],
+        )
+        self.assertEqual(menu.food_days(date(2015, 1, 2), None, window), [])
+        self.assertEqual(
+            menu.food_days(date(2015, 1, 2), date(2015, 1, 3), None), [],
+        )
+        days = menu.food_days(date(2010, 1, 1), date(2030, 1, 1), window)
+        self.assertEqual((days[0], days[-1]), window)
+        self.assertEqual(len(days), 2 * menu.MENU_HORIZON_DAYS + 1)
+
+    def test_extend_menu(self):
+        """
+        Test menu window follows days and days outside it are read
+        from food availability.
+        """
+        today = date.today()
+        food = Food()
+        food.description = 'Pierogi'
+        food.date_available_from = datetime(2010, 1, 1)
+        food.date_available_to = datetime(2030, 1, 1)
+        db.session.add(food)
+        db.session.commit()
+        self.assertEqual(MenuDay.query.count(), 0)
+        self.assertEqual(menu.day_menu(today).count(), 1)
+        menu.extend_menu(today)
+        self.assertEqual(menu.filled_window(), menu.menu_window(today))
+        self.assertEqual(
+            MenuDay.query.count(), 2 * menu.MENU_HORIZON_DAYS + 1,
+        )
+        self.assertEqual(menu.day_menu(date(2012, 5, 5)).count(), 1)
+        self.assertEqual(menu.day_menu(date(2030, 1, 2)).count(), 0)
+        tomorrow = today + timedelta(days=1)
+        menu.extend_menu(tomorrow)
+        first_day, last_day = menu.menu_window(tomorrow)
+        self.assertEqual(menu.filled_window(), (first_day, last_day))
+        days = [menu_day.day for menu_day in
+                MenuDay.query.order_by(MenuDay.day)]
+        self.assertEqual((days[0], days[-1]), (first_day, last_day))
+        self.assertEqual(len(days), 2 * menu.MENU_HORIZON_DAYS + 1)
+
+    def test_menu_without_extend(self):
+        """
+        Test long available food stays in menu after days filled by
+        last extend_menu, also when it is added after that run.
+        """
+        menu.extend_menu(date(2026, 1, 5))
+        food = Food()
+        food.description = 'Pierogi'
+        food.date_available_from = datetime(2026, 1, 5)
+        food.date_available_to = datetime(2026, 12, 31)
+        db.session.add(food)
+        db.session.commit()
+        first_day, last_day = menu.filled_window()
+        for day in (date(2026, 1, 5), last_day,
+                    last_day + timedelta(days=1), date(2026, 4, 1)):
+            self.assertEqual(menu.day_menu(day).count(), 1)
+        self.assertEqual(menu.day_menu(date(2027, 1, 1)).count(), 0)
+
+
+class LunchBackendCacheTestCase(unittest.TestCase):
+    """
+    Reference data cache tests.
+    """
+
+    def setUp(self):
+        """
+        Before each test, set up a environment.
+        """
+        db.create_all()
+        cache.cache.clear()
+
+    def tearDown(self):
+        """
+        Get rid of unused objects after each test.
+        """
+        db.session.remove()
+        db.drop_all()
+
+    def test_companies_cache(self):
+        """
+        Test companies are read once and reloaded after commit.
+        """
+        fill_company()
+        self.assertEqual(
+            [comp.name for comp in cache.get_companies()],
+            ['Tomas', 'Pod Koziołkiem'],
+        )
+        db.session.execute(Company.__table__.insert(), {'name': 'Hidden'})
+        self.assertEqual(len(cache.get_companies()), 2)
+        company = Company()
+        company.name = 'SwietaKrowa'
+        db.session.add(company)
+        db.session.commit()
+        self.assertEqual(
+            [comp.name for comp in cache.get_companies()],
+            ['Tomas', 'Pod Koziołkiem', 'Hidden', 'SwietaKrowa'],
+        )
+
+    def test_ordering_info_cache(self):
+        """
+        Test ordering info is reloaded after it was changed.
+        """
+        allow_ordering()
+        self.assertTrue(cache.get_ordering_info().is_allowed)
+        resp = main.app.test_client().get('/finance_block_ordering')
+        self.assertEqual(resp.status_code, 302)
+        self.assertFalse(cache.get_ordering_info().is_allowed)
+
+    def test_file_generation(self):
+        """
+        Test invalidation in one worker reaches other worker through file.
+        """
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'generation')
+            worker_1 = cache.LocalCache(cache.FileGeneration(path))
+            worker_2 = cache.LocalCache(cache.FileGeneration(path))
+            self.assertEqual(worker_1.get('key', lambda: 1), 1)
+            self.assertEqual(worker_2.get('key', lambda: 1), 1)
+            self.assertEqual(worker_2.get('key', lambda: 2), 1)
+            worker_1.invalidate('key')
+            self.assertEqual(worker_2.get('key', lambda: 2), 2)
+            self.assertEqual(worker_1.get('key', lambda: 2), 2)
+            self.assertEqual(worker_1.generation.current(), 1)
+
+
+class LunchBackendMailingTestCase(unittest.TestCase):
+    """
+    Mail outbox tests.
+    """
+
+    def setUp(self):
+        """
+        Before each test, set up a environment.
+        """
+        db.create_all()
+
+    def tearDown(self):
+        """
+        Get rid of unused objects after each test.
+        """
+        db.session.remove()
+        db.drop_all()
+
+    def test_queue_mail(self):
+        """
+        Test mails are queued in transaction and sent once.
+        """
+        mailing.queue_mail('Rolled back', ['x@x.pl'], 'body')
+        db.session.rollback()
+        self.assertEqual(mailing.queue_mail('Nobody', ['', None], 'b'), [])
+        mailing.queue_mail('Subject', ['x@x.pl', 'y@y.pl'], 'body')
+        db.session.commit()
+        self.assertEqual(OutboxMail.query.count(), 1)
+        with mail.record_messages() as outbox:
+            self.assertEqual(send_queued_mails(), (1, 0))
+            self.assertEqual(send_queued_mails(), (0, 0))
+            self.assertEqual(len(outbox), 1)
+            self.assertEqual(outbox[0].subject, 'Subject')
+            self.assertEqual(outbox[0].recipients, ['x@x.pl', 'y@y.pl'])
+        outbox_mail = OutboxMail.query.one()
+        self.assertIsNotNone(outbox_mail.sent)
+        self.assertIsNone(outbox_mail.next_attempt)
+
+    def test_dispatch_outbox_retry(self):
+        """
+        Test failed mails are retried with growing delay.
+        """
+        mailing.queue_mail('Subject', ['x@x.pl'], 'body')
+        db.session.commit()
+        now = OutboxMail.query.one().next_attempt
+        with patch('flask_mail.Connection.send') as send:
+            send.side_effect = IOError('connection refused')
+            self.assertEqual(send_queued_mails(now=now), (0, 1))
+            outbox_mail = OutboxMail.query.one()
+            self.assertEqual(outbox_mail.attempts, 1)
+            self.assertEqual(outbox_mail.last_error, 'connection refused')
+            self.assertEqual(
+                outbox_mail.next_attempt,
+                now + timedelta(minutes=1),
+            )
+            self.assertEqual(send_queued_mails(now=now), (0, 0))
+            now += timedelta(minutes=1)
+            self.assertEqual(send_queued_mails(now=now), (0, 1))
+            self.assertEqual(
+                OutboxMail.query.one().next_attempt,
+                now + timedelta(minutes=2),
+            )
+        now += timedelta(minutes=2)
+        with mail.record_messages() as outbox:
+            self.assertEqual(send_queued_mails(now=now), (1, 0))
+            self.assertEqual(len(outbox), 1)
+        self.assertEqual(OutboxMail.query.one().attempts, 3)
+
+    def test_claim_outbox(self):
+        """
+        Test claimed mails are not taken by other worker until claim
+        expires, failed worker cycle keeps worker running.
+        """
+        for number in range(3):
+            mailing.queue_mail('Subject', ['x{}@x.pl'.format(number)], 'b')
+        db.session.commit()
+        now = max(
+            outbox_mail.next_attempt for outbox_mail in OutboxMail.query
+        )
+        first = mailing.claim_outbox(2, now)
+        second = mailing.claim_outbox(2, now)
+        self.assertEqual([claimed.id for claimed in first], [1, 2])
+        self.assertEqual([claimed.id for claimed in second], [3])
+        self.assertEqual(mailing.claim_outbox(2, now), [])
+        expired = mailing.claim_outbox(5, now + mailing.CLAIM_TIMEOUT)
+        self.assertEqual([claimed.id for claimed in expired], [1, 2, 3])
+        with patch('lunch_app.mailing.claim_outbox') as claim_outbox, \
+                app.app_context():
+            claim_outbox.side_effect = RuntimeError('database gone')
+            self.assertIsNone(mailing.dispatch_cycle())
+        self.assertEqual(OutboxMail.query.count(), 3)
+
+    def test_dispatch_outbox_gives_up(self):
+        """
+        Test mail is not retried after too many attempts.
+        """
+        [outbox_mail] = mailing.queue_mail('Subject', ['x@x.pl'], 'body')
+        outbox_mail.attempts = mailing.MAX_ATTEMPTS - 1
+        db.session.commit()
+        with patch('flask_mail.Connection.send') as send:
+            send.side_effect = IOError('connection refused')
+            self.assertEqual(send_queued_mails(), (0, 1))
+        outbox_mail = OutboxMail.query.one()
+        self.assertIsNone(outbox_mail.next_attempt)
+        self.assertIsNone(outbox_mail.sent)
+
+    def test_send_bulk(self):
+        """
+        Test bulk sending reuses connection up to given limit.
+        """
+        with app.app_context(), mail.record_messages() as outbox:
+            messages = [
+                Message('Summary', recipients=['user{}@x.pl'.format(i)])
+                for i in range(5)
+            ]
+            report = mailing.send_bulk(messages, max_per_connection=2)
+            self.assertEqual(len(outbox), 5)
+        self.assertEqual((report.sent, report.failed), (5, 0))
+        self.assertEqual(report.connections, 3)
+        self.assertEqual(report.statuses['user4@x.pl'], mailing.SENT)
+        self.assertEqual(len(report.statuses), 5)
+
+    def test_send_bulk_errors(self):
+        """
+        Test bulk sending reconnects and isolates rejected messages.
+        """
+        errors = [
+            smtplib.SMTPServerDisconnected('gone'),
+            None,
+            smtplib.SMTPRecipientsRefused({'y@y.pl': (550, 'no mailbox')}),
+            None,
+        ]
+        with app.app_context(), \
+                patch('flask_mail.Connection.send', side_effect=errors):
+            report = mailing.send_bulk([
+                Message('Summary', recipients=['x@x.pl']),
+                Message('Summary', recipients=['y@y.pl']),
+                Message('Summary', recipients=['z@z.pl']),
+            ])
+        self.assertEqual((report.sent, report.failed), (2, 1))
+        self.assertEqual(report.connections, 2)
+        self.assertEqual(report.statuses['x@x.pl'], mailing.SENT)
+        self.assertIn('no mailbox', report.statuses['y@y.pl'])
+        self.assertEqual(report.statuses['z@z.pl'], mailing.SENT)
+
+    @patch.dict(app.config, {'MAIL_MAX_RECIPIENTS': 2})
+    def test_queue_mail_chunks(self):
+        """
+        Test broadcast mail is queued in recipient chunks.
+        """
+        recipients = ['user{}@x.pl'.format(i) for i in range(5)]
+        outbox_mails = mailing.queue_mail('Pizza', recipients, 'body')
+        db.session.commit()
+        self.assertEqual(
+            [outbox_mail.recipients.split('\n')
+             for outbox_mail in outbox_mails],
+            [recipients[0:2], recipients[2:4], recipients[4:]],
+        )
+        self.assertEqual(OutboxMail.query.count(), 3)
+
+    def test_send_bulk_connections(self):
+        """
+        Test bulk sending over parallel connections keeps results order.
+        """
+        with app.app_context(), mail.record_messages() as outbox:
+            messages = [
+                Message('Summary', recipients=['user{}@x.pl'.format(i)])
+                for i in range(7)
+            ]
+            report = mailing.send_bulk(messages, connections=3)
+            self.assertEqual(len(outbox), 7)
+        self.assertEqual((report.sent, report.failed), (7, 0))
+        self.assertEqual(report.connections, 3)
+        self.assertEqual(report.recipients, 7)
+        self.assertEqual(
+            [message for message, _error in report.results],
+            messages,
+        )
+
+
+class LunchWebCrawlersTestCases(unittest.TestCase):
+    """
+    Webcrawlers tests.
+    """
+    def setUp(self):
+        """
+        Before each test, set up a environment.
+        """
+        self.client = main.app.test_client()
+
+    def tearDown(self):
+        """
+        Get rid of unused objects after each test.
+        """
+        pass
+
+    @patch(
+        'lunch_app.webcrawler.read_webpage',
+        new=MOCK_WWW_KOZIOLEK,
+    )
+    def test_get_dania_dnia_from_pod_koziolek(self):
+        """
+        Tests web crawling functions works properly Koziolek add meal of a day
+        """
+        data = get_dania_dnia_from_pod_koziolek()
+        self.assertGreaterEqual(len(data), 2)
+        self.assertGreaterEqual(len(data["zupa_dnia"]), 1)
+        self.assertGreaterEqual(len(data['danie_dania_1']), 1)
+
+    @patch(
+        'lunch_app.webcrawler.read_webpage',
+        new=MOCK_WWW_TOMAS,
+    )
+    def test_get_week_from_tomas(self):
+        """
+        Tests web crawling functions works properly for Tomas add week
+        """
+        data = get_week_from_tomas()
+        self.assertEqual(len(data), 6)
+        self.assertGreaterEqual(len(data['diet']), 1)
+        for i in range(1, 6):
+            food = data['dzien_{}'.format(i)]
+            self.assertEqual(len(food), 3, msg="ERROR IN {}".format(i))
+            self.assertGreaterEqual(
+                len(food['zupy']),
+                1,
+                msg="ERROR IN {}".format(i),
+            )
+            self.assertGreaterEqual(
+                len(food['dania']),
+                1,
+                msg="ERROR IN {}".format(i),
+            )
+            self.assertGreaterEqual(
+                len(food['zupa_i_dania']),
+                1,
+                msg="ERROR IN {}".format(i),
+            )
+
+    def test_koziolek_menu(self):
+        """
+        Tests Koziolek menu lines with second soup and multi line dishes.
+        """
+        self.assertEqual(
+            koziolek_menu([
+                'Dania dnia', 'Zupa Ogórkowa', 'zupa pomidorowa', ' z ryżem',
+                '1.Kotlet', 'z ziemniakami', '2.Placki', 'z gulaszem',
+            ]),
+            {
+                'zupa_dnia': 'Zupa Ogórkowa z ryżem',
+                'zupa_dnia_2': 'zupa pomidorowa',
+                'danie_dania_1': '1.Kotlet z ziemniakami',
+                'danie_dania_2': '2.Placki z gulaszem',
+            },
+        )
+        self.assertEqual(
+            koziolek_menu(['Dania dnia', 'Rosół', '1.Kotlet']),
+            {'zupa_dnia': 'Rosół', 'danie_dania_1': '1.Kotlet'},
+        )
+
+    def test_tomas_menu(self):
+        """
+        Tests Tomas menu lines are split into diet and days.
+        """
+        tokens = [
+            'ok.440kcal Polędwiczki', 'ryż.', 'ok.490kcal Pierś',
+        ]
+        for day in range(5):
+            tokens += [
+                'ZUPA DNIA:', 'żurek, barszcz.', 'DANIE DNIA:',
+                'Danie {}'.format(day),
+            ]
+        menu = tomas_menu(tokens)
+        self.assertEqual(
+            menu['diet'],
+            ['ok.440kcal Polędwiczki ryż.', 'ok.490kcal Pierś'],
+        )
+        self.assertEqual(menu['dzien_5'], {
+            'zupy': ['żurek', 'barszcz'],
+            'dania': ['Danie 4'],
+            'zupa_i_dania': ['żurek + Danie 4', 'barszcz + Danie 4'],
+        })
+
+
+class LunchBackendSchedulerTestCase(unittest.TestCase):
+    """
+    Scheduler tests.
+    """
+
+    def setUp(self):
+        """
+        Before each test, set up a environment.
+        """
+        db.create_all()
+
+    def tearDown(self):
+        """
+        Get rid of unused objects after each test.
+        """
+        db.session.remove()
+        db.drop_all()
+
+    def test_cron_schedule(self):
+        """
+        Test next run times of cron expressions.
+        """
+        schedule = scheduler.CronSchedule('30 7 * * 1-5')
+        self.assertEqual(
+            schedule.next_after(datetime(2015, 2, 13, 8, 0)),
+            datetime(2015, 2, 16, 7, 30),
+        )
+        self.assertEqual(
+            schedule.next_after(datetime(2015, 2, 16, 7, 29, 59)),
+            datetime(2015, 2, 16, 7, 30),
+        )
+        schedule = scheduler.CronSchedule('*/15 * * * *')
+        self.assertEqual(
+            schedule.next_after(datetime(2015, 12, 31, 23, 50)),
+            datetime(2016, 1, 1, 0, 0),
+        )
+        schedule = scheduler.CronSchedule('0 6 1 3 0')
+        self.assertEqual(
+            schedule.next_after(datetime(2015, 2, 16)),
+            datetime(2015, 3, 1, 6, 0),
+        )
+        self.assertEqual(
+            schedule.next_after(datetime(2015, 3, 1, 6, 0)),
+            datetime(2015, 3, 8, 6, 0),
+        )
+        for expression in ('* * * *', '60 * * * *', '5-1 * * * *'):
+            with self.assertRaises(ValueError):
+                scheduler.CronSchedule(expression)
+
+    @patch.dict(scheduler.JOBS, clear=True)
+    def test_run_pending(self):
+        """
+        Test failed job is retried with backoff and success is recorded.
+        """
+        function = Mock(side_effect=[IOError('down'), IOError('down'), None])
+        scheduler.register_job('test', '0 8 * * *', function)
+        now = datetime(2015, 2, 16, 7, 0)
+        self.assertEqual(scheduler.run_pending(now), ([], ['test']))
+        state = ScheduledJob.query.get('test')
+        self.assertEqual(state.failures, 1)
+        self.assertEqual(state.last_error, 'down')
+        self.assertEqual(state.next_run, datetime(2015, 2, 16, 7, 1))
+        self.assertEqual(
+            scheduler.run_pending(datetime(2015, 2, 16, 7, 0, 30)),
+            ([], []),
+        )
+        now = datetime(2015, 2, 16, 7, 1)
+        self.assertEqual(scheduler.run_pending(now), ([], ['test']))
+        self.assertEqual(
+            ScheduledJob.query.get('test').next_run,
+            datetime(2015, 2, 16, 7, 3),
+        )
+        now = datetime(2015, 2, 16, 7, 3)
+        self.assertEqual(scheduler.run_pending(now), (['test'], []))
+        state = ScheduledJob.query.get('test')
+        self.assertEqual(state.last_success, now)
+        self.assertEqual(state.failures, 0)
+        self.assertIsNone(state.last_error)
+        self.assertEqual(state.next_run, datetime(2015, 2, 16, 8, 0))
+        self.assertEqual(function.call_count, 3)
+
+    @patch.dict(scheduler.JOBS, clear=True)
+    def test_retry_before_next_run(self):
+        """
+        Test retry is not delayed past next regular run.
+        """
+        function = Mock(side_effect=IOError('down'))
+        scheduler.register_job('test', '0 8 * * *', function)
+        state = ScheduledJob(name='test', failures=5)
+        state.next_run = datetime(2015, 2, 16, 7, 59)
+        db.session.add(state)
+        db.session.commit()
+        scheduler.run_pending(datetime(2015, 2, 16, 7, 59))
+        self.assertEqual(
+            ScheduledJob.query.get('test').next_run,
+            datetime(2015, 2, 16, 8, 0),
+        )
+
+
+class LunchBackendIngestTestCase(unittest.TestCase):
+    """
+    Bulk food ingestion tests.
+    """
+
+    def setUp(self):
+        """
+        Before each test, set up a environment.
+        """
+        db.create_all()
+
+    def tearDown(self):
+        """
+        Get rid of unused objects after each test.
+        """
+        db.session.remove()
+        db.drop_all()
+
+    def test_insert_foods(self):
+        """
+        Test foods are inserted with menu days, blank and repeated
+        lines are skipped.
+        """
+        day = date(2015, 2, 16)
+        rows = [
+            ingest.food_row(description, 5, 'menu', day,
+                            day + timedelta(days=1), 'Tomas')
+            for description in ('Pierogi', '', '  ', 'Placki', 'Pierogi')
+        ]
+        self.assertEqual(ingest.insert_foods(rows), (2, 3))
+        db.session.commit()
+        self.assertEqual(ingest.insert_foods(rows), (0, 5))
+        db.session.commit()
+        self.assertEqual(
+            [food.description for food in menu.day_menu(day)],
+            ['Pierogi', 'Placki'],
+        )
+        self.assertEqual(menu.day_menu(day + timedelta(days=1)).count(), 2)
+        self.assertEqual(menu.day_menu(day + timedelta(days=2)).count(), 0)
+
+    def test_insert_food_ids(self):
+        """
+        Test ids of inserted foods come from inserts, in order of rows,
+        and menu days are added for exactly those foods.
+        """
+        day = date.today()
+        rows = [
+            ingest.food_row(description, 5, 'menu', day, day, 'Tomas')
+            for description in ('Pierogi', 'Placki', 'Zupa')
+        ]
+        menu.extend_menu(day)
+        ids = ingest.insert_food_ids(rows[:2])
+        self.assertEqual(
+            [Food.query.get(food_id).description for food_id in ids],
+            ['Pierogi', 'Placki'],
+        )
+        ingest.insert_rows(rows[2:])
+        db.session.commit()
+        zupa = Food.query.filter(Food.description == 'Zupa').one()
+        self.assertEqual(
+            [(menu_day.food_id, menu_day.day) for menu_day in
+             MenuDay.query.all()],
+            [(zupa.id, day)],
+        )
+
+    def test_upsert_foods(self):
+        """
+        Test foods are matched on company, description and availability.
+        """
+        day = date(2015, 2, 16)
+
+        def foods(cost):
+            """
+            Returns foods to upsert.
+            """
+            return [
+                ingest.food_row('Zupa', 2, 'daniednia', day, day, 'Tomas'),
+                ingest.food_row('Zupa', 2, 'daniednia', day, day, 'Tomas'),
+                ingest.food_row('Zupa', 2, 'daniednia', day, day, 'Koziołek'),
+                ingest.food_row('Danie', cost, 'daniednia', day, day, 'Tomas'),
+                ingest.food_row(
+                    'Danie', cost, 'tygodniowe',
+                    day, day + timedelta(days=4), 'Tomas',
+                ),
+            ]
+
+        self.assertEqual(ingest.upsert_foods(foods(10)), (4, 0))
+        db.session.commit()
+        self.assertEqual(ingest.upsert_foods(foods(10)), (0, 0))
+        self.assertEqual(ingest.upsert_foods(foods(11)), (0, 2))
+        db.session.commit()
+        self.assertEqual(Food.query.count(), 4)
+        self.assertEqual(
+            Food.query.filter(Food.description == 'Danie', Food.cost == 11)
+            .count(),
+            2,
+        )
+
+    def test_import_foods_csv(self):
+        """
+        Test catalogue is inserted in batches, invalid records are
+        reported with their lines.
+        """
+        fill_company()
+        catalogue = io.StringIO(
+            'company,description,cost,type,available_from,available_to\n'
+            'Tomas,Pierogi,12.5,menu,2015-01-01,2015-12-31\n'
+            'Tomas,"Placki, duże",14,menu,2015-01-01,2015-12-31\n'
+            'Tomas,Pierogi,12.5,menu,2015-01-01,2015-12-31\n'
+            'Nowa,Zupa,5,menu,2015-01-01,2015-12-31\n'
+            'Tomas,Zupa,abc,menu,2015-01-01,2015-12-31\n'
+            'Tomas,Zupa,5,obiad,2015-01-01,2015-12-31\n'
+            'Tomas,Zupa,5,menu,2015-12-31,2015-01-01\n'
+            'Tomas,Zupa,"5,5",daniednia,2015-01-05,2015-01-05\n'
+            'Tomas,Kotlet,9,menu,2015-01-01,2115-01-01\n'
+            'Tomas,Kotlet,NaN,menu,2015-01-01,2015-12-31\n'
+            'Tomas,Kotlet,Infinity,menu,2015-01-01,2015-12-31\n'
+            'Tomas,Kotlet,-inf,menu,2015-01-01,2015-12-31\n'
+        )
+        report = ingest.import_foods(catalogue, 'csv', batch_size=2)
+        self.assertEqual(
+            (report.inserted, report.skipped, report.invalid), (3, 1, 8),
+        )
+        self.assertEqual(report.errors, [
+            "line 5: unknown company: 'Nowa'",
+            "line 6: invalid cost: 'abc'",
+            "line 7: unknown type: 'obiad'",
+            'line 8: available_from after available_to',
+            'line 10: available longer than 366 days',
+            "line 11: invalid cost: 'NaN'",
+            "line 12: invalid cost: 'Infinity'",
+            "line 13: invalid cost: '-inf'",
+        ])
+        self.assertEqual(
+            [food.description for food in menu.day_menu(date(2015, 1, 5))],
+            ['Pierogi', 'Placki, duże', 'Zupa'],
+        )
+        self.assertEqual(Food.query.filter_by(description='Zupa').one().cost,
+                         5.5)
+
+    def test_import_foods_json_lines(self):
+        """
+        Test JSON Lines catalogue, type may be given as o_type.
+        """
+        fill_company()
+        catalogue = io.StringIO(
+            '{"company": "Tomas", "description": "Pierogi", "cost": 12,'
+            ' "o_type": "menu", "available_from": "2015-01-01",'
+            ' "available_to": "2015-12-31"}\n'
+            '\n'
+            '{"company": "Tomas", "description": "Placki"\n'
+            '["Tomas"]\n'
+            '{"company": "Tomas", "description": "Zupa", "cost": NaN,'
+            ' "o_type": "menu", "available_from": "2015-01-01",'
+            ' "available_to": "2015-12-31"}\n'
+        )
+        report = ingest.import_foods(catalogue, 'jsonl')
+        self.assertEqual(
+            (report.inserted, report.skipped, report.invalid), (1, 0, 3),
+        )
+        self.assertTrue(report.errors[0].startswith('line 3: invalid JSON'))
+        self.assertEqual(report.errors[1], 'line 4: record is not an object')
+        self.assertEqual(report.errors[2], 'line 5: invalid cost: nan')
+        self.assertEqual(ingest.import_format('Menu.JSONL'), 'jsonl')
+        self.assertIsNone(ingest.import_format('menu.xls'))
+
+
+class MockPageHandler(SimpleHTTPRequestHandler):
+    """
+    Serves mock restaurant pages with keep-alive connections.
+    """
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+        """
+        Keeps test output clean.
+        """
+        pass
+
+
+class LunchCrawlerTestCase(unittest.TestCase):
+    """
+    Concurrent crawler tests against local copy of restaurant pages.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        """
+        Starts local HTTP server with mock pages.
+        """
+        directory = os.path.join(os.path.dirname(__file__), '..', '..', 'etc')
+        cls.server = ThreadingHTTPServer(
+            ('127.0.0.1', 0),
+            partial(MockPageHandler, directory=directory),
+        )
+        cls.server.daemon_threads = True
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.base_url = 'http://127.0.0.1:{}/'.format(cls.server.server_port)
+        cls.pages = {}
+        for name in ('koziolek', 'tomas'):
+            with open(os.path.join(directory, 'mock_{}.html'.format(name)),
+                      'rb') as page:
+                cls.pages[name] = page.read()
+
+    @classmethod
+    def tearDownClass(cls):
+        """
+        Stops local HTTP server.
+        """
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self):
+        """
+        Before each test, set up a environment.
+        """
+        db.create_all()
+        self.config = patch.dict(app.config, {
+            'URL_POD_KOZIOLKIEM': self.base_url + 'mock_koziolek.html',
+            'URL_TOMAS': self.base_url + 'mock_tomas.html',
+        })
+        self.config.start()
+
+    def tearDown(self):
+        """
+        Get rid of unused objects after each test.
+        """
+        self.config.stop()
+        crawler.pool.close()
+        db.session.remove()
+        db.drop_all()
+
+    def test_fetch(self):
+        """
+        Test page is fetched reusing open connection.
+        """
+        pool = crawler.ConnectionPool(timeout=5)
+        url = self.base_url + 'mock_tomas.html'
+        self.assertEqual(crawler.fetch(url, pool), self.pages['tomas'])
+        self.assertEqual(pool.idle_count(), 1)
+        self.assertEqual(crawler.fetch(url, pool), self.pages['tomas'])
+        self.assertEqual(pool.idle_count(), 1)
+        with self.assertRaises(IOError):
+            crawler.fetch(self.base_url + 'missing.html', pool)
+        pool.close()
+
+    def test_crawl(self):
+        """
+        Test all registered sources are crawled and stored.
+        """
+        results = crawler.crawl()
+        self.assertEqual(
+            [result.source.name for result in results],
+            ['koziolek', 'tomas'],
+        )
+        self.assertTrue(all(result.ok for result in results))
+        self.assertEqual(
+            results[0].data,
+            parse_pod_koziolek(self.pages['koziolek']),
+        )
+        self.assertEqual(
+            results[1].data,
+            parse_week_tomas(self.pages['tomas']),
+        )
+        inserted, updated = crawler.store(results, date(2015, 2, 16))
+        self.assertEqual(inserted, Food.query.count())
+        self.assertEqual(updated, 0)
+        self.assertEqual(
+            Food.query.filter(Food.company == 'Pod Koziołkiem').count(),
+            len(results[0].data),
+        )
+        with self.assertRaises(ValueError):
+            crawler.crawl(['unknown'])
+
+    def test_crawl_unchanged(self):
+        """
+        Test unchanged pages are neither parsed nor stored again.
+        """
+        today = date(2015, 2, 16)
+        crawler.store(crawler.crawl(today=today), today)
+        count = Food.query.count()
+        state = CrawlState.query.get('tomas')
+        self.assertIsNotNone(state.last_modified)
+        self.assertIsNotNone(state.content_hash)
+        self.assertEqual(state.ingested, today)
+
+        results = crawler.crawl(today=today)
+        self.assertTrue(all(result.unchanged for result in results))
+        self.assertIsNone(results[1].parse_time)
+        self.assertEqual(crawler.store(results, today), (0, 0))
+
+        # server without validators, content hash decides
+        CrawlState.query.update({'etag': None, 'last_modified': None})
+        db.session.commit()
+        with patch('lunch_app.crawler.fetch_page') as fetch_page:
+            fetch_page.return_value = crawler.Page(200, self.pages['tomas'])
+            self.assertTrue(
+                crawler.crawl(['tomas'], today=today)[0].unchanged
+            )
+
+        results = crawler.crawl(force=True, today=today)
+        self.assertFalse(any(result.unchanged for result in results))
+        self.assertEqual(crawler.store(results, today), (0, 0))
+        self.assertEqual(Food.query.count(), count)
+
+    def test_crawl_unchanged_next_day(self):
+        """
+        Test unchanged page is stored again for foods of next day.
+        """
+        for day in (datetime(2015, 2, 16), datetime(2015, 2, 17)):
+            today = day.date()
+            results = crawler.crawl(['koziolek'], today=today)
+            self.assertFalse(results[0].unchanged)
+            crawler.store(results, today)
+            self.assertEqual(
+                Food.query.filter(
+                    Food.company == 'Pod Koziołkiem',
+                    Food.date_available_from == day,
+                ).count(),
+                3,
+            )
+            self.assertEqual(
+                CrawlState.query.get('koziolek').ingested, today,
+            )
+        self.assertTrue(
+            crawler.crawl(['koziolek'], today=today)[0].unchanged
+        )
+
+    def test_crawl_statistics(self):
+        """
+        Test parse time is recorded and peak memory on demand.
+        """
+        result = crawler.crawl(['tomas'])[0]
+        self.assertGreater(result.parse_time, 0)
+        self.assertIsNone(result.peak_memory)
+        result = crawler.crawl(['tomas'], trace_memory=True)[0]
+        self.assertGreater(result.peak_memory, 0)
+        self.assertGreaterEqual(result.elapsed, result.parse_time)
+
+    def test_crawl_error(self):
+        """
+        Test failing source does not stop others.
+        """
+        app.config['URL_TOMAS'] = self.base_url + 'missing.html'
+        koziolek, tomas = crawler.crawl()
+        self.assertTrue(koziolek.ok)
+        self.assertFalse(tomas.ok)
+        self.assertIn('404', str(tomas.error))
+        crawler.store([koziolek, tomas], date(2015, 2, 16))
+        self.assertEqual(Food.query.count(), len(koziolek.data))
+
+    def test_crawl_job(self):
+        """
+        Test scheduled crawl stores menu and fails on unreachable page.
+        """
+        for day in (datetime(2015, 2, 16), datetime(2015, 2, 17)):
+            scheduler.crawl_job('koziolek', day.date())
+            self.assertEqual(
+                Food.query.filter(
+                    Food.company == 'Pod Koziołkiem',
+                    Food.date_available_from == day,
+                ).count(),
+                3,
             )
+        app.config['URL_TOMAS'] = self.base_url + 'missing.html'
+        with self.assertRaises(IOError):
+            scheduler.crawl_job('tomas')
 
 
 def suite():
@@ -1126,7 +2664,15 @@ def suite():
     base_suite.addTest(unittest.makeSuite(LunchBackendViewsTestCase))
     base_suite.addTest(unittest.makeSuite(LunchBackendUtilsTestCase))
     base_suite.addTest(unittest.makeSuite(LunchBackendPermissionsTestCase))
+    base_suite.addTest(unittest.makeSuite(LunchBackendReportsTestCase))
+    base_suite.addTest(unittest.makeSuite(LunchBackendPaymentsTestCase))
+    base_suite.addTest(unittest.makeSuite(LunchBackendMenuTestCase))
+    base_suite.addTest(unittest.makeSuite(LunchBackendCacheTestCase))
+    base_suite.addTest(unittest.makeSuite(LunchBackendMailingTestCase))
+    base_suite.addTest(unittest.makeSuite(LunchBackendSchedulerTestCase))
+    base_suite.addTest(unittest.makeSuite(LunchBackendIngestTestCase))
     base_suite.addTest(unittest.makeSuite(LunchWebCrawlersTestCases))
+    base_suite.addTest(unittest.makeSuite(LunchCrawlerTestCase))
     return base_suite
 
 
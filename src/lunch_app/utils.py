@@ -3,6 +3,9 @@
 helper functions for jinjna.
 """
 import datetime
+import decimal
+
+GROSZ = decimal.Decimal('0.01')
 
 
 def get_current_datetime():
@@ -50,6 +53,18 @@ def make_datetime(new_date):
     return date
 
 
+def make_money(value):
+    """
+    Converts number or numeric string to Decimal amount of PLN
+    rounded to grosze.
+    """
+    if value is None:
+        return None
+    if not isinstance(value, decimal.Decimal):
+        value = decimal.Decimal(str(value))
+    return value.quantize(GROSZ, rounding=decimal.ROUND_HALF_UP)
+
+
 def next_month(year, month):
     """
     Returns next month
@@ -74,3 +89,11 @@ def previous_month(year, month):
     else:
         month -= 1
     return year, month
+
+
+def month_range(year, month):
+    """
+    Returns first day of the month and first day of the next month.
+    """
+    n_year, n_month = next_month(year, month)
+    return datetime.date(year, month, 1), datetime.date(n_year, n_month, 1)
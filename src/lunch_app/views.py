@@ -3,25 +3,26 @@
 """
 Defines views.
 """
-from calendar import monthrange, month_name
-from collections import Counter
+from calendar import month_name
 import datetime
+import io
 from random import choice
 
 
 from flask import redirect, render_template, request, flash, url_for, jsonify
 from flask.ext import login
 from flask.ext.login import current_user
-from flask.ext.mail import Message
 from sqlalchemy import and_
 
-from .main import app, db, mail
+from .main import app, db
+from . import reports
 from .forms import (
     OrderForm,
     AddFood,
     OrderEditForm,
     UserOrders,
     CompanyOrders,
+    CompanySpendForm,
     MailTextForm,
     UserDailyReminderForm,
     FinanceSearchForm,
@@ -32,12 +33,26 @@ from .forms import (
 )
 from .models import (
     Order, Food, User,
-    Finance, MailText, Company,
+    MailText, Company,
     Pizza, OrderingInfo,
 )
+from .cache import get_companies, get_mail_text, get_ordering_info
+from .ingest import (
+    food_row, import_foods, import_format, insert_foods, upsert_foods,
+)
+from .mailing import queue_mail
+from .orders import RANDOM_ORDER_MARKER
+from .pagination import orders_page
+from .menu import day_menu
+from .payments import update_payments
 from .permissions import user_is_admin
-from .utils import next_month, previous_month
-from .webcrawler import get_dania_dnia_from_pod_koziolek, get_week_from_tomas
+from .utils import make_money, next_month, previous_month, month_range
+from .webcrawler import (
+    get_dania_dnia_from_pod_koziolek,
+    get_week_from_tomas,
+    koziolek_foods,
+    tomas_foods,
+)
 
 import logging
 
@@ -48,8 +63,7 @@ def ordering_is_active():
     """
     Returns value true if ordering is active for jinja.
     """
-    ordering_is_allowed = OrderingInfo.query.get(1)
-    return ordering_is_allowed.is_allowed
+    return get_ordering_info().is_allowed
 
 
 def server_url():
@@ -97,47 +111,37 @@ def create_order():
     Create new order page.
     """
     if not current_user.is_active():
-        texts = MailText.query.get(1)
-        flash(texts.blocked_user_text)
+        flash(get_mail_text().blocked_user_text)
         return redirect('overview')
-    ordering_is_allowed = OrderingInfo.query.get(1)
-    if not ordering_is_allowed.is_allowed:
-        texts = MailText.query.get(1)
-        flash(texts.ordering_is_blocked_text)
+    if not get_ordering_info().is_allowed:
+        flash(get_mail_text().ordering_is_blocked_text)
         return redirect('overview')
-    companies = Company.query.all()
+    companies = get_companies()
     form = OrderForm(request.form)
     form.company.choices = [
         (comp.name, "Order from {}".format(comp.name)) for comp in companies
     ]
-    day = datetime.date.today()
-    today_from = datetime.datetime.combine(day, datetime.time(23, 59))
-    today_to = datetime.datetime.combine(day, datetime.time(0, 0))
-    foods = Food.query.filter(
-        and_(
-            Food.date_available_from <= today_from,
-            Food.date_available_to >= today_to,
-        )
-    ).all()
+    foods = day_menu(datetime.date.today()).all()
     if request.method == 'POST' and form.validate():
         order = Order()
         form.populate_obj(order)
         order.user_name = current_user.username
+        order.user_id = current_user.id
         order.description = order.description.strip()
         db.session.add(order)
-        db.session.commit()
-        flash('Order created')
         if form.send_me_a_copy.data:
-            msg = Message(
+            queue_mail(
                 'Lunch order - {}'.format(datetime.date.today()),
-                recipients=[current_user.email],
+                [current_user.email],
+                "Today you ordered {order.description} "
+                "from {order.company} ({order.cost} PLN).\n"
+                "It should be delivered at "
+                "{order.arrival_time}".format(order=order),
             )
-            msg.body = "Today you ordered {order.description} " \
-                       "from {order.company} ({order.cost} PLN).\n" \
-                       "It should be delivered at " \
-                       "{order.arrival_time}".format(order=order)
-            mail.send(msg)
-            flash('Mail send')
+        db.session.commit()
+        flash('Order created')
+        if form.send_me_a_copy.data:
+            flash('Mail queued')
         return redirect('order')
     return render_template(
         'order.html',
@@ -155,7 +159,7 @@ def add_food():
     Add new food page.
     """
     form = AddFood(request.form)
-    companies = Company.query.all()
+    companies = get_companies()
     form.company.choices = [(comp.name, comp.name) for comp in companies]
     if request.method == 'POST' and form.validate() \
             and request.form['add_meal'] == 'add':
@@ -169,23 +173,50 @@ def add_food():
             and request.form['add_meal'] == 'bulk':
         foods = form.description.data
         foods = foods.replace('\r', '').split('\n')
-        number_of_foods_aded = 0
-        for food in foods:
-            meal = Food()
-            meal.company = form.company.data
-            meal.description = food
-            meal.cost = form.cost.data
-            meal.date_available_from = form.date_available_from.data
-            meal.date_available_to = form.date_available_to.data
-            meal.o_type = form.o_type.data
-            db.session.add(meal)
-            number_of_foods_aded += 1
+        inserted, skipped = insert_foods(
+            food_row(
+                food,
+                form.cost.data,
+                form.o_type.data,
+                form.date_available_from.data,
+                form.date_available_to.data,
+                form.company.data,
+            )
+            for food in foods
+        )
         db.session.commit()
-        flash('{} foods added'.format(number_of_foods_aded))
+        flash('{} foods added, {} skipped'.format(inserted, skipped))
         return redirect('add_food')
     return render_template('add_food.html', form=form)
 
 
+@app.route('/import_food', methods=['POST'])
+@login.login_required
+@user_is_admin
+def import_food():
+    """
+    Imports foods from uploaded CSV or JSON Lines catalogue.
+    """
+    catalogue = request.files.get('catalogue')
+    if not catalogue or not catalogue.filename:
+        flash('Choose catalogue file')
+        return redirect(url_for('add_food'))
+    file_format = request.form.get('format') \
+        or import_format(catalogue.filename)
+    if file_format not in ('csv', 'jsonl'):
+        flash('Unknown catalogue format, use .csv or .jsonl file')
+        return redirect(url_for('add_food'))
+    lines = io.TextIOWrapper(catalogue.stream, encoding='utf-8-sig',
+                             errors='replace', newline='')
+    report = import_foods(lines, file_format)
+    flash('{} foods added, {} skipped, {} invalid'.format(
+        report.inserted, report.skipped, report.invalid,
+    ))
+    for error in report.errors:
+        flash(error)
+    return redirect(url_for('add_food'))
+
+
 @app.route('/day_summary', methods=['GET', 'POST'])
 @login.login_required
 @user_is_admin
@@ -193,53 +224,11 @@ def day_summary():
     """
     Day orders summary.
     """
-    companies = Company.query.all()
-    day = datetime.date.today()
-    today_beg = datetime.datetime.combine(day, datetime.time(00, 00))
-    today_end = datetime.datetime.combine(day, datetime.time(23, 59))
-    orders = Order.query.filter(
-        and_(
-            Order.date >= today_beg,
-            Order.date <= today_end,
-        )
-    ).all()
-
-    order_details = {}
-    orders_summary = {
-        '12:00': {},
-        '13:00': {},
-    }
-    for comp in companies:
-        order_details[comp.name] = {
-            '12:00': [],
-            'cost12': 0,
-            '13:00': [],
-            'cost13': 0,
-        }
-        orders_summary['12:00'][comp.name] = {}
-        orders_summary['13:00'][comp.name] = {}
-        for order in orders:
-            foods = order.description
-            foods = foods.replace('\r', '').split('\n')
-            for food in foods:
-                if food and \
-                        food != "!RANDOM ORDER!" and \
-                        order.company == comp.name:
-                    if order.arrival_time == '12:00':
-                        order_details[comp.name]['12:00'].append(order)
-                        order_details[comp.name]['cost12'] += order.cost
-                        try:
-                            orders_summary['12:00'][comp.name][food] += 1
-                        except KeyError:
-                            orders_summary['12:00'][comp.name][food] = 1
-                    elif order.arrival_time == '13:00':
-                        order_details[comp.name]['13:00'].append(order)
-                        order_details[comp.name]['cost13'] += order.cost
-                        try:
-                            orders_summary['13:00'][comp.name][food] += 1
-                        except KeyError:
-                            orders_summary['13:00'][comp.name][food] = 1
-
+    companies = get_companies()
+    order_details, orders_summary = reports.day_summary(
+        datetime.date.today(),
+        companies,
+    )
     return render_template(
         'day_summary.html',
         order_details=order_details,
@@ -252,13 +241,17 @@ def day_summary():
 @login.login_required
 def my_orders():
     """
-    Renders all of current user orders.
+    Renders current user orders page by page, newest first.
     """
-    orders = Order.query.filter_by(user_name=current_user.username).all()
-    orders_cost = sum(order.cost for order in orders)
+    page = orders_page(
+        Order.user_id == current_user.id,
+        request.args.get('after'),
+    )
+    orders_cost = reports.orders_cost(Order.user_id == current_user.id)
     return render_template(
         'my_orders.html',
-        orders=orders,
+        orders=page.orders,
+        next_cursor=page.next_cursor,
         orders_cost=orders_cost,
     )
 
@@ -269,8 +262,7 @@ def info():
     """
     Renders info page.
     """
-    texts = MailText.query.get(1)
-    temp = "{}".format(texts.info_page_text)
+    temp = "{}".format(get_mail_text().info_page_text)
     info = temp.split('\n')
     if len(info) < 2:
         info = "None"
@@ -294,7 +286,7 @@ def edit_order(order_id):
     """
     Renders order edit page.
     """
-    companies = Company.query.all()
+    companies = get_companies()
     order = Order.query.get(order_id)
     form = OrderEditForm(formdata=request.form, obj=order)
     form.company.choices = [(comp.name, comp.name) for comp in companies]
@@ -354,61 +346,19 @@ def order_list_year_view(year, user_id):
     """
     Renders order year list page.
     """
-    year_begin = datetime.datetime(
-        year=year,
-        month=1,
-        day=1,
-        hour=0,
-        minute=0,
-        second=1
-    )
-    year_end = datetime.datetime(
-        year=year,
-        month=12,
-        day=31,
-        hour=23,
-        minute=59,
-        second=59
-    )
     user = User.query.filter(User.id == user_id).first()
-    orders = Order.query.filter(
-        and_(
-            Order.date >= year_begin,
-            Order.date <= year_end,
-            Order.user_name == user.username,
-        )
-    ).all()
-    year_data = []
-    for month in range(1, 13):
-        monthly_data = {
-            'month_name': month_name[month],
-            'number of orders': 0,
-            'month cost': 0,
+    year_data = [
+        {
+            'month_name': month_name[total.month],
+            'number of orders': total.orders,
+            'month cost': total.cost,
         }
-        for order in orders:
-            month_begin = datetime.datetime(
-                year=year,
-                month=month,
-                day=1,
-                hour=0,
-                minute=0,
-                second=1
-            )
-
-            day = monthrange(year, month)[1]
-            month_end = datetime.datetime(
-                year=year,
-                month=month,
-                day=day,
-                hour=23,
-                minute=59,
-                second=59
-            )
-            if month_begin <= order.date <= month_end:
-                monthly_data['number of orders'] += 1
-                monthly_data['month cost'] += order.cost
-
-        year_data.append(monthly_data)
+        for total in reports.monthly_orders(
+            datetime.date(year, 1, 1),
+            datetime.date(year + 1, 1, 1),
+            Order.user_id == user.id,
+        )
+    ]
 
     return render_template(
         'orders_list_year_view.html',
@@ -427,37 +377,20 @@ def order_list_month_view(year, month, user_id):
     """
     Renders order month list page.
     """
-    month_begin = datetime.datetime(
-        year=year,
-        month=month,
-        day=1,
-        hour=0,
-        minute=0,
-        second=1
-    )
-
-    day = monthrange(year, month)[1]
-    month_end = datetime.datetime(
-        year=year,
-        month=month,
-        day=day,
-        hour=23,
-        minute=59,
-        second=59
-    )
+    month_begin, month_end = month_range(year, month)
     pub_date = {'year': year, 'month': month_name[month]}
     user = User.query.filter(User.id == user_id).first()
-    orders = Order.query.filter(
-        and_(
-            Order.date >= month_begin,
-            Order.date <= month_end,
-            Order.user_name == user.username,
-        )
-    ).all()
-    orders_cost = sum(order.cost for order in orders)
+    month_orders = and_(
+        Order.user_id == user.id,
+        Order.order_day >= month_begin,
+        Order.order_day < month_end,
+    )
+    page = orders_page(month_orders, request.args.get('after'))
+    orders_cost = reports.orders_cost(month_orders)
     return render_template(
         'orders_list_month_view.html',
-        orders=orders,
+        orders=page.orders,
+        next_cursor=page.next_cursor,
         orders_cost=orders_cost,
         pub_date=pub_date,
         user=user
@@ -488,38 +421,13 @@ def company_summary_month_view(year, month):
     """
     Renders companies month list page.
     """
-    companies = Company.query.all()
-    month_begin = datetime.datetime(
-        year=year,
-        month=month,
-        day=1,
-        hour=0,
-        minute=0,
-        second=1
-    )
-
-    day = monthrange(year, month)[1]
-    month_end = datetime.datetime(
-        year=year,
-        month=month,
-        day=day,
-        hour=23,
-        minute=59,
-        second=59
-    )
+    companies = get_companies()
+    month_begin, month_end = month_range(year, month)
     pub_date = {'year': year, 'month': month_name[month]}
-    orders = Order.query.filter(
-        and_(
-            Order.date >= month_begin,
-            Order.date <= month_end,
-        )
-    ).all()
+    _periods, spend = reports.company_spend(month_begin, month_end, 'month')
     orders_data = {}
     for comp in companies:
-        orders_data[comp.name] = 0
-        for order in orders:
-            if order.company == comp.name:
-                orders_data[comp.name] += order.cost
+        orders_data[comp.name] = spend.get(comp.id, [0])[0]
     return render_template(
         'company_summary_month_view.html',
         orders_data=orders_data,
@@ -527,6 +435,89 @@ def company_summary_month_view(year, month):
     )
 
 
+def company_spend_form():
+    """
+    Returns spend report form filled from query string,
+    last twelve months by months by default.
+    """
+    if request.args:
+        return CompanySpendForm(request.args)
+    today = datetime.date.today()
+    year, month = today.year - 1, today.month
+    year, month = next_month(year, month)
+    return CompanySpendForm(
+        begin=datetime.date(year, month, 1),
+        end=today,
+        granularity='month',
+    )
+
+
+def company_spend_rows(form):
+    """
+    Returns period starts and spend of every company in each of them.
+    """
+    periods, spend = reports.company_spend(
+        form.begin.data,
+        form.end.data + datetime.timedelta(days=1),
+        form.granularity.data,
+    )
+    rows = []
+    for comp in get_companies():
+        costs = spend.get(comp.id, [make_money(0)] * len(periods))
+        rows.append({
+            'company': comp.name,
+            'costs': costs,
+            'total': sum(costs, make_money(0)),
+        })
+    return periods, rows
+
+
+@app.route('/company_spend', methods=['GET'])
+@login.login_required
+@user_is_admin
+def company_spend():
+    """
+    Renders spend of companies by period.
+    """
+    form = company_spend_form()
+    periods, rows = [], []
+    if form.validate():
+        periods, rows = company_spend_rows(form)
+    return render_template(
+        'company_spend.html',
+        form=form,
+        periods=periods,
+        rows=rows,
+    )
+
+
+@app.route('/company_spend.json', methods=['GET'])
+@login.login_required
+@user_is_admin
+def company_spend_json():
+    """
+    Returns spend of companies by period, amounts as strings.
+    """
+    form = company_spend_form()
+    if not form.validate():
+        resp = jsonify(errors=form.errors)
+        resp.status_code = 400
+        return resp
+    periods, rows = company_spend_rows(form)
+    return jsonify(
+        granularity=form.granularity.data,
+        periods=[period.isoformat() for period in periods],
+        companies=[
+            {
+                'name': row['company'],
+                'costs': [str(cost) for cost in row['costs']],
+                'total': str(row['total']),
+            }
+            for row in rows
+        ],
+    )
+
+
 @app.route('/finance/<int:year>/<int:month>/<int:did_pay>', methods=[
     'GET',
     'POST',
@@ -540,94 +531,17 @@ def finance(year, month, did_pay):
     did_pay = 1 - filter only paid
     did_pay = 2 - filter only unpaid
     """
-    month_begin = datetime.datetime(
-        year=year,
-        month=month,
-        day=1,
-        hour=0,
-        minute=0,
-        second=1
-    )
-    day = monthrange(year, month)[1]
-    month_end = datetime.datetime(
-        year=year,
-        month=month,
-        day=day,
-        hour=23,
-        minute=59,
-        second=59
-    )
-    users = User.query.all()
-    orders = Order.query.filter(
-        and_(
-            Order.date >= month_begin,
-            Order.date <= month_end,
-        )
-    ).all()
-    finances = Finance.query.filter(
-        and_(
-            Finance.month == month,
-            Finance.year == year,
-        )
-    ).all()
-    finance_data = {}
-    finance_user_list = []
-    for user in users:
-        finance_data[user.username] = {
-            'username': user.username,
-            'number_of_orders': 0,
-            'month_cost': 0,
-            'did_user_pay': False,
-        }
-        for order in orders:
-            if user.username == order.user_name:
-                finance_data[user.username]['number_of_orders'] += 1
-                finance_data[user.username]['month_cost'] += order.cost
-        for finance_query in finances:
-            finance_user_list.append(finance_query.user_name)
-            if finance_query.user_name == user.username \
-                    and finance_query.did_user_pay:
-                finance_data[user.username]['did_user_pay'] = True
-        should_drop = (
-            # user didn't bought anything
-            finance_data[user.username]['month_cost'] == 0 or
-            # show paid user and user did not pay
-            (
-                did_pay == 1 and
-                not finance_data[user.username]['did_user_pay']
-            ) or
-            # show unpaid user and user paid
-            (
-                did_pay == 2 and
-                (
-                    finance_data[user.username]['did_user_pay']
-                )
-            )
-        )
-        if should_drop:
-            del finance_data[user.username]
-
+    finance_data = reports.finance_report(year, month, did_pay)
     pub_date = {'year': year, 'month': month_name[month]}
 
-    finance_record = Finance()
-
     if request.method == 'POST':
-        for row in finance_data.values():
-            finance_record.did_user_pay = request.form.get(
-                'did_user_pay_'+row['username'],
+        update_payments(year, month, {
+            row['username']: request.form.get(
+                'did_user_pay_' + row['username'],
                 'off',
             ) == 'on'
-            finance_record.month = month
-            finance_record.year = year
-            finance_record.user_name = row['username']
-            do_not_update = True
-            for record in finances:
-                if record.user_name == row['username']:
-                    record.did_user_pay = finance_record.did_user_pay
-                    do_not_update = False
-            if do_not_update:
-                db.session.add(finance_record)
-        db.session.commit()
+            for row in finance_data.values()
+        })
         flash('Finances changes submitted successfully')
         return redirect(url_for(
             'finance',
@@ -686,91 +600,38 @@ def finance_mail_all():
     Renders mail to all page.
     """
     this_month = datetime.date.today()
-    month_begin = datetime.datetime(
-        year=this_month.year,
-        month=this_month.month,
-        day=1,
-        hour=0,
-        minute=0,
-        second=1
-    )
-    day = monthrange(this_month.year, this_month.month)[1]
-    month_end = datetime.datetime(
-        year=this_month.year,
-        month=this_month.month,
-        day=day,
-        hour=23,
-        minute=59,
-        second=59
-    )
-    users = User.query.all()
-    orders = Order.query.filter(
-        and_(
-            Order.date >= month_begin,
-            Order.date <= month_end,
-        )
-    ).all()
-    finances = Finance.query.filter(
-        and_(
-            Finance.month == this_month.month,
-            Finance.year == this_month.year,
-        )
-    ).all()
-    finance_data = {}
-    finance_user_list = []
-    for user in users:
-        finance_data[user.username] = {
-            'username': user.username,
-            'number_of_orders': 0,
-            'month_cost': 0,
-            'did_user_pay': False,
-        }
-        for order in orders:
-            if user.username == order.user_name:
-                finance_data[user.username]['number_of_orders'] += 1
-                finance_data[user.username]['month_cost'] += order.cost
-        for finance_query in finances:
-            finance_user_list.append(finance_query.user_name)
-            if finance_query.user_name == user.username \
-                    and finance_query.did_user_pay:
-                finance_data[user.username]['did_user_pay'] = True
-        should_drop = (
-            # user didn't bought anything
-            finance_data[user.username]['month_cost'] == 0
-        )
-        if should_drop:
-            del finance_data[user.username]
-    message_text = MailText.query.first()
+    finance_data = reports.finance_report(this_month.year, this_month.month)
+    message_text = get_mail_text()
     if request.method == 'POST' and request.form['send_mail'] == 'all':
         for record in finance_data.values():
-            msg = Message(
+            queue_mail(
                 'Lunch {} / {} summary'.format(month_name[this_month.month],
                                                this_month.year),
-                recipients=[record['username']],
+                [record['username']],
+                "In {} you ordered {} meals for {} PLN.\n {}".format(
+                    month_name[this_month.month],
+                    record['number_of_orders'],
+                    record['month_cost'],
+                    message_text.monthly_pay_summary,
+                ),
             )
-            msg.body = "In {} you ordered {} meals for {} PLN.\n {}".format(
-                month_name[this_month.month],
-                record['number_of_orders'],
-                record['month_cost'],
-                message_text.monthly_pay_summary,
-                )
-            mail.send(msg)
-            flash('Mail send')
+        db.session.commit()
+        flash('Mail queued')
     if request.method == 'POST' and request.form['send_mail'] == 'remind_all':
         for record in finance_data.values():
             if not record['did_user_pay']:
-                msg = Message(
+                queue_mail(
                     'Lunch app payment reminder',
-                    recipients=[record['username']],
+                    [record['username']],
+                    "In {} you ordered {} meals for {} PLN.\n{}".format(
+                        month_name[this_month.month],
+                        record['number_of_orders'],
+                        record['month_cost'],
+                        message_text.pay_reminder,
+                    ),
                 )
-                msg.body = "In {} you ordered {} meals for {} PLN.\n{}".format(
-                    month_name[this_month.month],
-                    record['number_of_orders'],
-                    record['month_cost'],
-                    message_text.pay_reminder,
-                    )
-                mail.send(msg)
-                flash('Mail send')
+        db.session.commit()
+        flash('Mail queued')
         return redirect('finance_mail_all')
 
     return render_template('finance_mail_all.html', finance_data=finance_data)
@@ -787,23 +648,61 @@ def payment_remind(username, slack=0):
     Sends mail to user with reminder or slack reminder.
     """
     this_month = datetime.date.today()
-    message_text = MailText.query.first()
-    msg = Message(
+    message_text = get_mail_text()
+    if slack == 1:
+        body = message_text.pay_slacker_reminder
+    else:
+        body = message_text.pay_reminder
+    queue_mail(
         'Lunch {} / {} payment reminder'.format(
             month_name[this_month.month],
             this_month.year
         ),
-        recipients=[username],
+        [username],
+        body,
     )
-    if slack == 1:
-        msg.body = message_text.pay_slacker_reminder
-    else:
-        msg.body = message_text.pay_reminder
-    mail.send(msg)
-    flash('Mail send')
+    db.session.commit()
+    flash('Mail queued')
     return redirect('finance')
 
 
+@app.route('/finance_debts', methods=['GET', 'POST'])
+@login.login_required
+@user_is_admin
+def finance_debts():
+    """
+    Renders unpaid costs of users over all months,
+    sends slacker reminders to all of them.
+    """
+    sort = request.args.get('sort', 'debt')
+    if sort not in reports.BALANCE_SORTS:
+        sort = 'debt'
+    balances = reports.outstanding_balances(sort)
+    if request.method == 'POST' and request.form['send_mail'] == 'slackers':
+        message_text = get_mail_text()
+        for balance in balances:
+            queue_mail(
+                'Lunch app payment reminder',
+                [balance.username],
+                "You did not pay {} PLN for {} meals since {} {}.\n{}".format(
+                    balance.debt,
+                    balance.orders,
+                    month_name[balance.since[1]],
+                    balance.since[0],
+                    message_text.pay_slacker_reminder,
+                ),
+            )
+        db.session.commit()
+        flash('Mail queued')
+        return redirect(url_for('finance_debts', sort=sort))
+    return render_template(
+        'finance_debts.html',
+        balances=balances,
+        sort=sort,
+        sorts=reports.BALANCE_SORTS,
+    )
+
+
 @app.route('/finance_search', methods=['GET', 'POST'])
 @login.login_required
 @user_is_admin
@@ -829,53 +728,45 @@ def random_food(courage):
     Orders random meal.
     """
     day = datetime.date.today()
-    today_from = datetime.datetime.combine(day, datetime.time(23, 59))
-    today_to = datetime.datetime.combine(day, datetime.time(0, 0))
-    foods = Order.query.filter(
-        and_(
-            Order.date <= today_from,
-            Order.date >= today_to,
-        )
-    ).all()
-    food_list = [order.description for order in foods]
-    food_dict = Counter(food_list)
-    food_dict = food_dict.most_common()
-    if len(food_dict) >= 3:
-        foods = [food_dict[0][0], food_dict[1][0], food_dict[2][0]]
-        food = choice(foods)
-        food = Order.query.filter(Order.description == food).first()
+    popular = reports.popular_dishes(day, 3)
+    # cost of dish is known from its food or order of it alone
+    priced = [
+        dish for dish in popular if dish.food_id or dish.single_order_id
+    ]
+    if len(popular) >= 3 and priced:
+        dish = choice(priced)
+        if dish.food_id:
+            food = Food.query.get(dish.food_id)
+        else:
+            food = Order.query.get(dish.single_order_id)
+        description, company, cost = \
+            dish.description, dish.company, food.cost
     else:
-        foods = Food.query.filter(
-            and_(
-                Food.date_available_from <= today_from,
-                Food.date_available_to >= today_to,
-                Food.o_type != 'menu',
-            )
-        ).all()
+        foods = day_menu(day).filter(Food.o_type != 'menu').all()
         food = choice(foods)
-    if food.description.startswith('!RANDOM O'):
-        food.description = food.description[15:]
+        description, company, cost = \
+            food.description, food.company, food.cost
     if courage >= 1:
         order = Order()
         if courage == 1:
             order.arrival_time = '12:00'
         elif courage == 2:
             order.arrival_time = '13:00'
-        order.company = food.company
-        order.cost = food.cost
-        order.description = '!RANDOM ORDER!\n'
-        order.description += food.description
+        order.company = company
+        order.cost = cost
+        order.description = '{}\n{}'.format(RANDOM_ORDER_MARKER, description)
         order.user_name = current_user.username
+        order.user_id = current_user.id
         db.session.add(order)
         db.session.commit()
         flash('! Random meal ordered !')
         return redirect('order')
     elif courage == 0:
         random_order = {
-            "description": food.description,
-            "cost": food.cost,
+            "description": description,
+            "cost": str(cost),
             "arrival_time": '12:00',
-            "company": food.company
+            "company": company
         }
         resp = jsonify(random_order)
         resp.status_code = 200
@@ -889,32 +780,25 @@ def send_daily_reminder():
     Sends daili reminder to all users.
     """
     day = datetime.date.today()
-    today_beg = datetime.datetime.combine(day, datetime.time(00, 00))
-    today_end = datetime.datetime.combine(day, datetime.time(23, 59))
-    orders = Order.query.filter(
-        and_(
-            Order.date >= today_beg,
-            Order.date <= today_end,
-        )
-    ).all()
+    orders = Order.query.filter(Order.order_day == day).all()
     users = User.query.filter(User.i_want_daily_reminder).all()
-    message_text = MailText.query.first()
+    message_text = get_mail_text()
     emails = ([])
     order_list = ([])
     for order in orders:
-        order_list.append(order.user_name)
+        order_list.append(order.user_id)
     for user in users:
-        if user.username not in order_list:
+        if user.id not in order_list:
             emails.append(user.username)
-    msg = Message(
+    queue_mail(
         '{} {}'.format(
             message_text.daily_reminder_subject,
             datetime.date.today()
         ),
-        recipients=emails,
+        emails,
+        message_text.daily_reminder,
     )
-    msg.body = message_text.daily_reminder
-    mail.send(msg)
+    db.session.commit()
     return redirect('overview')
 
 
@@ -933,7 +817,7 @@ def finance_companies_view():
         db.session.commit()
         flash('Company added')
         return redirect('finance_companies')
-    companies = Company.query.all()
+    companies = get_companies()
     return render_template(
         'finance_companies.html',
         form=form,
@@ -949,13 +833,10 @@ def food_rate():
     """
     form = FoodRateForm(request.form)
     day = datetime.date.today()
-    today_beg = datetime.datetime.combine(day, datetime.time(00, 00, 00))
-    today_end = datetime.datetime.combine(day, datetime.time(23, 59, 59))
     order = Order.query.filter(
         and_(
-            Order.date >= today_beg,
-            Order.date <= today_end,
-            Order.user_name == current_user.username,
+            Order.user_id == current_user.id,
+            Order.order_day == day,
         )
     ).first()
     if not order:
@@ -964,24 +845,11 @@ def food_rate():
     if current_user.rate_timestamp == datetime.date.today():
         flash("You already rated today come back tomorow :-)")
         return redirect('overview')
-    today_from = datetime.datetime.combine(day, datetime.time(23, 59))
-    today_to = datetime.datetime.combine(day, datetime.time(0, 0))
-    foods = Food.query.filter(
-        and_(
-            Food.date_available_from <= today_from,
-            Food.date_available_to >= today_to,
-        )
-    ).all()
-    food_list = []
-    order.description = order.description.strip()
-    for food in foods:
-        food.description = food.description.strip()
-        if food.description == order.description:
-            form.food.choices = [(food.id, food.description)]
-            break
-        else:
-            food_list.append((food.id, food.description))
-            form.food.choices = food_list
+    ordered = [item.food for item in order.items if item.food_id]
+    form.food.choices = [
+        (food.id, food.description)
+        for food in ordered or day_menu(day).all()
+    ]
     if request.method == 'POST' and form.validate():
         food = Food.query.get(form.food.data)
         if food.rating:
@@ -1003,14 +871,7 @@ def orders_summary_for_tv():
     View for TV showing all orders and reveling hard random orders.
     """
     day = datetime.date.today()
-    today_beg = datetime.datetime.combine(day, datetime.time(00, 00))
-    today_end = datetime.datetime.combine(day, datetime.time(23, 59))
-    orders = Order.query.filter(
-        and_(
-            Order.date >= today_beg,
-            Order.date <= today_end,
-        )
-    ).all()
+    orders = Order.query.filter(Order.order_day == day).all()
     return render_template('tv.html', orders=orders)
 
 
@@ -1088,16 +949,7 @@ def add_daily_koziolek():
     Adds meal of a day from koziolek
     """
     food = get_dania_dnia_from_pod_koziolek()
-    for meal in food.values():
-        new_meal = Food()
-        new_meal.cost = 2 if 'zupa' in meal.lower() else 11
-        new_meal.description = "Danie dnia Koziołek: "
-        new_meal.description += meal
-        new_meal.company = "Pod Koziołkiem"
-        new_meal.o_type = "daniednia"
-        new_meal.date_available_from = datetime.date.today()
-        new_meal.date_available_to = datetime.date.today()
-        db.session.add(new_meal)
+    upsert_foods(koziolek_foods(food, datetime.date.today()))
     db.session.commit()
     flash('Meals of a day from Pod Koziolek have been added.')
     return redirect('add_food')
@@ -1110,47 +962,7 @@ def get_week_from_tomas_view():
     Adds weak meals from Tomas ! use only on mondays !
     """
     foods = get_week_from_tomas()
-    for meal in foods['diet']:
-        new_meal = Food()
-        new_meal.cost = 12
-        new_meal.description = meal
-        new_meal.company = "Tomas"
-        new_meal.o_type = "tygodniowe"
-        new_meal.date_available_from = datetime.date.today()
-        new_meal.date_available_to = \
-            datetime.date.today() + \
-            datetime.timedelta(days=4)
-        db.session.add(new_meal)
-    for i in range(1, 6):
-        food = foods['dzien_{}'.format(i)]
-        day_dif = datetime.date.today() + datetime.timedelta(days=i-1)
-        for meal in food['zupy']:
-            new_meal = Food()
-            new_meal.cost = 4
-            new_meal.description = meal
-            new_meal.company = "Tomas"
-            new_meal.o_type = "daniednia"
-            new_meal.date_available_from = day_dif
-            new_meal.date_available_to = day_dif
-            db.session.add(new_meal)
-        for meal in food['dania']:
-            new_meal = Food()
-            new_meal.cost = 10
-            new_meal.description = meal
-            new_meal.company = "Tomas"
-            new_meal.o_type = "daniednia"
-            new_meal.date_available_from = day_dif
-            new_meal.date_available_to = day_dif
-            db.session.add(new_meal)
-        for meal in food['zupa_i_dania']:
-            new_meal = Food()
-            new_meal.cost = 12
-            new_meal.description = meal
-            new_meal.company = "Tomas"
-            new_meal.o_type = "daniednia"
-            new_meal.date_available_from = day_dif
-            new_meal.date_available_to = day_dif
-            db.session.add(new_meal)
+    upsert_foods(tomas_foods(foods, datetime.date.today()))
     db.session.commit()
     flash('Weak of meals from Tomas have been added.')
     return redirect('add_food')
@@ -1167,8 +979,7 @@ def order_pizza_for_everybody():
     new_event.pizza_ordering_is_allowed = True
     new_event.users_already_ordered = ""
     db.session.add(new_event)
-    db.session.commit()
-    new_event = Pizza.query.all()[-1]
+    db.session.flush()
     new_event_id = new_event.id
     event_url = server_url() + url_for(
         "pizza_time_view",
@@ -1183,19 +994,14 @@ def order_pizza_for_everybody():
     text = 'You succesfully orderd pizza for all You can check who wants' \
            ' what here:\n{}\n to finish the pizza orgy click here\n{}\n ' \
            'than order pizza!'.format(event_url, stop_url)
-    msg = Message(
-        'Lunch app PIZZA TIME',
-        recipients=emails,
-    )
-    msg.body = '{} ordered pizza for everyone ! \n order it here:\n\n' \
-               '{}\n\n and thank him!'.format(current_user.username, event_url)
-    mail.send(msg)
-    msg = Message(
+    queue_mail(
         'Lunch app PIZZA TIME',
-        recipients=[current_user.username],
+        emails,
+        '{} ordered pizza for everyone ! \n order it here:\n\n'
+        '{}\n\n and thank him!'.format(current_user.username, event_url),
     )
-    msg.body = text
-    mail.send(msg)
+    queue_mail('Lunch app PIZZA TIME', [current_user.username], text)
+    db.session.commit()
     flash(text)
     return redirect(url_for("pizza_time_view", happening=new_event_id))
 
@@ -3,16 +3,35 @@
 """
 Webrcrawlers functions
 """
-from bs4 import BeautifulSoup
-from urllib import request
+import datetime
+
+from bs4 import BeautifulSoup, SoupStrainer
+
+from .crawler import fetch, register_source
+from .ingest import food_row
 from .main import app
 
+try:
+    import lxml  # noqa
+    HTML_PARSER = 'lxml'
+except ImportError:
+    HTML_PARSER = 'html.parser'
+
+KOZIOLEK_MENU = SoupStrainer(
+    "span",
+    {
+        "style": "color: #ffffff; font-family: 'Segoe Print',"
+                 " sans-serif; font-size: medium; line-height: 1.3em;"
+    },
+)
+TOMAS_MENU = SoupStrainer("td", {"class": "biala"})
+
 
-def read_webpage(webpage):
+def read_webpage(url):
     """
     Returns web page content.
     """
-    return webpage.read()
+    return fetch(url)
 
 
 def get_dania_dnia_from_pod_koziolek():
@@ -20,50 +39,60 @@ def get_dania_dnia_from_pod_koziolek():
     Returns data for new meal of a day.
     """
     url = app.config['URL_POD_KOZIOLKIEM']
-    webpage = request.urlopen(url)
-    magic_soup = BeautifulSoup(read_webpage(webpage))
-    list_of_meals = []
-    menu = magic_soup.find_all(
-        "span",
-        {
-            "style": "color: #ffffff; font-family: 'Segoe Print',"
-                     " sans-serif; font-size: medium; line-height: 1.3em;"
-        },
+    return parse_pod_koziolek(read_webpage(url))
+
+
+def parse_pod_koziolek(content):
+    """
+    Returns meals of a day from Pod Koziolkiem page.
+    """
+    magic_soup = BeautifulSoup(
+        content, HTML_PARSER, parse_only=KOZIOLEK_MENU,
     )
+    menu = magic_soup.find_all(KOZIOLEK_MENU)
+    return koziolek_menu(list(koziolek_tokens(menu)))
+
+
+def koziolek_tokens(menu):
+    """
+    Yields non empty lines of Pod Koziolkiem menu.
+    """
     for meal in menu:
         for food in meal:
             itme = "{}".format(food)
             itme = itme.strip("\xa0")
             if itme != "<br/>" and itme and itme != "\xa0" \
                     and itme != ":):)":
-                list_of_meals.append(itme)
+                yield itme
+
+
+def koziolek_menu(tokens):
+    """
+    Returns meals of a day from Pod Koziolkiem menu lines.
+    First line is a header, then soups and dishes numbered 1. and 2.
+    """
     meal_of_a_day = {}
-    list_of_meals.pop(0)
-    soup_of_a_day = list_of_meals[0]
-    if not list_of_meals[1].startswith("1."):
-        if "zupa" in list_of_meals[1]:
-            soup_of_a_day_2 = list_of_meals[1]
-            if not list_of_meals[2].startswith("1."):
-                soup_of_a_day += list_of_meals[2]
-                list_of_meals.pop(2)
-            meal_of_a_day["zupa_dnia_2"] = soup_of_a_day_2
-            list_of_meals.pop(1)
+    soup_of_a_day = tokens[1]
+    position = 2
+    if not tokens[2].startswith("1."):
+        if "zupa" in tokens[2]:
+            meal_of_a_day["zupa_dnia_2"] = tokens[2]
+            position = 3
+            if not tokens[3].startswith("1."):
+                soup_of_a_day += tokens[3]
+                position = 4
         else:
-            soup_of_a_day += list_of_meals[1]
-            list_of_meals.pop(1)
-    list_of_meals.pop(0)
+            soup_of_a_day += tokens[2]
+            position = 3
     meal_of_a_day["zupa_dnia"] = soup_of_a_day
-    meal_of_a_day_1 = ""
-    while not list_of_meals[0].startswith("2.") and list_of_meals[0]:
-        meal_of_a_day_1 += list_of_meals[0]
-        meal_of_a_day_1 += " "
-        list_of_meals.pop(0)
-    meal_of_a_day_1 = meal_of_a_day_1.strip(" ")
-    meal_of_a_day["danie_dania_1"] = meal_of_a_day_1
-    if list_of_meals[0]:
-        meal_of_a_day_2 = ' '.join(line for line in list_of_meals)
-        meal_of_a_day_2 = meal_of_a_day_2.strip(" ")
-        meal_of_a_day["danie_dania_2"] = meal_of_a_day_2
+    meal_of_a_day_1 = []
+    while position < len(tokens) and not tokens[position].startswith("2."):
+        meal_of_a_day_1.append(tokens[position])
+        position += 1
+    meal_of_a_day["danie_dania_1"] = ' '.join(meal_of_a_day_1).strip(" ")
+    if position < len(tokens):
+        meal_of_a_day_2 = ' '.join(tokens[position:])
+        meal_of_a_day["danie_dania_2"] = meal_of_a_day_2.strip(" ")
     return meal_of_a_day
 
 
@@ -72,18 +101,22 @@ def get_week_from_tomas():
     Returns weak of meals from Tomas ! use only on mondays !.
     """
     url = app.config['URL_TOMAS']
-    webpage = request.urlopen(url)
-    magic_soup = BeautifulSoup(read_webpage(webpage), 'html.parser')
-    menu = magic_soup.find_all("td", {"class": "biala"})
-    alist = []
-    tomas_menu = {
-        'diet': [],
-        'dzien_1': {},
-        'dzien_2': {},
-        'dzien_3': {},
-        'dzien_4': {},
-        'dzien_5': {},
-    }
+    return parse_week_tomas(read_webpage(url))
+
+
+def parse_week_tomas(content):
+    """
+    Returns weak of meals from Tomas page.
+    """
+    magic_soup = BeautifulSoup(content, HTML_PARSER, parse_only=TOMAS_MENU)
+    menu = magic_soup.find_all(TOMAS_MENU)
+    return tomas_menu(list(tomas_tokens(menu)))
+
+
+def tomas_tokens(menu):
+    """
+    Yields non empty lines of Tomas menu without markup.
+    """
     for meal in menu:
         for food in meal:
             item = "{}".format(food)
@@ -96,38 +129,99 @@ def get_week_from_tomas():
             item = item.strip()
             if item != "<br/>" and item and item != "\xa0" \
                     and item != ":):)":
-                alist.append(item)
-    while "kcal" in str(alist) and alist[0]:
-        meal = alist[0]
-        alist.pop(0)
-        while "kcal" not in alist[0] and alist[0] != 'ZUPA DNIA:' and alist[0]:
-            meal += " "
-            meal += alist[0]
-            alist.pop(0)
-        tomas_menu['diet'].append(meal)
+                yield item
+
+
+def tomas_menu(tokens):
+    """
+    Returns weak of meals from Tomas menu lines in one pass.
+    Diet meals come first, each with its kcal, followed by soups
+    and dishes of five days.
+    """
+    menu = {
+        'diet': [],
+        'dzien_1': {},
+        'dzien_2': {},
+        'dzien_3': {},
+        'dzien_4': {},
+        'dzien_5': {},
+    }
+    last_diet = -1
+    for position, token in enumerate(tokens):
+        if "kcal" in token:
+            last_diet = position
+    position = 0
+    while position <= last_diet:
+        meal = [tokens[position]]
+        position += 1
+        while "kcal" not in tokens[position] \
+                and tokens[position] != 'ZUPA DNIA:':
+            meal.append(tokens[position])
+            position += 1
+        menu['diet'].append(' '.join(meal))
     for i in range(1, 6):
         day_manu = {
             'zupy': [],
             'dania': [],
             'zupa_i_dania': [],
         }
-        if alist[0] == 'ZUPA DNIA:':
-            alist.pop(0)
-        soups = alist[0].split(',')
-        for soup in soups:
+        if tokens[position] == 'ZUPA DNIA:':
+            position += 1
+        for soup in tokens[position].split(','):
             soup = soup.strip()
             soup = soup.strip('.')
             day_manu['zupy'].append(soup)
-        alist.pop(0)
-        if alist[0] == 'DANIE DNIA:':
-            alist.pop(0)
-        while alist and alist[0] != 'ZUPA DNIA:':
-            day_manu['dania'].append(alist[0])
-            alist.pop(0)
+        position += 1
+        if tokens[position] == 'DANIE DNIA:':
+            position += 1
+        while position < len(tokens) and tokens[position] != 'ZUPA DNIA:':
+            day_manu['dania'].append(tokens[position])
+            position += 1
         for soup in day_manu['zupy']:
             for meal in day_manu['dania']:
                 sopu_and_meal = soup + " + " + meal
                 day_manu['zupa_i_dania'].append(sopu_and_meal)
-        tomas_menu['dzien_{}'.format(i)] = day_manu
+        menu['dzien_{}'.format(i)] = day_manu
+
+    return menu
+
+
+def koziolek_foods(food, today):
+    """
+    Returns foods for meals of a day from Pod Koziolkiem.
+    """
+    for meal in food.values():
+        yield food_row(
+            "Danie dnia Koziołek: " + meal,
+            2 if 'zupa' in meal.lower() else 11,
+            "daniednia",
+            today,
+            today,
+            "Pod Koziołkiem",
+        )
+
+
+def tomas_foods(foods, today):
+    """
+    Returns foods for weak of meals from Tomas.
+    """
+    for meal in foods['diet']:
+        yield food_row(
+            meal, 12, "tygodniowe",
+            today, today + datetime.timedelta(days=4), "Tomas",
+        )
+    for i in range(1, 6):
+        food = foods['dzien_{}'.format(i)]
+        day_dif = today + datetime.timedelta(days=i-1)
+        for meal in food['zupy']:
+            yield food_row(meal, 4, "daniednia", day_dif, day_dif, "Tomas")
+        for meal in food['dania']:
+            yield food_row(meal, 10, "daniednia", day_dif, day_dif, "Tomas")
+        for meal in food['zupa_i_dania']:
+            yield food_row(meal, 12, "daniednia", day_dif, day_dif, "Tomas")
+
 
-    return tomas_menu
+register_source(
+    'koziolek', 'URL_POD_KOZIOLKIEM', parse_pod_koziolek, koziolek_foods,
+)
+register_source('tomas', 'URL_TOMAS', parse_week_tomas, tomas_foods)